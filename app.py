@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, make_response, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory, make_response, send_file, g, has_request_context
 import psycopg
 from psycopg.rows import dict_row
 from psycopg.errors import InvalidCatalogName
@@ -6,7 +6,7 @@ import os
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
 import secrets
 import re
 from functools import wraps
@@ -18,6 +18,12 @@ import smtplib
 from email.message import EmailMessage
 import mimetypes
 import json
+import base64
+import hashlib
+import threading
+import atexit
+import queue
+from collections import OrderedDict, deque
 
 load_dotenv()
 
@@ -47,8 +53,12 @@ DB_CONFIG = {
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'), exist_ok=True)
 
-# Rate limiting simples em memória: chave por IP+rota
-RATE_LIMIT = {}
+# Rate limiting por chave (IP+rota ou usuário+rota). Backends:
+# - 'memory': janela deslizante por processo, com expurgo de chaves expiradas e teto de chaves
+# - 'postgres': contador atômico em tabela UNLOGGED, compartilhado por todos os workers
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+RATE_LIMIT_SWEEP_SECONDS = 60
 
 # Índice local de avatares (fallback quando banco estiver indisponível)
 def _avatar_index_path():
@@ -86,26 +96,541 @@ def _read_avatar_index(uid: int) -> str:
         pass
     return ''
 
+class MemoryRateLimiter:
+    """Janela deslizante em memória: guarda no máximo `limit` timestamps por chave."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self._buckets = OrderedDict()  # chave -> (window, deque de timestamps), ordem LRU
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+        self._next_sweep = 0.0
+
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            entry = self._buckets.get(key)
+            if entry is None:
+                entry = (window, deque())
+                self._buckets[key] = entry
+            else:
+                self._buckets.move_to_end(key)
+            hits = entry[1]
+            cutoff = now - window
+            while hits and hits[0] <= cutoff:
+                hits.popleft()
+            allowed = len(hits) < limit
+            if allowed:
+                hits.append(now)
+            # Teto de memória: descarta as chaves usadas há mais tempo
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def _sweep(self, now: float):
+        expired = [k for k, (window, hits) in self._buckets.items() if not hits or hits[-1] <= now - window]
+        for k in expired:
+            del self._buckets[k]
+        self._next_sweep = now + RATE_LIMIT_SWEEP_SECONDS
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class PostgresRateLimiter:
+    """Janela fixa com contador atômico na tabela UNLOGGED rate_limit (migração 0006).
+
+    Como todos os workers compartilham a mesma linha por chave, o limite é exato
+    independentemente do número de processos. Se o banco falhar, recorre ao limitador em memória.
+    """
+
+    def __init__(self, fallback: MemoryRateLimiter):
+        self._fallback = fallback
+        self._next_sweep = 0.0
+
+    def hit(self, key: str, limit: int, window: int) -> bool:
+        conn = _borrow_db_connection()
+        if not conn:
+            return self._fallback.hit(key, limit, window)
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO rate_limit AS rl (chave, contador, expira_em)
+                VALUES (%s, 1, now() + make_interval(secs => %s))
+                ON CONFLICT (chave) DO UPDATE SET
+                  contador = CASE WHEN rl.expira_em <= now() THEN 1 ELSE rl.contador + 1 END,
+                  expira_em = CASE WHEN rl.expira_em <= now() THEN EXCLUDED.expira_em ELSE rl.expira_em END
+                RETURNING contador
+            """, (key[:255], window))
+            count = cur.fetchone()[0]
+            now = time.time()
+            if now >= self._next_sweep:
+                self._next_sweep = now + RATE_LIMIT_SWEEP_SECONDS
+                cur.execute("DELETE FROM rate_limit WHERE expira_em <= now()")
+            conn.commit()
+            cur.close()
+            return count <= limit
+        except Exception as e:
+            print(f"[RATE_LIMIT] Falha no backend PostgreSQL, usando memória: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            return self._fallback.hit(key, limit, window)
+        finally:
+            conn.close()
+
+
+def _make_rate_limiter():
+    memory = MemoryRateLimiter()
+    if RATE_LIMIT_BACKEND == 'postgres':
+        return PostgresRateLimiter(memory)
+    return memory
+
+RATE_LIMITER = _make_rate_limiter()
+
 def check_rate_limit(key: str, limit: int = 20, window: int = 60) -> bool:
-    now = time.time()
-    bucket = RATE_LIMIT.get(key, {'count': 0, 'reset': now + window})
-    if now > bucket['reset']:
-        bucket = {'count': 0, 'reset': now + window}
-    bucket['count'] += 1
-    RATE_LIMIT[key] = bucket
-    return bucket['count'] <= limit
+    return RATE_LIMITER.hit(key, limit, window)
+
+class TTLCache:
+    """Cache em memória por processo: LRU com no máximo `max_items` entradas que expiram após `ttl` segundos."""
+
+    _MISSING = object()
+
+    def __init__(self, max_items: int = 1024, ttl: float = 60.0):
+        self._data = OrderedDict()  # chave -> (expira_em, valor), ordem LRU
+        self._lock = threading.Lock()
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is self._MISSING or entry[0] <= now:
+                if entry is not self._MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# Auditoria assíncrona: eventos vão para uma fila em memória e uma thread grava em lotes,
+# com rotação por tamanho e por data e compressão (gzip) dos segmentos antigos.
+AUDIT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+AUDIT_LOG_MAX_BYTES = int(os.getenv('AUDIT_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+AUDIT_LOG_BACKUPS = int(os.getenv('AUDIT_LOG_BACKUPS', '30'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1.0'))
+AUDIT_QUEUE_MAX = int(os.getenv('AUDIT_QUEUE_MAX', '10000'))
+AUDIT_BATCH_MAX = 500
+# Lotes que falharam no banco ficam em memória (até AUDIT_QUEUE_MAX eventos) e são reenviados
+# com espera exponencial limitada a AUDIT_DB_RETRY_MAX segundos
+AUDIT_DB_RETRY_MAX = float(os.getenv('AUDIT_DB_RETRY_MAX', '60'))
+# Destinos dos eventos: 'file' (logs/audit.log) e/ou 'db' (tabela particionada audit_event, via COPY)
+AUDIT_SINKS = {x.strip() for x in os.getenv('AUDIT_SINKS', 'file,db').lower().split(',') if x.strip()}
+
+# Rollup de downloads (download_pendente -> download_hora/dia/total), executado pela thread de auditoria
+DOWNLOAD_ROLLUP_INTERVAL = float(os.getenv('DOWNLOAD_ROLLUP_INTERVAL', '60'))
+DOWNLOAD_ROLLUP_BATCH = int(os.getenv('DOWNLOAD_ROLLUP_BATCH', '5000'))
+DOWNLOAD_HORA_RETENCAO_DIAS = 7
+DOWNLOAD_ROLLUP_LOCK_ID = 5_251_002
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+
+class AuditWriter:
+    """Grava eventos de auditoria em lote a partir de uma thread dedicada (uma por processo).
+
+    Cada evento é uma tupla (timestamp, ip, id_usuario, evento, detalhes_json); o lote vai
+    para o arquivo e/ou para a tabela audit_event conforme AUDIT_SINKS.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, sinks=frozenset({'file'})):
+        self.path = path
+        self.sinks = set(sinks)
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._partitions = set()
+        self._db_error_at = 0.0
+        self._db_pendentes = deque()  # eventos ainda não gravados em audit_event
+        self._db_retry_at = 0.0
+        self._db_backoff = 0.0
+        self.dropped_db = 0
+        self._rollup_at = time.time()
+        self.dropped = 0
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            # Após fork (gunicorn) a thread do pai não existe no filho: recria fila e thread
+            self._queue = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, item: tuple):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Nunca bloqueia a requisição: descarta e contabiliza
+            self.dropped += 1
+
+    def _run(self):
+        q = self._queue
+        while True:
+            try:
+                item = q.get(timeout=AUDIT_FLUSH_INTERVAL)
+            except queue.Empty:
+                self._retry_db()
+                self._maybe_rollup()
+                continue
+            batch = []
+            stop = item is self._STOP
+            if not stop:
+                batch.append(item)
+            while len(batch) < AUDIT_BATCH_MAX:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._flush(batch)
+            if stop:
+                self._retry_db(force=True)
+                return
+            self._maybe_rollup()
+
+    def _maybe_rollup(self):
+        if 'db' not in self.sinks or DOWNLOAD_ROLLUP_INTERVAL <= 0:
+            return
+        now = time.time()
+        if now - self._rollup_at < DOWNLOAD_ROLLUP_INTERVAL:
+            return
+        self._rollup_at = now
+        try:
+            rollup_downloads()
+        except Exception as e:
+            print(f"[AUDIT] Falha no rollup de downloads: {e}")
+
+    def _flush(self, batch):
+        if 'file' in self.sinks:
+            try:
+                self._write_batch([self._format_line(ev) for ev in batch])
+            except Exception as e:
+                print(f"[AUDIT] Falha ao gravar {len(batch)} eventos no arquivo: {e}")
+        if 'db' in self.sinks:
+            self._db_pendentes.extend(batch)
+            excesso = len(self._db_pendentes) - AUDIT_QUEUE_MAX
+            for _ in range(max(0, excesso)):
+                self._db_pendentes.popleft()  # banco fora há muito tempo: descarta os mais antigos
+            self.dropped_db += max(0, excesso)
+            self._retry_db()
+
+    def _db_warn(self, msg: str):
+        # Evita inundar o log quando o banco está fora: no máximo um aviso por minuto
+        now = time.time()
+        if now - self._db_error_at > 60:
+            self._db_error_at = now
+            print(f"[AUDIT] {msg}")
+
+    def _retry_db(self, force: bool = False):
+        """Grava os eventos pendentes em lotes; numa falha transitória, mantém-nos e agenda nova tentativa."""
+        if not self._db_pendentes or (not force and time.time() < self._db_retry_at):
+            return
+        while self._db_pendentes:
+            n = min(len(self._db_pendentes), AUDIT_BATCH_MAX)
+            lote = [self._db_pendentes[i] for i in range(n)]
+            try:
+                self._copy_to_db(lote)
+            except (psycopg.DataError, psycopg.IntegrityError) as e:
+                # Erro nos próprios dados: reenviar não adianta
+                self.dropped_db += n
+                self._db_warn(f"Descartados {n} eventos rejeitados pelo banco: {e}")
+            except Exception as e:
+                self._db_backoff = min(AUDIT_DB_RETRY_MAX, max(1.0, self._db_backoff * 2))
+                self._db_retry_at = time.time() + self._db_backoff
+                self._db_warn(f"Falha ao gravar {len(self._db_pendentes)} eventos no banco "
+                              f"(nova tentativa em {self._db_backoff:.0f}s): {e}")
+                return
+            for _ in range(n):
+                self._db_pendentes.popleft()
+        self._db_backoff = 0.0
+        self._db_retry_at = 0.0
+
+    @staticmethod
+    def _format_line(ev) -> str:
+        ts, ip, user, event, details = ev
+        return f"{datetime.fromtimestamp(ts).isoformat()}\t{ip}\tuser={user}\t{event}\t{details}\n"
+
+    def _copy_to_db(self, batch):
+        conn = _borrow_db_connection()
+        if not conn:
+            raise RuntimeError('sem conexão com o banco')
+        try:
+            rows = []
+            downloads = []
+            for ts, ip, user, event, details in batch:
+                created = datetime.fromtimestamp(ts, timezone.utc)
+                try:
+                    user = int(user) if user is not None else None
+                except (TypeError, ValueError):
+                    user = None
+                rows.append((created, event[:100], user, ip, details))
+                if event == 'download_publicacao':
+                    try:
+                        downloads.append((int(json.loads(details)['id_publicacao']), created))
+                    except Exception:
+                        pass
+            cur = conn.cursor()
+            novas = []
+            for month in sorted({r[0].replace(day=1, hour=0, minute=0, second=0, microsecond=0) for r in rows}):
+                key = self._ensure_partition(cur, month)
+                if key:
+                    novas.append(key)
+            with cur.copy("COPY audit_event (criado_em, evento, id_usuario, ip, detalhes) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            if downloads:
+                # Fila do rollup: gravada na mesma transação do evento, nunca conta em dobro
+                with cur.copy("COPY download_pendente (id_publicacao, baixado_em) FROM STDIN") as copy:
+                    for row in downloads:
+                        copy.write_row(row)
+            conn.commit()
+            # Só depois do commit: um rollback também desfaz o CREATE TABLE da partição
+            self._partitions.update(novas)
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _ensure_partition(self, cur, month):
+        """Cria a partição do mês, se preciso; retorna a chave a memorizar após o commit (None se já conhecida)."""
+        key = month.strftime('%Y_%m')
+        if key in self._partitions:
+            return None
+        nxt = (month + timedelta(days=32)).replace(day=1)
+        try:
+            # Savepoint: outro worker criando a mesma partição ao mesmo tempo não derruba o lote
+            with cur.connection.transaction():
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS audit_event_{key} PARTITION OF audit_event "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{nxt.isoformat()}')"
+                )
+        except (psycopg.errors.DuplicateTable, psycopg.errors.UniqueViolation):
+            pass  # criada pelo outro worker
+        return key
+
+    def _write_batch(self, lines):
+        data = ''.join(lines).encode('utf-8')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            rotated = self._rotate_if_needed(len(data))
+            with open(self.path, 'ab') as f:
+                f.write(data)
+        if rotated:
+            self._compress_and_prune(rotated)
+
+    def _rotate_if_needed(self, incoming: int):
+        """Renomeia o arquivo atual se exceder o tamanho ou for de outro dia. Retorna o novo nome."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        file_day = datetime.fromtimestamp(st.st_mtime).date()
+        if st.st_size + incoming <= AUDIT_LOG_MAX_BYTES and file_day == datetime.now().date():
+            return None
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.fromtimestamp(st.st_mtime).strftime('%Y%m%d-%H%M%S')
+        target = f"{base}-{stamp}{ext}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            target = f"{base}-{stamp}-{n}{ext}"
+            n += 1
+        os.replace(self.path, target)
+        return target
+
+    def _compress_and_prune(self, rotated: str):
+        import gzip, shutil, glob
+        try:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        except Exception as e:
+            print(f"[AUDIT] Falha ao comprimir {rotated}: {e}")
+        base, ext = os.path.splitext(self.path)
+        # Ordem de rotação (mais antigos primeiro)
+        segments = sorted(glob.glob(f"{base}-*{ext}.gz"), key=os.path.getmtime)
+        for old in segments[:-AUDIT_LOG_BACKUPS] if AUDIT_LOG_BACKUPS > 0 else []:
+            try:
+                os.remove(old)
+            except Exception:
+                pass
+
+    def close(self, timeout: float = 5.0):
+        """Esvazia a fila e encerra a thread (chamado no desligamento do processo)."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+AUDIT_WRITER = AuditWriter(os.path.join(AUDIT_LOG_DIR, 'audit.log'), AUDIT_SINKS)
+atexit.register(AUDIT_WRITER.close)
 
 def audit_log(event: str, details: dict):
     try:
-        log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'audit.log')
-        with open(log_path, 'a', encoding='utf-8') as f:
-            ts = datetime.now().isoformat()
+        user = ip = None
+        if has_request_context():
             user = session.get('user_id')
             ip = request.remote_addr
-            f.write(f"{ts}\t{ip}\tuser={user}\t{event}\t{details}\n")
+        payload = json.dumps(details or {}, ensure_ascii=False, default=str)
+        AUDIT_WRITER.submit((time.time(), ip, user, event, payload))
     except Exception:
         pass
 
+def detach_audit_partitions(keep_months: int = 12) -> list:
+    """Desanexa partições de audit_event mais antigas que `keep_months` meses.
+
+    As tabelas desanexadas continuam no banco (para pg_dump/arquivamento) e podem ser
+    removidas depois com DROP TABLE. Retorna os nomes desanexados.
+    """
+    conn = _borrow_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    today = datetime.now(timezone.utc).date().replace(day=1)
+    y, m = divmod(today.year * 12 + today.month - 1 - keep_months, 12)
+    cutoff = f"audit_event_{y:04d}_{m + 1:02d}"
+    detached = []
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'audit_event'
+            ORDER BY c.relname
+        """)
+        for (name,) in cur.fetchall():
+            # Nomes audit_event_AAAA_MM ordenam cronologicamente
+            if re.fullmatch(r'audit_event_\d{4}_\d{2}', name) and name < cutoff:
+                cur.execute(f'ALTER TABLE audit_event DETACH PARTITION "{name}"')
+                detached.append(name)
+        conn.commit()
+        cur.close()
+        return detached
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def rollup_downloads(max_batches: int = 20) -> int:
+    """Agrega a fila download_pendente em download_hora, download_dia e download_total.
+
+    Cada lote é removido da fila e somado aos contadores num único comando (CTEs com
+    DELETE ... RETURNING), então o custo é proporcional às publicações baixadas no lote e
+    não ao número de downloads. Apenas um processo agrega por vez (advisory lock).
+    Retorna a quantidade de downloads processados.
+    """
+    conn = _borrow_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    processed = 0
+    try:
+        cur = conn.cursor()
+        for _ in range(max_batches):
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (DOWNLOAD_ROLLUP_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                break
+            cur.execute("""
+                WITH movidos AS (
+                    DELETE FROM download_pendente
+                    WHERE id IN (SELECT id FROM download_pendente ORDER BY id LIMIT %s)
+                    RETURNING id_publicacao, baixado_em
+                ), hora AS (
+                    INSERT INTO download_hora (hora, id_publicacao, total)
+                    SELECT date_trunc('hour', baixado_em), id_publicacao, COUNT(*)
+                    FROM movidos GROUP BY 1, 2
+                    ON CONFLICT (hora, id_publicacao) DO UPDATE SET total = download_hora.total + EXCLUDED.total
+                ), dia AS (
+                    INSERT INTO download_dia (dia, id_publicacao, total)
+                    SELECT baixado_em::date, id_publicacao, COUNT(*)
+                    FROM movidos GROUP BY 1, 2
+                    ON CONFLICT (dia, id_publicacao) DO UPDATE SET total = download_dia.total + EXCLUDED.total
+                ), geral AS (
+                    INSERT INTO download_total (id_publicacao, total, ultimo_download)
+                    SELECT id_publicacao, COUNT(*), MAX(baixado_em)
+                    FROM movidos GROUP BY 1
+                    ON CONFLICT (id_publicacao) DO UPDATE SET
+                        total = download_total.total + EXCLUDED.total,
+                        ultimo_download = GREATEST(download_total.ultimo_download, EXCLUDED.ultimo_download)
+                )
+                SELECT COUNT(*) FROM movidos
+            """, (DOWNLOAD_ROLLUP_BATCH,))
+            n = cur.fetchone()[0]
+            if n == 0:
+                # Fila vazia: aproveita para descartar horas antigas (períodos longos usam download_dia)
+                cur.execute(
+                    "DELETE FROM download_hora WHERE hora < now() - make_interval(days => %s)",
+                    (DOWNLOAD_HORA_RETENCAO_DIAS,)
+                )
+            conn.commit()
+            processed += n
+            if n < DOWNLOAD_ROLLUP_BATCH:
+                break
+        cur.close()
+        return processed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def send_reset_email(to_email: str, reset_url: str, token: str | None = None) -> bool:
     host = os.getenv('SMTP_HOST')
     port = int(os.getenv('SMTP_PORT', '587'))
@@ -250,7 +775,244 @@ def validar_cpf(cpf: str) -> bool:
     d2 = 0 if resto >= 10 else resto
     return cpf[-2:] == f"{d1}{d2}"
 
-# Rotas para servir assets conforme os caminhos usados nos HTML (sem alterar HTML/CSS)
+# Pipeline de assets: `python app.py --build-assets` minifica CSS/JS de static/css e static/javascript,
+# grava cópias com hash do conteúdo no nome (static/dist), variantes .gz/.br e o manifest.json
+# (nome lógico → arquivo com hash). Os templates usam `asset_url('home.css')`; com manifest as URLs
+# /assets/... são imutáveis (cache de 1 ano) e o conteúdo pré-comprimido é escolhido pelo Accept-Encoding.
+# ASSETS_DEV=1 (ou sem manifest) mantém o modo de desenvolvimento: arquivos-fonte sem cache.
+ASSETS_DIST_FOLDER = os.path.join(app.static_folder, 'dist')
+ASSETS_MANIFEST = os.path.join(ASSETS_DIST_FOLDER, 'manifest.json')
+ASSETS_FONTES = {'.css': 'css', '.js': 'javascript'}
+ASSETS_DEV = os.getenv('ASSETS_DEV', '0').lower() in {'1', 'true', 'yes'}
+ASSETS_MAX_AGE = 365 * 24 * 3600
+_assets_manifest = None
+
+_CSS_SEPARADORES = set('{};,>')
+
+def _minify_css(src: str) -> str:
+    """Remove comentários e espaços supérfluos (fora de strings). Não mexe em espaços antes de ':'
+    (`a :hover` ≠ `a:hover`) nem em parênteses (`and (max-width...)`)."""
+    out, i, n = [], 0, len(src)
+    while i < n:
+        ch = src[i]
+        if ch in '"\'':
+            j = i + 1
+            while j < n and src[j] != ch:
+                j += 2 if src[j] == '\\' else 1
+            out.append(src[i:j + 1])
+            i = j + 1
+        elif src.startswith('/*', i):
+            fim = src.find('*/', i + 2)
+            i = n if fim < 0 else fim + 2
+        elif ch.isspace():
+            while i < n and src[i].isspace():
+                i += 1
+            # Espaço junto de { } ; , > é dispensável (o vizinho anterior já está em `out`)
+            if out and out[-1] in _CSS_SEPARADORES or i < n and src[i] in _CSS_SEPARADORES:
+                continue
+            if out and out[-1] != ' ':
+                out.append(' ')
+        else:
+            if ch in _CSS_SEPARADORES and out and out[-1] == ' ':
+                out.pop()
+            if ch == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(ch)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+# Antes de '/', estes caracteres (ou estas palavras) indicam início de expressão: é regex, não divisão
+_JS_ANTES_DE_REGEX = set('(,=:[!&|?{};+-*%<>~^')
+_JS_PALAVRAS_REGEX = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else', 'yield', 'await'}
+
+def _minify_js(src: str) -> str:
+    """Minificação conservadora: remove comentários, indentação e linhas vazias e reduz espaços,
+    preservando quebras de linha (ASI), strings, template literals e regex literais."""
+    out, i, n = [], 0, len(src)
+    chaves = []  # profundidade de chaves em cada ${...} aberto dentro de template literal
+
+    def ultimo_significativo():
+        k = len(out) - 1
+        while k >= 0 and out[k] in (' ', '\n'):
+            k -= 1
+        return out[k] if k >= 0 else ''
+
+    def ultima_palavra():
+        texto = ''.join(out[-20:]).rstrip()
+        m = re.search(r'([A-Za-z_$][\w$]*)$', texto)
+        return m.group(1) if m else ''
+
+    def ler_template(j):
+        # Copia o template literal a partir de j (após a crase) até a crase final ou um '${'
+        while j < n:
+            if src[j] == '\\':
+                j += 2
+            elif src[j] == '`':
+                return j + 1, False
+            elif src.startswith('${', j):
+                return j + 2, True
+            else:
+                j += 1
+        return n, False
+
+    while i < n:
+        ch = src[i]
+        if ch == '`' or (ch == '}' and chaves and chaves[-1] == 0):
+            if ch == '}':
+                chaves.pop()
+            fim, abriu = ler_template(i + 1)
+            out.append(src[i:fim])
+            if abriu:
+                chaves.append(0)
+            i = fim
+        elif ch in '"\'':
+            j = i + 1
+            while j < n and src[j] != ch and src[j] != '\n':
+                j += 2 if src[j] == '\\' else 1
+            out.append(src[i:j + 1])
+            i = j + 1
+        elif src.startswith('//', i):
+            fim = src.find('\n', i)
+            i = n if fim < 0 else fim
+        elif src.startswith('/*', i):
+            fim = src.find('*/', i + 2)
+            i = n if fim < 0 else fim + 2
+            out.append(' ')
+        elif ch == '/' and (ultimo_significativo() in _JS_ANTES_DE_REGEX or ultimo_significativo() == ''
+                            or ultima_palavra() in _JS_PALAVRAS_REGEX):
+            j, classe = i + 1, False
+            while j < n and src[j] != '\n':
+                if src[j] == '\\':
+                    j += 2
+                    continue
+                if src[j] == '[':
+                    classe = True
+                elif src[j] == ']':
+                    classe = False
+                elif src[j] == '/' and not classe:
+                    break
+                j += 1
+            j += 1
+            while j < n and (src[j].isalnum() or src[j] == '_'):
+                j += 1  # flags
+            out.append(src[i:j])
+            i = j
+        elif ch.isspace():
+            quebra = False
+            while i < n and src[i].isspace():
+                quebra = quebra or src[i] == '\n'
+                i += 1
+            while out and out[-1] == ' ':
+                out.pop()
+            if not out or out[-1] == '\n':
+                continue
+            out.append('\n' if quebra else ' ')
+        else:
+            if chaves:
+                if ch == '{':
+                    chaves[-1] += 1
+                elif ch == '}':
+                    chaves[-1] -= 1
+            out.append(ch)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+def build_assets() -> dict:
+    """Gera static/dist (minificado, com hash, .gz e .br) e o manifest; remove builds anteriores."""
+    import gzip
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print('[ASSETS] Módulo brotli ausente: gerando apenas .gz.')
+    manifest, gerados = {}, {os.path.basename(ASSETS_MANIFEST)}
+    for ext, pasta in ASSETS_FONTES.items():
+        origem_dir = os.path.join(app.static_folder, pasta)
+        destino_dir = os.path.join(ASSETS_DIST_FOLDER, pasta)
+        os.makedirs(destino_dir, exist_ok=True)
+        for nome in sorted(os.listdir(origem_dir)):
+            if not nome.endswith(ext):
+                continue
+            with open(os.path.join(origem_dir, nome), encoding='utf-8') as f:
+                fonte = f.read()
+            dados = (_minify_css(fonte) if ext == '.css' else _minify_js(fonte)).encode('utf-8')
+            base = nome[:-len(ext)]
+            final = f'{base}.{hashlib.sha256(dados).hexdigest()[:10]}{ext}'
+            variantes = {'': dados, '.gz': gzip.compress(dados, 9, mtime=0)}
+            if brotli is not None:
+                variantes['.br'] = brotli.compress(dados, quality=11)
+            for sufixo, conteudo in variantes.items():
+                if sufixo and len(conteudo) >= len(dados):
+                    continue
+                caminho = os.path.join(destino_dir, final + sufixo)
+                tmp = f'{caminho}.tmp{os.getpid()}'
+                with open(tmp, 'wb') as f:
+                    f.write(conteudo)
+                os.replace(tmp, caminho)
+                gerados.add(f'{pasta}/{final}{sufixo}')
+            manifest[f'{pasta}/{nome}'] = f'{pasta}/{final}'
+            print(f'[ASSETS] {pasta}/{nome}: {len(fonte.encode("utf-8"))} → {len(dados)} bytes '
+                  f'(gz {len(variantes[".gz"])}' + (f', br {len(variantes[".br"])}' if '.br' in variantes else '') + ')')
+    tmp = f'{ASSETS_MANIFEST}.tmp{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, ASSETS_MANIFEST)
+    # Hashes antigos saem só depois do novo manifest
+    for raiz, _, arquivos in os.walk(ASSETS_DIST_FOLDER):
+        for nome in arquivos:
+            rel = os.path.relpath(os.path.join(raiz, nome), ASSETS_DIST_FOLDER).replace(os.sep, '/')
+            if rel not in gerados:
+                os.remove(os.path.join(raiz, nome))
+    return manifest
+
+def assets_manifest():
+    """Manifest carregado uma vez por processo; None no modo de desenvolvimento."""
+    global _assets_manifest, ASSETS_DEV
+    if ASSETS_DEV:
+        return None
+    if _assets_manifest is None:
+        try:
+            with open(ASSETS_MANIFEST, encoding='utf-8') as f:
+                _assets_manifest = json.load(f)
+        except (OSError, ValueError):
+            print('[ASSETS] static/dist/manifest.json ausente: servindo os arquivos-fonte sem cache '
+                  '(rode python app.py --build-assets).')
+            ASSETS_DEV = True
+            return None
+    return _assets_manifest
+
+@app.template_global()
+def asset_url(nome: str) -> str:
+    """URL de um asset pelo nome lógico ('home.css', 'javascript/home.js')."""
+    if '/' not in nome:
+        pasta = ASSETS_FONTES.get(os.path.splitext(nome)[1])
+        nome = f'{pasta}/{nome}' if pasta else nome
+    manifest = assets_manifest()
+    if manifest and nome in manifest:
+        return url_for('serve_asset', filename=manifest[nome])
+    pasta, _, arquivo = nome.partition('/')
+    if pasta in ASSETS_FONTES.values() and '/' not in arquivo:
+        return '/' + arquivo  # serve_css/serve_js: sem cache
+    return url_for('static', filename=nome)
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Arquivo com hash no nome: imutável; usa a variante .br/.gz aceita pelo cliente, se existir."""
+    ctype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    aceitas = request.accept_encodings
+    resp = None
+    for encoding, sufixo in (('br', '.br'), ('gzip', '.gz')):
+        if aceitas[encoding] > 0 and os.path.isfile(os.path.join(ASSETS_DIST_FOLDER, filename + sufixo)):
+            resp = send_from_directory(ASSETS_DIST_FOLDER, filename + sufixo, mimetype=ctype)
+            resp.headers['Content-Encoding'] = encoding
+            break
+    if resp is None:
+        resp = send_from_directory(ASSETS_DIST_FOLDER, filename, mimetype=ctype)
+    resp.vary.add('Accept-Encoding')
+    resp.headers['Cache-Control'] = f'public, max-age={ASSETS_MAX_AGE}, immutable'
+    return resp
+
+# Rotas dos arquivos-fonte (modo de desenvolvimento e caminhos antigos dos HTML)
 @app.route('/<asset_name>.css')
 def serve_css(asset_name):
     resp = make_response(send_from_directory(os.path.join(app.static_folder, 'css'), f'{asset_name}.css'))
@@ -279,153 +1041,318 @@ def serve_img(filename):
 # Usa psycopg (v3) e cria o banco automaticamente se ele não existir
 SCHEMA_READY = False
 
-def get_db_connection():
-    global SCHEMA_READY
+# Pool de conexões por processo (cada worker do gunicorn mantém o seu).
+# Tamanhos em conexões; tempos em segundos.
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '5'))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', '300'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', '1').lower() in {'1', 'true', 'yes'}
+
+_DB_POOL = None
+_DB_POOL_PID = None
+_DB_POOL_LOCK = threading.Lock()
+
+def _db_conninfo():
+    """Retorna (conninfo, kwargs) para psycopg a partir de DATABASE_URL ou DB_CONFIG."""
+    db_url = os.getenv('DATABASE_URL')
+    if db_url:
+        # Corrige prefixo antigo
+        if db_url.startswith("postgres://"):
+            db_url = db_url.replace("postgres://", "postgresql://", 1)
+        return db_url, {}
+    # Monta a conexão via dict (DB_CONFIG)
+    cfg = {k: (str(v).strip() if isinstance(v, str) else v) for k, v in DB_CONFIG.items()}
+    return '', cfg
+
+def _connect_direct():
+    """Abre uma conexão avulsa (sem pool), criando o banco se ele não existir."""
+    conninfo, cfg = _db_conninfo()
+    if conninfo:
+        return psycopg.connect(conninfo)
     try:
-        db_url = os.getenv('DATABASE_URL')
-        if db_url:
-            # Corrige prefixo antigo
-            if db_url.startswith("postgres://"):
-                db_url = db_url.replace("postgres://", "postgresql://", 1)
-            conn = psycopg.connect(db_url)
-            return conn
-
-        # Monta a conexão via dict (DB_CONFIG)
-        cfg = {k: (str(v).strip() if isinstance(v, str) else v) for k, v in DB_CONFIG.items()}
-        try:
-            conn = psycopg.connect(**cfg)
-            return conn
-        except InvalidCatalogName:
-            # Banco não existe: conecta no 'postgres' e cria
-            admin_cfg = {**cfg, 'dbname': 'postgres'}
-            admin = psycopg.connect(**admin_cfg)
-            admin.autocommit = True
-            with admin.cursor() as cur:
-                cur.execute("SELECT 1 FROM pg_database WHERE datname=%s", (cfg['dbname'],))
-                if not cur.fetchone():
-                    cur.execute(f'CREATE DATABASE "{cfg["dbname"]}"')
-            admin.close()
-            # Conecta ao banco recém-criado
-            conn = psycopg.connect(**cfg)
-            return conn
-    except Exception as e:
-        print(f"Erro ao conectar ao banco de dados: {e}")
+        return psycopg.connect(**cfg)
+    except InvalidCatalogName:
+        # Banco não existe: conecta no 'postgres' e cria
+        admin_cfg = {**cfg, 'dbname': 'postgres'}
+        admin = psycopg.connect(**admin_cfg)
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname=%s", (cfg['dbname'],))
+            if not cur.fetchone():
+                cur.execute(f'CREATE DATABASE "{cfg["dbname"]}"')
+        admin.close()
+        # Conecta ao banco recém-criado
+        return psycopg.connect(**cfg)
+
+def _get_db_pool():
+    """Cria (uma vez por processo) e retorna o pool de conexões; None se indisponível."""
+    global _DB_POOL, _DB_POOL_PID
+    if not DB_POOL_ENABLED:
         return None
-
-# Helper para garantir coluna 'ativo' em curso
-def ensure_curso_ativo_column():
-    conn = get_db_connection()
-    if not conn:
-        return
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name='curso' AND column_name='ativo'")
-        if not cur.fetchone():
-            cur.execute("ALTER TABLE curso ADD COLUMN ativo BOOLEAN NOT NULL DEFAULT TRUE")
-            conn.commit()
-        cur.close()
-        conn.close()
-    except Exception as e:
+    pid = os.getpid()
+    if _DB_POOL is not None and _DB_POOL_PID == pid:
+        return _DB_POOL
+    with _DB_POOL_LOCK:
+        if _DB_POOL is not None and _DB_POOL_PID == pid:
+            return _DB_POOL
         try:
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            print('[DB] psycopg_pool não instalado; usando conexões avulsas.')
+            return None
+        # Pool herdado via fork (ex.: gunicorn --preload) não pode ser reutilizado no filho
+        _DB_POOL = None
+        conninfo, cfg = _db_conninfo()
+        if not conninfo:
+            # Garante que o banco exista antes de abrir o pool (uma conexão por processo)
+            _connect_direct().close()
+        pool = ConnectionPool(
+            conninfo,
+            kwargs=cfg,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=max(DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE),
+            max_idle=DB_POOL_MAX_IDLE,
+            timeout=DB_POOL_TIMEOUT,
+            # Valida a conexão a cada empréstimo; conexões quebradas são descartadas e repostas
+            check=ConnectionPool.check_connection,
+            name=f'inprolib-{pid}',
+            open=False,
+        )
+        pool.open(wait=False)
+        _DB_POOL = pool
+        _DB_POOL_PID = pid
+        return pool
+
+class PooledConnection:
+    """Conexão emprestada do pool: close() devolve ao pool em vez de encerrar o socket.
+
+    Quando pertence à sessão da requisição (request_scoped=True), close() não devolve
+    nada: apenas desfaz uma transação com erro para que as próximas consultas da mesma
+    requisição continuem funcionando. A devolução fica a cargo do teardown.
+    """
+
+    def __init__(self, conn, pool=None, request_scoped=False):
+        self._conn = conn
+        self._pool = pool
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise psycopg.InterfaceError('conexão já devolvida ao pool')
+        return getattr(conn, name)
+
+    def close(self):
+        if self._request_scoped:
+            conn = self._conn
+            if conn is not None and conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR:
+                conn.rollback()
+            return
+        self.release()
+
+    def release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._pool is None:
             conn.close()
+            return
+        try:
+            # Encerra transações abertas só por leituras antes de devolver ao pool
+            if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                conn.rollback()
+            self._pool.putconn(conn)
         except Exception:
-            pass
-        print(f"Falha ao garantir coluna curso.ativo: {e}")
+            try:
+                conn.close()
+            except Exception:
+                pass
 
-# Helper para garantir coluna 'ativo' em usuario
-def ensure_usuario_ativo_column():
-    conn = get_db_connection()
-    if not conn:
-        return
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT current_schema()")
-        schema = (cur.fetchone() or ['public'])[0] or 'public'
-        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema=%s AND table_name='usuario' AND column_name='ativo'", (schema,))
-        if not cur.fetchone():
-            cur.execute(f'ALTER TABLE "{schema}".usuario ADD COLUMN ativo BOOLEAN NOT NULL DEFAULT TRUE')
-            conn.commit()
-        cur.close(); conn.close()
-    except Exception as e:
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
         try:
-            conn.close()
+            if self._conn is not None:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+
+    def __del__(self):
+        # Rede de segurança para rotas que esquecem de fechar a conexão
+        try:
+            self.release()
         except Exception:
             pass
-        print(f"Falha ao garantir coluna usuario.ativo: {e}")
 
-# Helper para garantir colunas de endereço em usuario (cep, logradouro, complemento, bairro, cidade, estado)
-def ensure_usuario_endereco_columns():
-    conn = get_db_connection()
-    if not conn:
+def _borrow_db_connection(request_scoped=False):
+    try:
+        pool = _get_db_pool()
+        if pool is None:
+            return PooledConnection(_connect_direct(), request_scoped=request_scoped)
+        return PooledConnection(pool.getconn(), pool, request_scoped=request_scoped)
+    except Exception as e:
+        print(f"Erro ao conectar ao banco de dados: {e}")
+        return None
+
+def get_db():
+    """Sessão de banco da requisição atual: uma única conexão, obtida no primeiro uso e
+    compartilhada por todas as consultas; devolvida no teardown.
+
+    Regra: quem escreve faz `conn.commit()` explicitamente. O teardown nunca confirma nada: o que
+    ficou sem commit (rota que falhou no meio, ou que só fechou a conexão) é desfeito, como quando
+    cada rota tinha a própria conexão.
+    """
+    conn = g.get('db')
+    if conn is None or conn.closed:
+        conn = _borrow_db_connection(request_scoped=True)
+        if conn is not None:
+            g.db = conn
+    return conn
+
+def get_db_connection():
+    # Dentro de uma requisição, reaproveita a sessão da requisição (flask.g)
+    if has_request_context():
+        return get_db()
+    return _borrow_db_connection()
+
+@app.teardown_request
+def close_db_session(exc):
+    conn = g.pop('db', None)
+    if conn is None:
         return
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT current_schema()")
-        schema = (cur.fetchone() or ['public'])[0] or 'public'
-        cols = [
-            ('cep', 'VARCHAR(9)'),
-            ('logradouro', 'VARCHAR(255)'),
-            ('complemento', 'VARCHAR(255)'),
-            ('bairro', 'VARCHAR(255)'),
-            ('cidade', 'VARCHAR(255)'),
-            ('estado', 'VARCHAR(2)')
-        ]
-        for col, coldef in cols:
-            cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema=%s AND table_name='usuario' AND column_name=%s", (schema, col))
-            if not cur.fetchone():
-                cur.execute(f'ALTER TABLE "{schema}".usuario ADD COLUMN {col} {coldef}')
-                conn.commit()
-        cur.close(); conn.close()
+        # Sem commit implícito (ver get_db): escritas não confirmadas pela rota são descartadas
+        if not conn.closed and conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+            conn.rollback()
     except Exception as e:
+        print(f"Falha ao finalizar sessão do banco: {e}")
+    finally:
+        conn.release()
+
+def close_db_pool():
+    global _DB_POOL
+    if _DB_POOL is not None and _DB_POOL_PID == os.getpid():
         try:
-            conn.close()
+            _DB_POOL.close()
         except Exception:
             pass
-        print(f"Falha ao garantir colunas de endereço em usuario: {e}")
+    _DB_POOL = None
 
-# Helper para garantir coluna 'id_orientador' em publicacao
-def ensure_publicacao_orientador_column():
-    conn = get_db_connection()
+atexit.register(close_db_pool)
+
+# Migrações versionadas do schema (arquivos NNNN_nome.sql em migrations/, aplicados em ordem)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Aplica migrações pendentes na primeira requisição se o banco estiver atrasado (desative em produção
+# quando `python app.py --migrate` já roda no deploy)
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1').lower() in {'1', 'true', 'yes'}
+# Chave do pg_advisory_lock que serializa migrações entre workers/instâncias
+MIGRATION_LOCK_ID = 5_251_001
+
+def list_migrations():
+    """Retorna [(versao, caminho)] das migrações disponíveis, em ordem crescente."""
+    out = []
+    try:
+        names = os.listdir(MIGRATIONS_DIR)
+    except FileNotFoundError:
+        return out
+    for name in names:
+        m = re.match(r'^(\d+)_[\w\-]+\.sql$', name)
+        if m:
+            out.append((int(m.group(1)), os.path.join(MIGRATIONS_DIR, name)))
+    out.sort()
+    return out
+
+SCHEMA_VERSION_TARGET = max((v for v, _ in list_migrations()), default=0)
+
+def get_schema_version(conn) -> int:
+    """Versão aplicada do schema (0 se a tabela schema_version ainda não existir)."""
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_version")
+        return int(cur.fetchone()[0])
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        return 0
+    finally:
+        cur.close()
+
+def run_migrations(verbose: bool = True) -> int:
+    """Aplica as migrações pendentes, cada uma em sua transação. Retorna a versão final."""
+    conn = _borrow_db_connection()
     if not conn:
-        return
+        raise RuntimeError('Falha ao conectar ao banco para migração.')
     try:
         cur = conn.cursor()
-        cur.execute("SELECT current_schema()")
-        schema = (cur.fetchone() or ['public'])[0] or 'public'
-        # adiciona coluna se não existir
-        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_schema=%s AND table_name='publicacao' AND column_name='id_orientador'", (schema,))
-        if not cur.fetchone():
-            cur.execute(f'ALTER TABLE "{schema}".publicacao ADD COLUMN id_orientador INTEGER NULL')
-            conn.commit()
-        # tenta criar FK (ignora erro se já existir)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                versao INTEGER PRIMARY KEY,
+                nome VARCHAR(255) NOT NULL,
+                aplicada_em TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        # Impede que dois workers apliquem a mesma migração ao mesmo tempo
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
         try:
-            cur.execute(f'ALTER TABLE "{schema}".publicacao ADD CONSTRAINT fk_publicacao_orientador FOREIGN KEY (id_orientador) REFERENCES "{schema}".usuario(id_usuario) ON DELETE SET NULL')
+            cur.execute("SELECT versao FROM schema_version")
+            applied = {r[0] for r in cur.fetchall()}
             conn.commit()
-        except Exception:
-            pass
-        cur.close(); conn.close()
-    except Exception as e:
-        try:
-            conn.close()
-        except Exception:
-            pass
-        print(f"Falha ao garantir coluna publicacao.id_orientador: {e}")
+            for versao, path in list_migrations():
+                if versao in applied:
+                    continue
+                nome = os.path.basename(path)
+                with open(path, 'r', encoding='utf-8') as f:
+                    sql = f.read()
+                try:
+                    cur.execute(sql)
+                    cur.execute("INSERT INTO schema_version (versao, nome) VALUES (%s, %s)", (versao, nome))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    print(f"Falha ao aplicar migração {nome}.")
+                    raise
+                if verbose:
+                    print(f"Migração aplicada: {nome}")
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+        version = get_schema_version(conn)
+        cur.close()
+        return version
+    finally:
+        conn.close()
 
-# Inicialização do schema na primeira requisição
+# Verificação do schema na primeira requisição: compara apenas o número da versão
 SCHEMA_INIT_DONE = False
 @app.before_request
 def init_schema_once():
     global SCHEMA_INIT_DONE
     if SCHEMA_INIT_DONE:
         return
+    conn = _borrow_db_connection()
+    if not conn:
+        return
     try:
-        ensure_usuario_ativo_column()
-        ensure_usuario_endereco_columns()
-        ensure_publicacao_orientador_column()
+        version = get_schema_version(conn)
+        conn.close()
+        if version < SCHEMA_VERSION_TARGET:
+            if AUTO_MIGRATE:
+                version = run_migrations()
+            else:
+                print(f"Schema desatualizado (versão {version}, esperada {SCHEMA_VERSION_TARGET}). Execute: python app.py --migrate")
         SCHEMA_INIT_DONE = True
-        print("Schema inicial garantido: usuario.ativo, endereço e publicacao.id_orientador.")
     except Exception as e:
-        print(f"Falha ao garantir schema inicial: {e}")
+        conn.close()
+        print(f"Falha ao verificar versão do schema: {e}")
 
 # Decorator para verificar se o usuário está logado
 def login_required(f):
@@ -467,6 +1394,100 @@ def roles_required(allowed_roles):
         return decorated_function
     return decorator
 
+# Compressão dinâmica das respostas (HTML, JSON, CSV...): brotli ou gzip conforme o Accept-Encoding,
+# só acima de COMPRESS_MIN_BYTES e para os tipos de COMPRESS_MIMETYPES. Arquivos (send_file),
+# respostas parciais e o que já tem Content-Encoding (assets pré-comprimidos) passam direto.
+# Respostas em fluxo são comprimidas bloco a bloco (com flush), sem esperar o fim.
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '1').lower() in {'1', 'true', 'yes'}
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BR_QUALITY = int(os.getenv('COMPRESS_BR_QUALITY', '4'))
+COMPRESS_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+try:
+    import brotli as _brotli
+except ImportError:  # sem brotli: só gzip
+    _brotli = None
+
+def compress_level(gzip: int = None, br: int = None):
+    """Níveis de compressão da rota (gzip 1–9, brotli 0–11); None mantém o padrão e 0 desativa o algoritmo."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.compress_niveis = (gzip, br)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def _escolher_compressao():
+    """(encoding, nível) a usar para o cliente atual, ou None."""
+    niv_gzip, niv_br = getattr(g, 'compress_niveis', (None, None))
+    niv_gzip = COMPRESS_GZIP_LEVEL if niv_gzip is None else niv_gzip
+    niv_br = COMPRESS_BR_QUALITY if niv_br is None else niv_br
+    aceitas = request.accept_encodings
+    opcoes = []
+    if _brotli is not None and niv_br > 0 and aceitas['br'] > 0:
+        opcoes.append((aceitas['br'], 1, 'br', niv_br))
+    if niv_gzip > 0 and aceitas['gzip'] > 0:
+        opcoes.append((aceitas['gzip'], 0, 'gzip', niv_gzip))
+    if not opcoes:
+        return None
+    _, _, encoding, nivel = max(opcoes)  # maior q; empate → brotli
+    return encoding, nivel
+
+def _novo_compressor(encoding: str, nivel: int):
+    """Retorna (comprimir(bloco) → bytes já liberados, finalizar() → bytes)."""
+    if encoding == 'br':
+        c = _brotli.Compressor(quality=nivel)
+        return (lambda bloco: c.process(bloco) + c.flush()), c.finish
+    import zlib
+    c = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+    return (lambda bloco: c.compress(bloco) + c.flush(zlib.Z_SYNC_FLUSH)), c.flush
+
+def _comprimir_fluxo(iteravel, encoding: str, nivel: int):
+    comprimir, finalizar = _novo_compressor(encoding, nivel)
+    try:
+        for bloco in iteravel:
+            if isinstance(bloco, str):
+                bloco = bloco.encode('utf-8')
+            if bloco:
+                dados = comprimir(bloco)
+                if dados:
+                    yield dados
+        yield finalizar()
+    finally:
+        if hasattr(iteravel, 'close'):
+            iteravel.close()
+
+@app.after_request
+def compress_response(resp):
+    if (not COMPRESS_ENABLED or resp.direct_passthrough or 'Content-Encoding' in resp.headers
+            or resp.status_code < 200 or resp.status_code in (204, 206, 304)
+            or resp.mimetype not in COMPRESS_MIMETYPES
+            or 'no-transform' in (resp.headers.get('Cache-Control') or '')):
+        return resp
+    if not resp.is_streamed and (resp.calculate_content_length() or 0) < COMPRESS_MIN_BYTES:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    escolha = _escolher_compressao()
+    if escolha is None:
+        return resp
+    encoding, nivel = escolha
+    if resp.is_streamed:
+        resp.response = _comprimir_fluxo(resp.response, encoding, nivel)
+        resp.headers.pop('Content-Length', None)
+    else:
+        comprimir, finalizar = _novo_compressor(encoding, nivel)
+        resp.set_data(comprimir(resp.get_data()) + finalizar())
+    resp.headers['Content-Encoding'] = encoding
+    etag, fraca = resp.get_etag()
+    if etag:
+        resp.set_etag(f'{etag}-{encoding}', weak=fraca)
+    return resp
+
 # Rota principal -> redireciona para Home
 @app.route('/')
 def index():
@@ -571,9 +1592,10 @@ def home():
     if conn:
         try:
             cur = conn.cursor(row_factory=dict_row)
-            # Buscar as últimas publicações
+            # Buscar as últimas publicações (colunas usadas pelo home.js; evita serializar p.busca)
             cur.execute("""
-                SELECT p.*, u.nome as autor_nome, c.nome_curso 
+                SELECT p.id_publicacao, p.titulo, p.tipo, p.data_publicacao, p.nome_arquivo,
+                       u.nome as autor_nome, c.nome_curso
                 FROM publicacao p
                 JOIN usuario u ON p.id_autor = u.id_usuario
                 JOIN curso c ON p.id_curso = c.id_curso
@@ -1089,7 +2111,6 @@ def cadastro_alunos():
                 flash('Muitas tentativas. Tente novamente em instantes.', 'error')
                 audit_log('rate_limit', {'route': 'cadastro_alunos_toggle'})
                 return redirect(url_for('cadastro_alunos'))
-            ensure_usuario_ativo_column()
             id_usuario = request.form.get('id_usuario')
             if not id_usuario:
                 flash('Usuário inválido para alternar status.', 'error')
@@ -1157,7 +2178,6 @@ def cadastro_alunos():
             if not validar_cpf(cpf):
                 flash('CPF inválido.', 'error')
                 return redirect(url_for('cadastro_alunos'))
-            ensure_usuario_endereco_columns()
             conn = get_db_connection()
             if conn:
                 try:
@@ -1222,7 +2242,6 @@ def cadastro_alunos():
             flash('Captcha incorreto.', 'error')
             return redirect(url_for('cadastro_alunos'))
 
-        ensure_usuario_endereco_columns()
         conn = get_db_connection()
         if conn:
             try:
@@ -1261,39 +2280,30 @@ def cadastro_alunos():
                 audit_log('cadastro_aluno_error', {'error': str(e)})
             return redirect(url_for('cadastro_alunos'))
     
-    # Buscar cursos para o formulário e alunos para listagem
+    # Buscar cursos para o formulário e alunos para listagem (mesma sessão da requisição)
     cursos = []
     usuarios = []
-    conn = get_db_connection()
+    conn = get_db()
     if conn:
+        cur = conn.cursor(row_factory=dict_row)
         try:
-            cur = conn.cursor(row_factory=dict_row)
             cur.execute("SELECT * FROM curso ORDER BY nome_curso")
             cursos = cur.fetchall()
-            cur.close()
-            conn.close()
         except Exception as e:
+            conn.rollback()
             flash(f'Erro ao buscar cursos: {e}', 'error')
 
-    # Buscar usuários para listagem
-    ensure_usuario_ativo_column()
-    conn2 = get_db_connection()
-    if conn2:
+        # Buscar usuários para listagem
         try:
-            cur2 = conn2.cursor(row_factory=dict_row)
-            cur2.execute("""
+            cur.execute("""
                 SELECT id_usuario, nome, email, cpf, tipo, curso_usuario, foto_perfil,
                        COALESCE(ativo, TRUE) AS ativo
                 FROM usuario
                 ORDER BY id_usuario DESC
             """)
-            usuarios = cur2.fetchall()
-            cur2.close(); conn2.close()
+            usuarios = cur.fetchall()
         except Exception as e:
-            try:
-                conn2.close()
-            except Exception:
-                pass
+            conn.rollback()
             flash(f'Erro ao buscar usuários: {e}', 'error')
 
     # Captcha pergunta
@@ -1323,32 +2333,18 @@ def cadastro_curso():
         if coordenador_id == '':
             coordenador_id = None
         
-        conn = get_db_connection()
+        conn = get_db()
         if conn:
             try:
                 cur = conn.cursor()
                 if action == 'toggle':
-                    ensure_curso_ativo_column()
                     id_curso = request.form.get('id_curso')
                     if not id_curso:
                         flash('Curso inválido para alternar status.', 'error')
-                        cur.close(); conn.close()
                         return redirect(url_for('cadastro_curso'))
-                    # Obtém estado atual
-                    conn2 = get_db_connection()
-                    row = None
-                    if conn2:
-                        try:
-                            cur2 = conn2.cursor()
-                            cur2.execute("SELECT ativo FROM curso WHERE id_curso = %s", (id_curso,))
-                            row = cur2.fetchone()
-                            cur2.close(); conn2.close()
-                        except Exception:
-                            try:
-                                conn2.close()
-                            except Exception:
-                                pass
-                            row = None
+                    # Obtém estado atual na mesma sessão da requisição
+                    cur.execute("SELECT ativo FROM curso WHERE id_curso = %s", (id_curso,))
+                    row = cur.fetchone()
                     current_active = True
                     if row is not None:
                         val = row[0] if isinstance(row, tuple) else row
@@ -1358,13 +2354,11 @@ def cadastro_curso():
                     conn.commit()
                     flash('Curso reativado com sucesso!' if new_active else 'Curso inativado com sucesso!', 'success')
                     audit_log('curso_toggle', {'id_curso': id_curso, 'ativo': new_active})
-                    cur.close(); conn.close()
                     return redirect(url_for('cadastro_curso'))
                 elif action == 'update':
                     id_curso = request.form.get('id_curso')
                     if not id_curso or not nome_curso:
                         flash('Informe nome e selecione o curso para editar.', 'error')
-                        cur.close(); conn.close()
                         audit_log('cadastro_curso_fail', {'motivo': 'update_campos_invalidos'})
                         return redirect(url_for('cadastro_curso'))
                     cur.execute(
@@ -1373,7 +2367,6 @@ def cadastro_curso():
                     )
                     conn.commit()
                     flash('Curso atualizado com sucesso!', 'success')
-                    cur.close(); conn.close()
                     audit_log('cadastro_curso_update', {'id_curso': id_curso, 'nome_curso': nome_curso})
                     return redirect(url_for('cadastro_curso'))
                 else:
@@ -1385,28 +2378,26 @@ def cadastro_curso():
                         )
                         conn.commit()
                         flash('Curso cadastrado com sucesso!', 'success')
-                        cur.close(); conn.close()
                         audit_log('cadastro_curso_ok', {'nome_curso': nome_curso})
                         return redirect(url_for('cadastro_curso'))
                     else:
                         flash('Informe ao menos o nome do curso.', 'error')
-                        cur.close(); conn.close()
                         audit_log('cadastro_curso_fail', {'motivo': 'nome_vazio'})
             except Exception as e:
+                conn.rollback()
                 flash(f'Erro ao processar curso: {e}', 'error')
                 audit_log('cadastro_curso_error', {'error': str(e)})
     
     # Buscar professores para o formulário
     professores = []
     cursos = []
-    conn = get_db_connection()
+    conn = get_db()
     if conn:
         try:
             cur = conn.cursor(row_factory=dict_row)
             cur.execute("SELECT * FROM usuario WHERE tipo = 'Professor' ORDER BY nome")
             professores = cur.fetchall()
             # Buscar cursos já cadastrados
-            ensure_curso_ativo_column()
             cur.execute(
                 """
                 SELECT c.id_curso, c.nome_curso, c.codigo_curso, c.autorizacao, c.ativo, c.id_coordenador, u.nome as coordenador
@@ -1416,9 +2407,8 @@ def cadastro_curso():
                 """
             )
             cursos = cur.fetchall()
-            cur.close()
-            conn.close()
         except Exception as e:
+            conn.rollback()
             flash(f'Erro ao buscar professores: {e}', 'error')
     return render_template('cadastro_curso.html', professores=professores, cursos=cursos)
 
@@ -1476,11 +2466,15 @@ def publicacao():
                 cur.execute(
                     """INSERT INTO publicacao 
                        (titulo, data_publicacao, id_autor, id_curso, tipo, status, arquivo, nome_arquivo, assuntos_relacionados, data_autoria) 
-                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                       RETURNING id_publicacao""",
                     (titulo, datetime.now(), session.get('user_id'), curso_id, tipo or '', 'Publicado', 
                      filepath, novo_filename, None, None)
                 )
+                id_publicacao = cur.fetchone()[0]
                 conn.commit()
+                index_upload(filepath, conn=conn)
+                schedule_preview(id_publicacao, filepath, conn=conn, usuario=session.get('user_id'))
                 flash('Publicação realizada com sucesso!', 'success')
                 cur.close()
                 conn.close()
@@ -1499,27 +2493,13 @@ def publicacao():
     tipos = []
     professores = []
     publicacoes = []
-    conn = get_db_connection()
+    conn = get_db()
     if conn:
         try:
             cur = conn.cursor(row_factory=dict_row)
             cur.execute("SELECT * FROM curso ORDER BY nome_curso")
             cursos = cur.fetchall()
             
-            # Padroniza tipo 'Artigo Científico'
-            try:
-                cur_ins = conn.cursor()
-                # garante 'Artigo Científico'
-                cur_ins.execute("INSERT INTO tipos_de_publicacao (nome_tipo) SELECT %s WHERE NOT EXISTS (SELECT 1 FROM tipos_de_publicacao WHERE nome_tipo = %s)", ('Artigo Científico','Artigo Científico'))
-                # atualiza publicações antigas
-                cur_ins.execute("UPDATE publicacao SET tipo = %s WHERE tipo = %s", ('Artigo Científico','Artigo'))
-                # remove 'Artigo' da lista se já existir 'Artigo Científico'
-                cur_ins.execute("DELETE FROM tipos_de_publicacao WHERE nome_tipo = %s AND EXISTS (SELECT 1 FROM tipos_de_publicacao WHERE nome_tipo = %s)", ('Artigo','Artigo Científico'))
-                conn.commit()
-                cur_ins.close()
-            except Exception:
-                pass
-
             cur.execute("SELECT * FROM tipos_de_publicacao ORDER BY nome_tipo")
             tipos = cur.fetchall()
 
@@ -1540,10 +2520,8 @@ def publicacao():
                 LIMIT 20
             """)
             publicacoes = cur.fetchall()
-            
-            cur.close()
-            conn.close()
         except Exception as e:
+            conn.rollback()
             # Não exibir erros na tela durante o carregamento inicial (GET)
             # Registrar em log para diagnóstico sem interromper a experiência do usuário
             try:
@@ -1586,40 +2564,20 @@ def download_publicacao(id_publicacao):
         full_path = os.path.join(upload_dir, stored_name)
         if not os.path.exists(full_path):
             # Arquivo ausente: sempre retorna um PDF explicando o problema
-            preview_dir = ensure_previews_dir()
-            preview_name = f'preview_pub_{id_publicacao}.pdf'
-            preview_path = os.path.join(preview_dir, preview_name)
             safe_title = secure_filename(titulo) or 'publicacao'
-            download_name = f"{safe_title}.pdf"
-            try:
-                make_error_pdf(preview_path, 'Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.')
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception:
-                # Último recurso: PDF mínimo
-                from reportlab.platypus import SimpleDocTemplate, Paragraph
-                from reportlab.lib.pagesizes import A4
-                from reportlab.lib.styles import getSampleStyleSheet
-                doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                doc.build([Paragraph('Arquivo da publicação não encontrado.', getSampleStyleSheet()['Normal'])])
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                return resp
+            return send_error_pdf('Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.',
+                                  as_attachment=True, download_name=f"{safe_title}.pdf")
         # Preserva a extensão original para evitar problemas ao abrir o arquivo
         ext = os.path.splitext(stored_name)[1]
         safe_title = secure_filename(titulo) or 'publicacao'
         download_name = f"{safe_title}{ext}"
-        resp = send_from_directory(upload_dir, stored_name, as_attachment=True, download_name=download_name)
-        # Define explicitamente Content-Length para permitir barra de progresso no front
+        resp = send_file_conditional(full_path, as_attachment=True, download_name=download_name)
+        if not is_download_start(resp):
+            return resp
         try:
             size_bytes = os.path.getsize(full_path)
-            resp.headers['Content-Length'] = size_bytes
         except Exception:
             size_bytes = None
-            pass
         try:
             ctype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
         except Exception:
@@ -1652,6 +2610,7 @@ def download_publicacao(id_publicacao):
 @app.route('/preview_publicacao/<int:id_publicacao>')
 @login_required
 @roles_required(['Administrador','Docente','Aluno'])
+@compress_level(gzip=4, br=3)  # HTML grande e gerado a cada pedido: nível baixo, a taxa já é alta
 def preview_publicacao(id_publicacao):
     from html import escape
     try:
@@ -1758,163 +2717,476 @@ def preview_publicacao(id_publicacao):
 
 # Utilitários para conversão automática para PDF
 
+# Pasta do cache de PDFs. Nunca dentro de UPLOAD_FOLDER: no Render o disco persistente é só dos uploads
+# e os previews (regeneráveis) não podem disputar esse espaço.
+PREVIEW_FOLDER = os.path.abspath(os.getenv('PREVIEW_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'previews'))
+if os.path.commonpath([PREVIEW_FOLDER, app.config['UPLOAD_FOLDER']]) == app.config['UPLOAD_FOLDER']:
+    print(f'[PREVIEW] PREVIEW_FOLDER dentro de UPLOAD_FOLDER ({PREVIEW_FOLDER}); usando static/previews.')
+    PREVIEW_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'previews')
+
 def ensure_previews_dir() -> str:
-    d = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'previews')
-    os.makedirs(d, exist_ok=True)
-    return d
+    os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+    return PREVIEW_FOLDER
+
+
+# LibreOffice: pool de instâncias headless persistentes (UNO), uma por processo web/conversor.
+# Cada instância tem perfil próprio e escuta num pipe local; é verificada antes do uso e
+# reciclada após LIBREOFFICE_MAX_CONVERSIONS conversões ou ao passar de LIBREOFFICE_MAX_RSS_MB.
+# Sem o módulo `uno` (pacote python3-uno) ou com LIBREOFFICE_POOL_SIZE=0, cada conversão sobe um
+# `soffice --convert-to` com perfil temporário exclusivo.
+LIBREOFFICE_POOL_SIZE = int(os.getenv('LIBREOFFICE_POOL_SIZE', '1'))
+LIBREOFFICE_MAX_CONVERSIONS = int(os.getenv('LIBREOFFICE_MAX_CONVERSIONS', '200'))
+LIBREOFFICE_MAX_RSS_MB = int(os.getenv('LIBREOFFICE_MAX_RSS_MB', '700'))
+LIBREOFFICE_TIMEOUT = int(os.getenv('LIBREOFFICE_TIMEOUT', '60'))
+LIBREOFFICE_START_TIMEOUT = 30
+LIBREOFFICE_PDF_FILTERS = {
+    '.doc': 'writer_pdf_Export', '.docx': 'writer_pdf_Export', '.odt': 'writer_pdf_Export', '.rtf': 'writer_pdf_Export',
+    '.xls': 'calc_pdf_Export', '.xlsx': 'calc_pdf_Export', '.ods': 'calc_pdf_Export',
+    '.ppt': 'impress_pdf_Export', '.pptx': 'impress_pdf_Export', '.odp': 'impress_pdf_Export',
+}
 
 
-def try_libreoffice_convert(input_path: str, outdir: str):
-    """Tenta converter via LibreOffice (soffice). Retorna (ok, caminho_pdf)."""
-    try:
-        import shutil, subprocess
-        soffice = shutil.which('soffice')
-        if not soffice:
-            return (False, None)
-        res = subprocess.run(
-            [soffice, '--headless', '--convert-to', 'pdf', '--outdir', outdir, input_path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60
+class _SofficeInstance:
+    """Um processo soffice headless aceitando conexões UNO num pipe exclusivo."""
+
+    def __init__(self, soffice: str, index: int):
+        import tempfile
+        self.soffice = soffice
+        self.pipe_name = f'inprolib_lo_{os.getpid()}_{index}'
+        self.profile_dir = tempfile.mkdtemp(prefix=f'lo_profile_{index}_')
+        self.proc = None
+        self.desktop = None
+        self.conversions = 0
+
+    def start(self):
+        import subprocess, pathlib
+        self.proc = subprocess.Popen(
+            [self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+             '--nolockcheck', f'-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}',
+             f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
         )
-        if res.returncode == 0:
-            base = os.path.splitext(os.path.basename(input_path))[0]
-            pdf_path = os.path.join(outdir, base + '.pdf')
-            if os.path.exists(pdf_path):
-                return (True, pdf_path)
-        return (False, None)
-    except Exception:
-        return (False, None)
-
-
-def docx_to_pdf_reportlab(input_path: str, out_pdf_path: str):
-    """Fallback robusto DOCX→PDF usando ReportLab (texto e tabelas)."""
-    from docx import Document
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
+        self.conversions = 0
+        self.desktop = None
+        import uno
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.time() + LIBREOFFICE_START_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(f'uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext')
+                self.desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+                return
+            except Exception:
+                if self.proc.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise RuntimeError('LibreOffice não respondeu ao iniciar.')
+                time.sleep(0.25)
+
+    def healthy(self) -> bool:
+        if self.proc is None or self.proc.poll() is not None or self.desktop is None:
+            return False
+        try:
+            self.desktop.getComponents()  # chamada UNO barata: falha se a ponte caiu
+            return True
+        except Exception:
+            return False
 
-    styles = getSampleStyleSheet()
-    normal = styles['Normal']
-    title_style = ParagraphStyle('title', parent=styles['Heading2'])
+    def rss_mb(self) -> float:
+        try:
+            with open(f'/proc/{self.proc.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except Exception:
+            pass
+        return 0.0
+
+    def needs_recycle(self) -> bool:
+        return (self.conversions >= LIBREOFFICE_MAX_CONVERSIONS
+                or (LIBREOFFICE_MAX_RSS_MB > 0 and self.rss_mb() > LIBREOFFICE_MAX_RSS_MB))
+
+    def convert(self, input_path: str, out_pdf_path: str, filter_name: str):
+        import uno, pathlib
+        from com.sun.star.beans import PropertyValue
+
+        def props(**kw):
+            out = []
+            for k, v in kw.items():
+                p = PropertyValue()
+                p.Name, p.Value = k, v
+                out.append(p)
+            return tuple(out)
+
+        # Vigia: se a conversão travar, mata o processo (a chamada UNO então falha)
+        watchdog = threading.Timer(LIBREOFFICE_TIMEOUT, self.kill)
+        watchdog.start()
+        doc = None
+        try:
+            doc = self.desktop.loadComponentFromURL(
+                pathlib.Path(input_path).resolve().as_uri(), '_blank', 0,
+                props(Hidden=True, ReadOnly=True, UpdateDocMode=0),
+            )
+            if doc is None:
+                raise RuntimeError('LibreOffice não abriu o documento.')
+            doc.storeToURL(pathlib.Path(out_pdf_path).resolve().as_uri(), props(FilterName=filter_name))
+            self.conversions += 1
+        finally:
+            watchdog.cancel()
+            if doc is not None:
+                try:
+                    doc.close(True)
+                except Exception:
+                    pass
 
-    def safe_text(s: str) -> str:
+    def kill(self):
         try:
-            return (s or '').replace('\xa0', ' ').replace('\u200b', ' ').strip()
+            if self.proc and self.proc.poll() is None:
+                self.proc.kill()
         except Exception:
+            pass
+
+    def stop(self):
+        import shutil, subprocess
+        try:
+            if self.desktop is not None and self.proc and self.proc.poll() is None:
+                self.desktop.terminate()
+        except Exception:
+            pass
+        if self.proc is not None:
             try:
-                return str(s).strip()
-            except Exception:
-                return ''
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+        self.desktop = None
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficePool:
+    """Instâncias soffice mornas compartilhadas pelas threads do processo (criadas sob demanda)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = None
+        self._created = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._available = None
+
+    def available(self) -> bool:
+        if self._available is None:
+            import shutil
+            try:
+                import uno  # noqa: F401  (python3-uno)
+                self._available = self.size > 0 and bool(shutil.which('soffice'))
+            except ImportError:
+                self._available = False
+        return self._available
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processo novo (fork do gunicorn): não herda instâncias do pai
+                self._idle = queue.Queue()
+                self._created = 0
+                self._pid = os.getpid()
+            if self._idle.empty() and self._created < self.size:
+                import shutil
+                self._created += 1
+                return _SofficeInstance(shutil.which('soffice'), self._created)
+        return self._idle.get(timeout=LIBREOFFICE_TIMEOUT)
 
-    story = []
+    def convert(self, input_path: str, out_pdf_path: str, filter_name: str):
+        inst = self._acquire()
+        try:
+            if not inst.healthy():
+                inst.stop()
+                inst.start()
+            inst.convert(input_path, out_pdf_path, filter_name)
+        except Exception:
+            inst.stop()  # instância suspeita: a próxima conversão sobe outra
+            raise
+        finally:
+            if inst.healthy() and inst.needs_recycle():
+                inst.stop()
+            self._idle.put(inst)
+
+    def close(self):
+        if self._pid != os.getpid() or self._idle is None:
+            return
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
 
-    # Tenta abrir o DOCX; se falhar, gera nota em PDF
+
+LIBREOFFICE_POOL = LibreOfficePool(LIBREOFFICE_POOL_SIZE)
+atexit.register(LIBREOFFICE_POOL.close)
+
+def try_libreoffice_convert(input_path: str, outdir: str):
+    """Tenta converter via LibreOffice (pool UNO ou soffice avulso). Retorna (ok, caminho_pdf)."""
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    pdf_path = os.path.join(outdir, base + '.pdf')
+    ext = os.path.splitext(input_path)[1].lower()
+    if LIBREOFFICE_POOL.available() and ext in LIBREOFFICE_PDF_FILTERS:
+        try:
+            LIBREOFFICE_POOL.convert(input_path, pdf_path, LIBREOFFICE_PDF_FILTERS[ext])
+            if os.path.exists(pdf_path):
+                return (True, pdf_path)
+        except Exception as e:
+            print(f'[LIBREOFFICE] Falha no pool, usando soffice avulso: {e}')
     try:
-        doc = Document(input_path)
+        import shutil, subprocess, tempfile, pathlib
+        soffice = shutil.which('soffice')
+        if not soffice:
+            return (False, None)
+        # Perfil exclusivo: conversões simultâneas não disputam o mesmo diretório de usuário
+        profile = tempfile.mkdtemp(prefix='lo_profile_')
+        try:
+            res = subprocess.run(
+                [soffice, '--headless', '--norestore', f'-env:UserInstallation={pathlib.Path(profile).as_uri()}',
+                 '--convert-to', 'pdf', '--outdir', outdir, input_path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=LIBREOFFICE_TIMEOUT
+            )
+        finally:
+            shutil.rmtree(profile, ignore_errors=True)
+        if res.returncode == 0:
+            if os.path.exists(pdf_path):
+                return (True, pdf_path)
+        return (False, None)
     except Exception:
-        doc = None
-        story.append(Paragraph('Falha ao abrir o arquivo DOCX.', title_style))
-        story.append(Spacer(1, 12))
-
-    if doc:
-        # Parágrafos
-        for p in doc.paragraphs:
-            text = safe_text(p.text)
-            if text:
-                try:
-                    story.append(Paragraph(text, normal))
-                    story.append(Spacer(1, 6))
-                except Exception:
-                    # Se houver caracteres não suportados, remove-os
-                    text_ascii = text.encode('ascii', 'ignore').decode('ascii')
-                    story.append(Paragraph(text_ascii, normal))
-                    story.append(Spacer(1, 6))
-        # Tabelas (conteúdo textual)
-        try:
-            for t in getattr(doc, 'tables', []):
-                data = []
-                for row in t.rows:
-                    cells = []
-                    for cell in row.cells:
-                        cells.append(safe_text(cell.text))
-                    data.append(cells)
-                if data:
-                    tbl = Table(data)
-                    tbl.setStyle(TableStyle([
-                        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#94a3b8')),
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e2e8f0')),
-                        ('FONTSIZE', (0, 0), (-1, -1), 9),
-                        ('ALIGN', (0, 0), (-1, -1), 'LEFT')
-                    ]))
-                    story.append(tbl)
-                    story.append(Spacer(1, 8))
-        except Exception:
-            pass
+        return (False, None)
 
-    if not story:
-        story.append(Paragraph('Documento DOCX sem conteúdo textual suportado.', normal))
 
-    SimpleDocTemplate(
-        out_pdf_path,
-        pagesize=A4,
-        rightMargin=24,
-        leftMargin=24,
-        topMargin=24,
-        bottomMargin=24
-    ).build(story)
+# ---------- Fallbacks ReportLab em fluxo ----------
+# Os conversores leem a fonte aos poucos e desenham cada bloco direto no canvas (StreamingPdf): em memória
+# fica só a página atual, nunca o documento inteiro. Todos param nos limites abaixo e avisam no rodapé.
+PDF_FALLBACK_MAX_PAGES = int(os.getenv('PDF_FALLBACK_MAX_PAGES', '50'))
+PDF_TEXT_MAX_LINES = int(os.getenv('PDF_TEXT_MAX_LINES', '2000'))
+PDF_TEXT_MAX_LINE_CHARS = 2000
+PDF_TABLE_MAX_ROWS = int(os.getenv('PDF_TABLE_MAX_ROWS', '200'))  # CSV
+PDF_SHEET_MAX_ROWS = int(os.getenv('PDF_SHEET_MAX_ROWS', '50'))   # planilhas
+PDF_TABLE_MAX_COLS = int(os.getenv('PDF_TABLE_MAX_COLS', '20'))
+PDF_TABLE_MAX_CELL_CHARS = 200
+PDF_TABLE_CHUNK_ROWS = 40  # linhas por bloco de tabela (cabeçalho repetido em cada bloco)
 
 
-def excel_to_pdf_reportlab(input_path: str, out_pdf_path: str):
-    """Fallback simples Excel→PDF mostrando até 50 linhas e 20 colunas."""
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.pagesizes import A4
+class StreamingPdf:
+    """Desenha flowables num canvas página a página (Frame), descartando cada um depois de desenhado.
+
+    `add()` devolve False quando `max_pages` é atingido; o chamador deve parar de ler a fonte.
+    """
+
+    def __init__(self, out_pdf_path: str, max_pages: int = PDF_FALLBACK_MAX_PAGES, margin: int = 24):
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+        self.canvas = canvas.Canvas(out_pdf_path, pagesize=A4, pageCompression=1)
+        self.pagesize = A4
+        self.margin = margin
+        self.max_pages = max(1, max_pages)
+        self.pages = 1
+        self.truncated = False
+        self.empty = True
+        self._new_frame()
+
+    def _new_frame(self):
+        from reportlab.platypus import Frame
+        w, h = self.pagesize
+        m = self.margin
+        self.frame = Frame(m, m, w - 2 * m, h - 2 * m, leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+
+    def _next_page(self) -> bool:
+        if self.pages >= self.max_pages:
+            self.truncated = True
+            return False
+        self.canvas.showPage()
+        self.pages += 1
+        self._new_frame()
+        return True
+
+    def add(self, flowable) -> bool:
+        if self.truncated:
+            return False
+        pending = [flowable]
+        while pending:
+            f = pending.pop(0)
+            if self.frame.add(f, self.canvas):
+                self.empty = False
+                continue
+            # Não coube: desenha o pedaço que cabe (parágrafos e tabelas se dividem) e segue com o resto
+            parts = self.frame.split(f, self.canvas)
+            if parts and not (len(parts) == 1 and parts[0] is f):
+                pending[:0] = parts
+                continue
+            if self.frame._atTop:
+                continue  # maior que uma página e indivisível: descarta
+            if not self._next_page():
+                return False
+            pending.insert(0, f)
+        return True
+
+    def close(self, note: str = ''):
+        if self.empty and not note:
+            note = 'Sem conteúdo para exibir.'
+        if self.truncated and not note:
+            note = f'Pré-visualização limitada a {self.max_pages} páginas.'
+        if note:
+            self.canvas.setFont('Helvetica-Oblique', 8)
+            self.canvas.drawString(self.margin, self.margin / 2, note)
+        self.canvas.save()
+
+
+def _sniff_text_encoding(path: str) -> str:
+    """utf-8 se o início do arquivo decodifica como UTF-8; senão latin-1 (como os fallbacks já faziam)."""
+    import codecs
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _iter_text_lines(f, max_chars: int):
+    """Linhas de `f` cortadas em `max_chars`, sem nunca ler uma linha gigante inteira para a memória."""
+    while True:
+        chunk = f.readline(max_chars)
+        if not chunk:
+            return
+        if not chunk.endswith('\n'):
+            # linha longa: descarta o restante até a quebra
+            while True:
+                rest = f.readline(max_chars)
+                if not rest or rest.endswith('\n'):
+                    break
+        yield chunk.rstrip('\r\n')
+
+
+def _pdf_table(rows, header=None, font_size=9, row_height=None):
+    from reportlab.platypus import Table, TableStyle
     from reportlab.lib import colors
+    data = ([header] if header else []) + rows
+    t = Table(data, repeatRows=1 if header else 0)
+    style = [
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#94a3b8')),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e2e8f0')),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), font_size),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]
+    if row_height:
+        style.append(('ROWHEIGHT', (0, 0), (-1, -1), row_height))
+    t.setStyle(TableStyle(style))
+    return t
+
+
+def _stream_table_rows(pdf: StreamingPdf, rows, max_rows: int, **table_kwargs):
+    """Desenha as linhas em blocos de PDF_TABLE_CHUNK_ROWS, repetindo a primeira (cabeçalho) em cada bloco.
+    Devolve (linhas desenhadas, truncado): truncado se a fonte passou de `max_rows` ou as páginas acabaram."""
+    header = None
+    chunk = []
+    count = 0
+
+    def flush() -> bool:
+        width = max(len(r) for r in [header] + chunk) or 1
+        return pdf.add(_pdf_table([r + [''] * (width - len(r)) for r in chunk],
+                                  header + [''] * (width - len(header)), **table_kwargs))
+
+    for row in rows:
+        row = [str(c)[:PDF_TABLE_MAX_CELL_CHARS] for c in row[:PDF_TABLE_MAX_COLS]]
+        if header is None:
+            header = row
+            continue
+        if count >= max_rows:
+            if chunk:
+                flush()
+            return count, True
+        chunk.append(row)
+        count += 1
+        if len(chunk) >= PDF_TABLE_CHUNK_ROWS:
+            if not flush():
+                return count, True
+            chunk = []
+    if header is not None and (chunk or count == 0):
+        flush()
+    return count, pdf.truncated
+
+
+def docx_to_pdf_reportlab(input_path: str, out_pdf_path: str):
+    """Fallback DOCX→PDF em fluxo: lê word/document.xml com iterparse (parágrafos e tabelas, na ordem
+    do documento) e descarta cada elemento depois de desenhado."""
+    import zipfile
+    from lxml import etree
+    from xml.sax.saxutils import escape
+    from reportlab.platypus import Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    normal = getSampleStyleSheet()['Normal']
+    pdf = StreamingPdf(out_pdf_path)
+
+    def texto(el) -> str:
+        return ''.join(t.text or '' for t in el.iter(W + 't')).replace('\xa0', ' ').replace('\u200b', ' ').strip()
+
+    try:
+        with zipfile.ZipFile(input_path) as z, z.open('word/document.xml') as xml:
+            for _, el in etree.iterparse(xml, events=('end',), tag=(W + 'p', W + 'tbl'), huge_tree=False):
+                parent = el.getparent()
+                if parent is None or next(el.iterancestors(W + 'tbl'), None) is not None:
+                    continue  # parágrafos e tabelas dentro de células são tratados junto com a tabela
+                if el.tag == W + 'p':
+                    text = texto(el)
+                    ok = True
+                    if text:
+                        ok = pdf.add(Paragraph(escape(text[:PDF_TEXT_MAX_LINE_CHARS * 5]), normal)) and pdf.add(Spacer(1, 6))
+                else:
+                    rows = ([texto(tc) for tc in tr.iterchildren(W + 'tc')] for tr in el.iterchildren(W + 'tr'))
+                    ok = not _stream_table_rows(pdf, rows, PDF_TABLE_MAX_ROWS)[1] and pdf.add(Spacer(1, 8))
+                # libera o elemento e os irmãos já processados
+                el.clear()
+                while el.getprevious() is not None:
+                    del parent[0]
+                if not ok:
+                    break
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        pdf.close('Falha ao abrir o arquivo DOCX.')
+        return
+    pdf.close('' if not pdf.empty else 'Documento DOCX sem conteúdo textual suportado.')
+
+
+def excel_to_pdf_reportlab(input_path: str, out_pdf_path: str):
+    """Fallback Excel→PDF em fluxo: primeira planilha, até PDF_SHEET_MAX_ROWS linhas e PDF_TABLE_MAX_COLS colunas."""
+    from reportlab.platypus import Paragraph, Spacer
     from reportlab.lib.styles import getSampleStyleSheet
-    data = []
     styles = getSampleStyleSheet()
     ext = os.path.splitext(input_path)[1].lower()
+    pdf = StreamingPdf(out_pdf_path)
+    pdf.add(Paragraph(f'Pré-visualização de planilha (máx. {PDF_SHEET_MAX_ROWS} linhas, {PDF_TABLE_MAX_COLS} colunas)', styles['Italic']))
+    pdf.add(Spacer(1, 8))
+    limit = PDF_SHEET_MAX_ROWS + 2  # cabeçalho + linhas + uma a mais, para saber se a planilha foi cortada
     if ext == '.xlsx':
         import openpyxl
         wb = openpyxl.load_workbook(input_path, read_only=True, data_only=True)
-        ws = wb.active
-        max_rows = 50
-        max_cols = 20
-        for r in ws.iter_rows(min_row=1, max_row=max_rows, min_col=1, max_col=max_cols):
-            row = []
-            for c in r:
-                val = c.value
-                row.append('' if val is None else str(val))
-            data.append(row)
+        try:
+            rows = (['' if v is None else v for v in r]
+                    for r in wb.active.iter_rows(max_row=limit, max_col=PDF_TABLE_MAX_COLS, values_only=True))
+            _, truncado = _stream_table_rows(pdf, rows, PDF_SHEET_MAX_ROWS, font_size=10, row_height=16)
+        finally:
+            wb.close()
     else:
         import xlrd
-        book = xlrd.open_workbook(input_path)
-        sheet = book.sheet_by_index(0)
-        max_rows = min(50, sheet.nrows)
-        max_cols = min(20, sheet.ncols)
-        for rr in range(max_rows):
-            row = []
-            for cc in range(max_cols):
-                val = sheet.cell_value(rr, cc)
-                row.append('' if val is None else str(val))
-            data.append(row)
-    doc = SimpleDocTemplate(out_pdf_path, pagesize=A4)
-    story = []
-    if data:
-        t = Table(data, repeatRows=1)
-        t.setStyle(TableStyle([
-            ('GRID', (0,0), (-1,-1), 0.25, colors.lightgrey),
-            ('BACKGROUND', (0,0), (-1,0), colors.whitesmoke),
-            ('FONTSIZE', (0,0), (-1,-1), 10),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('ROWHEIGHT', (0,0), (-1,-1), 16),
-        ]))
-        story.append(Paragraph('Pré-visualização de planilha (máx. 50 linhas, 20 colunas)', styles['Italic']))
-        story.append(Spacer(1, 8))
-        story.append(t)
-    else:
-        story.append(Paragraph('Sem dados para exibir.', styles['Normal']))
-    doc.build(story)
+        book = xlrd.open_workbook(input_path, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            rows = (['' if v is None else v for v in sheet.row_values(rr, 0, min(PDF_TABLE_MAX_COLS, sheet.ncols))]
+                    for rr in range(min(limit, sheet.nrows)))
+            _, truncado = _stream_table_rows(pdf, rows, PDF_SHEET_MAX_ROWS, font_size=10, row_height=16)
+        finally:
+            book.release_resources()
+    pdf.close(f'Planilha cortada: pré-visualização limitada a {PDF_SHEET_MAX_ROWS} linhas.' if truncado else '')
 
 # ---------- Fallbacks adicionais: imagem, texto e CSV em PDF ----------
 
@@ -1930,69 +3202,48 @@ def image_to_pdf_reportlab(input_path: str, out_pdf_path: str):
 
 
 def text_to_pdf_reportlab(input_path: str, out_pdf_path: str):
-    """Converte TXT em PDF como texto simples."""
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    """Converte TXT em PDF como texto simples, linha a linha (até PDF_TEXT_MAX_LINES)."""
+    from xml.sax.saxutils import escape
+    from reportlab.platypus import Paragraph, Spacer
     from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.pagesizes import A4
-    styles = getSampleStyleSheet()
-    doc = SimpleDocTemplate(out_pdf_path, pagesize=A4, rightMargin=24, leftMargin=24, topMargin=24, bottomMargin=24)
-    story = []
-    try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-    except Exception:
-        with open(input_path, 'r', encoding='latin-1') as f:
-            lines = f.readlines()
-    for ln in lines[:2000]:
-        text = (ln or '').rstrip('\n')
-        if text:
-            story.append(Paragraph(text, styles['Normal']))
-            story.append(Spacer(1, 6))
-    doc.build(story)
+    normal = getSampleStyleSheet()['Normal']
+    pdf = StreamingPdf(out_pdf_path)
+    note = ''
+    with open(input_path, 'r', encoding=_sniff_text_encoding(input_path), errors='replace') as f:
+        for n, text in enumerate(_iter_text_lines(f, PDF_TEXT_MAX_LINE_CHARS)):
+            if n >= PDF_TEXT_MAX_LINES:
+                note = f'Pré-visualização limitada a {PDF_TEXT_MAX_LINES} linhas.'
+                break
+            if text.strip() and not (pdf.add(Paragraph(escape(text), normal)) and pdf.add(Spacer(1, 6))):
+                break
+    pdf.close(note)
 
 
 def csv_to_pdf_reportlab(input_path: str, out_pdf_path: str):
-    """Converte CSV simples em PDF com tabela."""
+    """Converte CSV em PDF com tabela, lendo registro a registro (até PDF_TABLE_MAX_ROWS linhas)."""
     import csv
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
+    from reportlab.platypus import Paragraph, Spacer
     from reportlab.lib.styles import getSampleStyleSheet
     styles = getSampleStyleSheet()
-    rows = []
-    try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            sample = f.read(1024)
-            f.seek(0)
-            try:
-                dialect = csv.Sniffer().sniff(sample)
-            except Exception:
-                dialect = csv.excel
-            reader = csv.reader(f, dialect)
-            for r in reader:
-                rows.append([str(c) for c in r])
-    except Exception:
-        with open(input_path, 'r', encoding='latin-1') as f:
-            reader = csv.reader(f)
-            for r in reader:
-                rows.append([str(c) for c in r])
-    doc = SimpleDocTemplate(out_pdf_path, pagesize=A4, rightMargin=24, leftMargin=24, topMargin=24, bottomMargin=24)
-    story = []
-    if rows:
-        t = Table(rows[:200])
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e2e8f0')),
-            ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#94a3b8')),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT')
-        ]))
-        story.append(Paragraph('CSV (preview)', styles['Heading5']))
-        story.append(Spacer(1, 8))
-        story.append(t)
+    pdf = StreamingPdf(out_pdf_path)
+    pdf.add(Paragraph('CSV (preview)', styles['Heading5']))
+    pdf.add(Spacer(1, 8))
+    with open(input_path, 'r', encoding=_sniff_text_encoding(input_path), errors='replace', newline='') as f:
+        sample = f.read(1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample)
+        except Exception:
+            dialect = csv.excel
+        linhas, truncated = 0, False
+        try:
+            linhas, truncated = _stream_table_rows(pdf, csv.reader(f, dialect), PDF_TABLE_MAX_ROWS)
+        except csv.Error as e:
+            pdf.add(Paragraph(f'CSV inválido: {e}', styles['Normal']))
+    if truncated:
+        pdf.close(f'Pré-visualização limitada a {PDF_TABLE_MAX_ROWS} linhas.')
     else:
-        story.append(Paragraph('CSV vazio.', styles['Normal']))
-    doc.build(story)
+        pdf.close('CSV vazio.' if not linhas else '')
 
 
 def make_error_pdf(out_pdf_path: str, title: str, message: str):
@@ -2011,6 +3262,1207 @@ def make_error_pdf(out_pdf_path: str, title: str, message: str):
         doc = SimpleDocTemplate(out_pdf_path, pagesize=A4)
         doc.build([Paragraph(message, styles['Normal'])])
 
+# Conversão para PDF (preview e download-como-PDF)
+OFFICE_EXTS = ('.doc', '.docx', '.xls', '.xlsx')
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+PDF_CONVERTIBLE_EXTS = OFFICE_EXTS + IMAGE_EXTS + ('.txt', '.csv')
+
+# Cache de PDFs endereçado pelo conteúdo: static/previews/<sha256 da fonte>.<versão do conversor>.pdf.
+# Arquivos idênticos compartilham o PDF; reenvio gera outra chave (o PDF antigo vira órfão).
+# Incrementar PREVIEW_CONVERSOR_VERSAO ao mudar a conversão invalida todo o cache.
+PREVIEW_CONVERSOR_VERSAO = '2'
+PREVIEW_HASH_CACHE = TTLCache(max_items=20000, ttl=86400)  # (caminho, tamanho, mtime) -> sha256
+PREVIEW_FALHAS = TTLCache(max_items=1024, ttl=60)        # chave -> erro recente (quem esperava não reconverte)
+_preview_conversor_id = None
+_preview_locks = {}  # nome -> [Lock, usuários]
+_preview_locks_guard = threading.Lock()
+
+def preview_conversor_id() -> str:
+    """Versão do conversor na chave do cache: com e sem LibreOffice o PDF gerado é diferente."""
+    global _preview_conversor_id
+    if _preview_conversor_id is None:
+        import shutil
+        _preview_conversor_id = f"v{PREVIEW_CONVERSOR_VERSAO}{'lo' if shutil.which('soffice') else 'rl'}"
+    return _preview_conversor_id
+
+def file_sha256(path: str) -> str:
+    """SHA-256 do arquivo, memorizado por (caminho, tamanho, mtime) para não reler a cada requisição."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = PREVIEW_HASH_CACHE.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        PREVIEW_HASH_CACHE.set(key, digest)
+    return digest
+
+def preview_cache_location(full_path: str):
+    """Retorna (pasta, nome, caminho) do PDF em cache para o conteúdo atual de `full_path`."""
+    preview_dir = ensure_previews_dir()
+    preview_name = f'{file_sha256(full_path)}.{preview_conversor_id()}.pdf'
+    return preview_dir, preview_name, os.path.join(preview_dir, preview_name)
+
+def find_publicacao_file(row) -> str:
+    """Localiza o arquivo físico de uma publicação (nome_arquivo, caminho em 'arquivo' ou índice arquivo_upload)."""
+    upload_dir = app.config['UPLOAD_FOLDER']
+    stored_name = (row.get('nome_arquivo') or '').strip()
+    full_path = os.path.join(upload_dir, stored_name) if stored_name else ''
+    if full_path and os.path.exists(full_path):
+        return full_path
+    alt = (row.get('arquivo') or '').strip()
+    if alt and os.path.exists(alt):
+        return alt
+    if stored_name:
+        # arquivo movido para subpasta de uploads: consulta o índice em vez de varrer o disco
+        try:
+            indexado = lookup_upload_index(stored_name)
+            if indexado:
+                return indexado
+        except Exception as e:
+            print(f'[UPLOADS] Falha ao consultar o índice: {e}')
+    return full_path
+
+# Índice de arquivos enviados (tabela arquivo_upload, migração 0013). Caminhos relativos a UPLOAD_FOLDER;
+# avatars ficam de fora (são servidos direto de static/uploads/avatars).
+UPLOAD_INDEX_EXCLUIR = {'avatars'}
+
+def index_upload(full_path: str, conn=None):
+    """Registra (ou atualiza) um arquivo enviado no índice. Erros apenas são logados: o upload já foi salvo."""
+    own = conn is None
+    conn = conn or get_db_connection()
+    if not conn:
+        return
+    try:
+        st = os.stat(full_path)
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO arquivo_upload (caminho, nome_arquivo, tamanho, sha256, mtime)
+            VALUES (%s, %s, %s, %s, to_timestamp(%s))
+            ON CONFLICT (caminho) DO UPDATE SET
+                nome_arquivo = EXCLUDED.nome_arquivo, tamanho = EXCLUDED.tamanho, sha256 = EXCLUDED.sha256,
+                mtime = EXCLUDED.mtime, indexado_em = now()
+        """, (os.path.relpath(full_path, app.config['UPLOAD_FOLDER']), os.path.basename(full_path),
+              st.st_size, file_sha256(full_path), st.st_mtime))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print(f'[UPLOADS] Falha ao indexar {full_path}: {e}')
+    finally:
+        if own:
+            conn.close()
+
+def lookup_upload_index(stored_name: str):
+    """Caminho absoluto do arquivo indexado com esse nome (prefere a raiz de uploads) ou None.
+    Entradas cujo arquivo sumiu são removidas do índice."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cur = conn.cursor()
+    try:
+        # Só leitura na sessão da requisição: nada de commit aqui (confirmaria escritas pendentes da rota)
+        cur.execute("""
+            SELECT caminho FROM arquivo_upload
+            WHERE nome_arquivo = %s
+            ORDER BY (caminho = nome_arquivo) DESC, indexado_em DESC
+        """, (stored_name,))
+        caminhos = [r[0] for r in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+    upload_dir = app.config['UPLOAD_FOLDER']
+    sumidos, encontrado = [], None
+    for caminho in caminhos:
+        path = os.path.join(upload_dir, caminho)
+        if os.path.isfile(path):
+            encontrado = path
+            break
+        sumidos.append(caminho)
+    if sumidos:
+        # Limpeza numa conexão própria, com transação independente da rota
+        limpeza = _borrow_db_connection()
+        if limpeza:
+            try:
+                cur = limpeza.cursor()
+                cur.execute("DELETE FROM arquivo_upload WHERE caminho = ANY(%s)", (sumidos,))
+                limpeza.commit()
+                cur.close()
+            except Exception as e:
+                limpeza.rollback()
+                print(f'[UPLOADS] Falha ao limpar o índice: {e}')
+            finally:
+                limpeza.close()
+    return encontrado
+
+def reindex_uploads() -> dict:
+    """Reconstrói arquivo_upload a partir do disco (uma única varredura) e lista publicações sem arquivo.
+
+    Só recalcula o hash de arquivos novos ou com tamanho/mtime diferente do indexado.
+    """
+    upload_dir = app.config['UPLOAD_FOLDER']
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT caminho, tamanho, extract(epoch FROM mtime), sha256 FROM arquivo_upload")
+        atuais = {r[0]: (r[1], float(r[2]), r[3]) for r in cur.fetchall()}
+        linhas = []
+        hashes = 0
+        for root, dirs, files in os.walk(upload_dir):
+            if root == upload_dir:
+                dirs[:] = [d for d in dirs if d not in UPLOAD_INDEX_EXCLUIR]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                rel = os.path.relpath(path, upload_dir)
+                antigo = atuais.get(rel)
+                if antigo and antigo[0] == st.st_size and abs(antigo[1] - st.st_mtime) < 1e-3:
+                    digest = antigo[2]
+                else:
+                    digest = file_sha256(path)
+                    hashes += 1
+                linhas.append((rel, name, st.st_size, digest, st.st_mtime))
+        cur.execute("CREATE TEMP TABLE arquivo_upload_novo (LIKE arquivo_upload INCLUDING DEFAULTS) ON COMMIT DROP")
+        with cur.copy("COPY arquivo_upload_novo (caminho, nome_arquivo, tamanho, sha256, mtime) FROM STDIN") as copy:
+            for rel, name, size, digest, mtime in linhas:
+                copy.write_row((rel, name, size, digest, datetime.fromtimestamp(mtime, timezone.utc)))
+        cur.execute("""
+            INSERT INTO arquivo_upload (caminho, nome_arquivo, tamanho, sha256, mtime)
+            SELECT caminho, nome_arquivo, tamanho, sha256, mtime FROM arquivo_upload_novo
+            ON CONFLICT (caminho) DO UPDATE SET
+                nome_arquivo = EXCLUDED.nome_arquivo, tamanho = EXCLUDED.tamanho, sha256 = EXCLUDED.sha256,
+                mtime = EXCLUDED.mtime, indexado_em = now()
+        """)
+        cur.execute("DELETE FROM arquivo_upload a WHERE NOT EXISTS (SELECT 1 FROM arquivo_upload_novo n WHERE n.caminho = a.caminho)")
+        removidos = cur.rowcount
+        cur.execute("""
+            SELECT p.id_publicacao, p.nome_arquivo
+            FROM publicacao p
+            WHERE p.nome_arquivo IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM arquivo_upload a WHERE a.nome_arquivo = p.nome_arquivo)
+            ORDER BY p.id_publicacao
+        """)
+        ausentes = cur.fetchall()
+        conn.commit()
+        cur.close()
+        return {'arquivos': len(linhas), 'hashes_calculados': hashes, 'removidos': removidos, 'ausentes': ausentes}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+class ConversaoTransitoria(RuntimeError):
+    """Falha que não depende do arquivo (vagas ou conversores ocupados, LibreOffice fora do ar): vale repetir."""
+
+
+# Conversores ReportLab isolados: cada conversão roda num processo filho (fork) com limite de memória
+# (RLIMIT_AS: CONVERTER_MEM_MB além do espaço herdado do pai), de CPU por conversão (RLIMIT_CPU) e
+# prazo total (CONVERTER_TIMEOUT). Um arquivo patológico derruba só o filho, nunca o worker web, e a
+# memória volta ao sistema quando o filho é reciclado (a cada CONVERTER_MAX_JOBS conversões).
+CONVERTER_SANDBOX = os.getenv('CONVERTER_SANDBOX', '1') == '1'
+CONVERTER_POOL_SIZE = int(os.getenv('CONVERTER_POOL_SIZE', '2'))
+CONVERTER_MAX_JOBS = int(os.getenv('CONVERTER_MAX_JOBS', '20'))
+CONVERTER_MEM_MB = int(os.getenv('CONVERTER_MEM_MB', '512'))
+CONVERTER_CPU_SECONDS = int(os.getenv('CONVERTER_CPU_SECONDS', '30'))
+CONVERTER_TIMEOUT = int(os.getenv('CONVERTER_TIMEOUT', '60'))
+
+try:
+    import resource
+except ImportError:  # Windows: sem limites por processo
+    resource = None
+
+
+def _sandbox_child(conn):
+    """Laço do processo conversor: recebe (função, args), executa sob limites e devolve (ok, erro)."""
+    import signal
+    # Sinais do gunicorn não valem aqui: o pai controla o ciclo de vida do filho
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None:
+        try:
+            herdado = 0
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmSize:'):
+                        herdado = int(line.split()[1]) * 1024
+            limite = herdado + CONVERTER_MEM_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+        except (OSError, ValueError) as e:
+            print(f'[CONVERSOR] Sem limite de memória: {e}')
+    while True:
+        try:
+            func, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        if resource is not None:
+            # RLIMIT_CPU é cumulativo: o limite de cada conversão é o consumo atual + CONVERTER_CPU_SECONDS
+            uso = resource.getrusage(resource.RUSAGE_SELF)
+            cpu = int(uso.ru_utime + uso.ru_stime) + CONVERTER_CPU_SECONDS
+            try:
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+            except (OSError, ValueError):
+                pass
+        try:
+            func(*args)
+            conn.send((True, None))
+        except MemoryError:
+            conn.send((False, f'Memória insuficiente para converter o arquivo (limite {CONVERTER_MEM_MB} MB).'))
+        except Exception as e:
+            conn.send((False, str(e) or e.__class__.__name__))
+
+
+class _SandboxWorker:
+    def __init__(self):
+        import multiprocessing
+        ctx = multiprocessing.get_context('fork')
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_sandbox_child, args=(child_conn,), name='conversor-pdf', daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(1)
+
+
+class ConverterSandbox:
+    """Pool de processos conversores por processo web (criados sob demanda, reciclados após `max_jobs`)."""
+
+    def __init__(self, size: int, max_jobs: int):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self._idle = None
+        self._created = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> _SandboxWorker:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = queue.Queue()
+                self._created = 0
+                self._pid = os.getpid()
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                return _SandboxWorker()
+        try:
+            return self._idle.get(timeout=CONVERTER_TIMEOUT)
+        except queue.Empty:
+            raise ConversaoTransitoria('Conversores ocupados; tente novamente em instantes.')
+
+    def _release(self, worker: _SandboxWorker, reutilizavel: bool):
+        if reutilizavel and worker.jobs < self.max_jobs and worker.proc.is_alive():
+            self._idle.put(worker)
+            return
+        worker.stop()
+        try:
+            self._idle.put(_SandboxWorker())
+        except Exception as e:
+            print(f'[CONVERSOR] Falha ao repor processo conversor: {e}')
+            with self._lock:
+                self._created -= 1
+
+    def run(self, func, *args):
+        """Executa `func(*args)` num processo conversor; levanta RuntimeError em falha, limite ou prazo."""
+        worker = self._acquire()
+        reutilizavel = False
+        try:
+            worker.jobs += 1
+            worker.conn.send((func, args))
+            if not worker.conn.poll(CONVERTER_TIMEOUT):
+                raise RuntimeError(f'Conversão excedeu {CONVERTER_TIMEOUT}s e foi interrompida.')
+            try:
+                ok, erro = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.proc.join(1)
+                raise RuntimeError(f'Processo conversor encerrado (código {worker.proc.exitcode}); '
+                                   'o arquivo excedeu os limites de memória/CPU?')
+            reutilizavel = True
+            if not ok:
+                raise RuntimeError(erro)
+        finally:
+            self._release(worker, reutilizavel)
+
+    def close(self):
+        if self._pid != os.getpid() or self._idle is None:
+            return
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+CONVERTER_POOL = ConverterSandbox(CONVERTER_POOL_SIZE, CONVERTER_MAX_JOBS)
+atexit.register(CONVERTER_POOL.close)
+
+def run_converter(func, *args):
+    """Roda um conversor ReportLab isolado (CONVERTER_SANDBOX=1) ou no próprio processo."""
+    if CONVERTER_SANDBOX:
+        return CONVERTER_POOL.run(func, *args)
+    return func(*args)
+
+def convert_to_pdf(input_path: str, out_pdf_path: str) -> str:
+    """Converte um arquivo suportado para PDF em `out_pdf_path`.
+
+    Office: LibreOffice e, na falta dele, os fallbacks ReportLab; imagens, texto e CSV: ReportLab.
+    O PDF é gerado em arquivo temporário e movido com os.replace, então leitores concorrentes
+    nunca veem um PDF pela metade. Levanta exceção se o formato não for suportado ou a conversão falhar.
+    """
+    import shutil, tempfile
+    ext = os.path.splitext(input_path)[1].lower()
+    if ext not in PDF_CONVERTIBLE_EXTS:
+        raise ValueError(f'O formato {ext or "(sem extensão)"} não é convertido automaticamente.')
+    out_dir = os.path.dirname(out_pdf_path)
+    work_dir = tempfile.mkdtemp(prefix='conv_', dir=out_dir)
+    try:
+        tmp_pdf = os.path.join(work_dir, 'out.pdf')
+        if ext in OFFICE_EXTS:
+            ok, lo_pdf = try_libreoffice_convert(input_path, work_dir)
+            if ok and lo_pdf and os.path.exists(lo_pdf):
+                tmp_pdf = lo_pdf
+            elif ext == '.docx':
+                run_converter(docx_to_pdf_reportlab, input_path, tmp_pdf)
+            elif ext in ('.xlsx', '.xls'):
+                run_converter(excel_to_pdf_reportlab, input_path, tmp_pdf)
+            elif shutil.which('soffice'):
+                raise ConversaoTransitoria('O LibreOffice não conseguiu converter o arquivo agora; tente novamente.')
+            else:
+                raise RuntimeError('Converter este formato requer LibreOffice no servidor.')
+        elif ext in IMAGE_EXTS:
+            run_converter(image_to_pdf_reportlab, input_path, tmp_pdf)
+        elif ext == '.txt':
+            run_converter(text_to_pdf_reportlab, input_path, tmp_pdf)
+        else:
+            run_converter(csv_to_pdf_reportlab, input_path, tmp_pdf)
+        os.replace(tmp_pdf, out_pdf_path)
+        return out_pdf_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# Admissão de conversões: no máximo CONVERSION_MAX_CONCURRENT simultâneas no servidor (vagas em
+# static/previews/.vagas/vaga_<n>.lock, compartilhadas por todos os processos; fora de .locks, que a limpeza
+# do cache varre, para que o arquivo de cada vaga nunca seja recriado). Quem espera é atendido
+# pela fila de maior prioridade (preview > download > pré-geração) e, dentro dela, em rodízio entre
+# usuários: 30 reenvios de um docente não passam na frente do primeiro pedido de outro usuário.
+# A ordem vale entre processos: cada espera tem um bilhete em conversao_espera (migração 0016) e só
+# o primeiro bilhete vivo disputa as vagas; sem banco, a disputa pelas vagas é por ordem de chegada.
+CONVERSION_MAX_CONCURRENT = int(os.getenv('CONVERSION_MAX_CONCURRENT', '2'))
+CONVERSION_ADMISSION_TIMEOUT = int(os.getenv('CONVERSION_ADMISSION_TIMEOUT', '120'))
+CONVERSION_ESPERA_VIDA = 5  # s sem renovar o bilhete até ele deixar de contar (processo morto)
+CONVERSION_PRIORIDADES = {'preview': 10, 'download': 5, 'background': 0}  # também a prioridade em conversao_job
+
+
+class ConversionAdmission:
+    """Controle de admissão: limite de conversões ativas, filas por prioridade e rodízio por usuário.
+
+    Dentro do processo a ordem é decidida em memória; entre processos, pela fila global em conversao_espera.
+    """
+
+    def __init__(self, limite: int, filas):
+        self.limite = max(1, limite)
+        self.filas = tuple(filas)  # em ordem de prioridade
+        self._lock = threading.Lock()
+        self._ativos = 0
+        self._espera = {f: OrderedDict() for f in self.filas}  # fila -> usuário -> deque[Event]
+        self.stats = {f: {'admitidas': 0, 'espera_total': 0.0, 'espera_max': 0.0, 'recusadas': 0} for f in self.filas}
+
+    def _proximo(self):
+        for fila in self.filas:
+            usuarios = self._espera[fila]
+            if usuarios:
+                usuario, eventos = next(iter(usuarios.items()))
+                ev = eventos.popleft()
+                if eventos:
+                    usuarios.move_to_end(usuario)  # próximo pedido deste usuário vai para o fim do rodízio
+                else:
+                    del usuarios[usuario]
+                return ev
+        return None
+
+    @staticmethod
+    def _fila_global(sql: str, params=None):
+        """Um passo da fila global numa conexão emprestada só para ele (a espera não prende o pool)."""
+        conn = _borrow_db_connection()
+        if conn is None:
+            raise ConnectionError('Falha ao conectar ao banco.')
+        try:
+            cur = conn.execute(sql, params)
+            row = cur.fetchone() if cur.description else None
+            conn.commit()
+            return row
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _vaga_servidor(self, prazo: float, prioridade: int = 0, usuario=None):
+        """Vaga entre processos (flock não bloqueante em uma das N travas), na vez do bilhete; None se o prazo acabar."""
+        if not fcntl:
+            return True
+        lock_dir = os.path.join(ensure_previews_dir(), '.vagas')
+        os.makedirs(lock_dir, exist_ok=True)
+        bilhete = None
+        try:
+            bilhete = self._fila_global("""
+                WITH limpeza AS (DELETE FROM conversao_espera WHERE visto_em < now() - interval '1 minute')
+                INSERT INTO conversao_espera (prioridade, id_usuario) VALUES (%s, %s) RETURNING id
+            """, (prioridade, usuario))[0]
+        except Exception as e:
+            print(f'[CONVERSAO] Fila global indisponível; vagas por ordem de chegada: {e}')
+        try:
+            while True:
+                vez = True
+                if bilhete is not None:
+                    try:
+                        # Renova o bilhete e vê quem é o primeiro entre os vivos
+                        vez = self._fila_global("""
+                            WITH renova AS (UPDATE conversao_espera SET visto_em = now() WHERE id = %(id)s)
+                            SELECT e.id = %(id)s
+                            FROM conversao_espera e
+                            LEFT JOIN conversao_servido s ON s.usuario = COALESCE(e.id_usuario, 0)
+                            WHERE e.id = %(id)s OR e.visto_em > now() - make_interval(secs => %(vida)s)
+                            ORDER BY e.prioridade DESC, s.servido_em NULLS FIRST, e.id
+                            LIMIT 1
+                        """, {'id': bilhete, 'vida': CONVERSION_ESPERA_VIDA})[0]
+                    except Exception as e:
+                        print(f'[CONVERSAO] Fila global indisponível; vagas por ordem de chegada: {e}')
+                        vez = True
+                if vez:
+                    for i in range(self.limite):
+                        f = open(os.path.join(lock_dir, f'vaga_{i}.lock'), 'a')
+                        try:
+                            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except OSError:
+                            f.close()
+                            continue
+                        if bilhete is not None:
+                            # Sai da fila e marca o usuário como recém-servido (vai para o fim do rodízio)
+                            try:
+                                self._fila_global("""
+                                    WITH saida AS (DELETE FROM conversao_espera WHERE id = %s RETURNING id_usuario)
+                                    INSERT INTO conversao_servido (usuario, servido_em)
+                                    SELECT COALESCE(id_usuario, 0), now() FROM saida
+                                    ON CONFLICT (usuario) DO UPDATE SET servido_em = EXCLUDED.servido_em
+                                """, (bilhete,))
+                                bilhete = None
+                            except Exception as e:
+                                print(f'[CONVERSAO] Falha ao registrar o atendimento: {e}')
+                        return f
+                if time.monotonic() >= prazo:
+                    return None
+                time.sleep(0.2 if bilhete is not None else 0.1)
+        finally:
+            if bilhete is not None:
+                try:
+                    self._fila_global("DELETE FROM conversao_espera WHERE id = %s", (bilhete,))
+                except Exception:
+                    pass  # sem renovação, o bilhete deixa de contar em CONVERSION_ESPERA_VIDA s
+
+    def acquire(self, fila: str, usuario=None, timeout: float = CONVERSION_ADMISSION_TIMEOUT):
+        """Espera a vez da conversão; devolve o token a passar para release(). ConversaoTransitoria se o prazo acabar."""
+        fila = fila if fila in self._espera else self.filas[-1]
+        inicio = time.monotonic()
+        ev = None
+        with self._lock:
+            if self._ativos < self.limite and not any(self._espera.values()):
+                self._ativos += 1
+            else:
+                ev = threading.Event()
+                self._espera[fila].setdefault(usuario, deque()).append(ev)
+        if ev is not None and not ev.wait(timeout):
+            with self._lock:
+                if not ev.is_set():
+                    eventos = self._espera[fila].get(usuario)
+                    eventos.remove(ev)
+                    if not eventos:
+                        del self._espera[fila][usuario]
+                    self.stats[fila]['recusadas'] += 1
+                    raise ConversaoTransitoria('Muitas conversões em andamento; tente novamente em instantes.')
+        vaga = self._vaga_servidor(inicio + timeout, CONVERSION_PRIORIDADES.get(fila, 0), usuario)
+        if vaga is None:
+            self.release(None)
+            with self._lock:
+                self.stats[fila]['recusadas'] += 1
+            raise ConversaoTransitoria('Muitas conversões em andamento; tente novamente em instantes.')
+        espera = time.monotonic() - inicio
+        with self._lock:
+            st = self.stats[fila]
+            st['admitidas'] += 1
+            st['espera_total'] += espera
+            st['espera_max'] = max(st['espera_max'], espera)
+        return vaga
+
+    def release(self, vaga):
+        if vaga is not None and vaga is not True:
+            vaga.close()  # fechar o arquivo libera o flock
+        with self._lock:
+            ev = self._proximo()
+            if ev is not None:
+                ev.set()  # a vaga passa direto para o próximo da fila
+            else:
+                self._ativos -= 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            filas = {}
+            for fila in self.filas:
+                st = self.stats[fila]
+                filas[fila] = {
+                    'profundidade': sum(len(e) for e in self._espera[fila].values()),
+                    'usuarios_esperando': len(self._espera[fila]),
+                    'admitidas': st['admitidas'],
+                    'recusadas': st['recusadas'],
+                    'espera_media_ms': round(st['espera_total'] / st['admitidas'] * 1000, 1) if st['admitidas'] else None,
+                    'espera_max_ms': round(st['espera_max'] * 1000, 1),
+                }
+            return {'limite': self.limite, 'ativos': self._ativos, 'filas': filas}
+
+
+CONVERSION_ADMISSION = ConversionAdmission(CONVERSION_MAX_CONCURRENT, CONVERSION_PRIORIDADES)
+
+def ensure_preview_pdf(full_path: str, fila: str = 'preview', usuario=None) -> str:
+    """Retorna o PDF em cache para o conteúdo de `full_path`, convertendo se ainda não existir.
+
+    Uma conversão por chave: as threads do processo esperam num Lock e os demais processos num
+    flock em static/previews/.locks; quem esperava encontra o PDF pronto (ou a falha recente).
+    A conversão em si passa pela admissão (`fila`/`usuario`, ver CONVERSION_ADMISSION).
+    """
+    preview_dir, preview_name, preview_path = preview_cache_location(full_path)
+    if os.path.exists(preview_path):
+        return preview_path
+    with _preview_locks_guard:
+        entry = _preview_locks.setdefault(preview_name, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            lock_dir = os.path.join(preview_dir, '.locks')
+            os.makedirs(lock_dir, exist_ok=True)
+            with open(os.path.join(lock_dir, preview_name + '.lock'), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                if os.path.exists(preview_path):
+                    return preview_path
+                erro = PREVIEW_FALHAS.get(preview_name)
+                if erro:
+                    raise RuntimeError(erro)
+                vaga = CONVERSION_ADMISSION.acquire(fila, usuario)
+                try:
+                    convert_to_pdf(full_path, preview_path)
+                except Exception as e:
+                    PREVIEW_FALHAS.set(preview_name, str(e) or e.__class__.__name__)
+                    raise
+                finally:
+                    CONVERSION_ADMISSION.release(vaga)
+                _preview_stat('conversoes')
+        maybe_sweep_preview_cache()
+        return preview_path
+    finally:
+        with _preview_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _preview_locks.pop(preview_name, None)
+
+# Limite do cache de previews: cota em bytes com despejo LRU (o mtime do PDF marca o último acesso,
+# atualizado com os.utime nos acertos) e limpeza de órfãos: PDFs cujo hash não é mais de nenhuma
+# publicação (excluída ou reenviada), de versões antigas do conversor, do formato preview_pub_<id>
+# e temporários de conversões interrompidas. Contadores são por processo.
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv('PREVIEW_CACHE_MAX_MB', '200')) * 1024 * 1024
+PREVIEW_DISK_RESERVE_BYTES = int(os.getenv('PREVIEW_DISK_RESERVE_MB', '100')) * 1024 * 1024
+PREVIEW_SWEEP_INTERVAL = int(os.getenv('PREVIEW_SWEEP_INTERVAL', '300'))
+PREVIEW_ORPHAN_INTERVAL = int(os.getenv('PREVIEW_ORPHAN_INTERVAL', '3600'))
+PREVIEW_TOUCH_INTERVAL = 60  # no máximo um utime por minuto para o mesmo PDF
+PREVIEW_TEMP_MAX_AGE = 3600
+PREVIEW_CACHE_NAME_RE = re.compile(r'^([0-9a-f]{64})\.(\w+)\.pdf$')
+PREVIEW_STATS = {'hits': 0, 'misses': 0, 'conversoes': 0, 'despejos': 0, 'bytes_despejados': 0, 'orfaos_removidos': 0}
+_preview_stats_lock = threading.Lock()
+_preview_sweep_state = {'proxima': 0.0, 'proxima_orfaos': 0.0, 'rodando': False}
+
+def _preview_stat(nome: str, n: int = 1):
+    with _preview_stats_lock:
+        PREVIEW_STATS[nome] += n
+
+def preview_cache_lookup(preview_path: str) -> bool:
+    """True se o PDF está em cache (marca o acesso para o LRU); conta acerto/falta."""
+    try:
+        st = os.stat(preview_path)
+    except OSError:
+        _preview_stat('misses')
+        return False
+    _preview_stat('hits')
+    if time.time() - st.st_mtime > PREVIEW_TOUCH_INTERVAL:
+        try:
+            os.utime(preview_path)
+        except OSError:
+            pass
+    return True
+
+def _preview_hashes_vivos() -> set:
+    """Hashes dos arquivos das publicações existentes (do índice arquivo_upload ou calculados)."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    cur = conn.cursor(row_factory=dict_row)
+    try:
+        # Hash já indexado em arquivo_upload; só os arquivos fora do índice são lidos do disco
+        cur.execute("""
+            SELECT p.nome_arquivo, p.arquivo,
+                   (SELECT a.sha256 FROM arquivo_upload a WHERE a.caminho = p.nome_arquivo) AS sha256
+            FROM publicacao p
+            WHERE p.nome_arquivo IS NOT NULL OR p.arquivo IS NOT NULL
+        """)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    vivos = set()
+    for row in rows:
+        if row['sha256']:
+            vivos.add(row['sha256'])
+            continue
+        path = find_publicacao_file(row)
+        try:
+            if path and os.path.isfile(path):
+                vivos.add(file_sha256(path))
+        except OSError:
+            pass
+    return vivos
+
+def sweep_preview_cache(orfaos: bool = False) -> dict:
+    """Aplica a cota (e, com `orfaos`, remove PDFs órfãos). Um processo por vez; retorna o resumo."""
+    import shutil
+    preview_dir = ensure_previews_dir()
+    lock_dir = os.path.join(preview_dir, '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    resumo = {'removidos': 0, 'bytes': 0, 'orfaos': 0}
+    with open(os.path.join(lock_dir, 'sweep.lock'), 'a') as lock_file:
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return resumo  # outro processo já está limpando
+        agora = time.time()
+        vivos = _preview_hashes_vivos() if orfaos else None
+        versao = preview_conversor_id()
+        entradas = []
+        for entry in os.scandir(preview_dir):
+            try:
+                st = entry.stat()
+                if entry.is_dir():
+                    # Pastas temporárias de conversões interrompidas (inclui o PDF do LibreOffice)
+                    if entry.name.startswith('conv_') and agora - st.st_mtime > PREVIEW_TEMP_MAX_AGE:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                m = PREVIEW_CACHE_NAME_RE.match(entry.name)
+                orfao = (
+                    entry.name.startswith('preview_pub_')
+                    or (m is not None and m.group(2) != versao)
+                    or (m is not None and vivos is not None and m.group(1) not in vivos)
+                )
+                if orfao and agora - st.st_mtime > PREVIEW_TEMP_MAX_AGE:
+                    os.remove(entry.path)
+                    resumo['orfaos'] += 1
+                    resumo['bytes'] += st.st_size
+                elif m is not None:
+                    entradas.append((st.st_mtime, st.st_size, entry.path))
+            except OSError:
+                continue
+        if orfaos:
+            # Travas de single-flight de PDFs que já saíram do cache. Só apaga com o flock em mãos (ninguém
+            # convertendo) e antes de soltá-lo; sweep.lock e as vagas de conversão nunca são apagados.
+            for entry in os.scandir(lock_dir):
+                if not entry.name.endswith('.pdf.lock') or os.path.exists(os.path.join(preview_dir, entry.name[:-5])):
+                    continue
+                try:
+                    if agora - entry.stat().st_mtime <= 86400:
+                        continue
+                    with open(entry.path, 'a') as f:
+                        if fcntl:
+                            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(entry.path)
+                except OSError:
+                    pass  # em uso: fica para a próxima limpeza
+        # Cota: o menor entre PREVIEW_CACHE_MAX_MB e o que cabe deixando PREVIEW_DISK_RESERVE_MB livres no disco
+        total = sum(size for _, size, _ in entradas)
+        limite = PREVIEW_CACHE_MAX_BYTES
+        try:
+            livre = shutil.disk_usage(preview_dir).free
+            limite = min(limite, max(0, total + livre - PREVIEW_DISK_RESERVE_BYTES))
+        except OSError:
+            pass
+        entradas.sort()
+        for _, size, path in entradas:
+            if total <= limite:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            resumo['removidos'] += 1
+            resumo['bytes'] += size
+    _preview_stat('despejos', resumo['removidos'])
+    _preview_stat('orfaos_removidos', resumo['orfaos'])
+    _preview_stat('bytes_despejados', resumo['bytes'])
+    return resumo
+
+def maybe_sweep_preview_cache():
+    """Dispara a limpeza numa thread de fundo se o intervalo passou (chamado após cada conversão)."""
+    agora = time.time()
+    with _preview_stats_lock:
+        st = _preview_sweep_state
+        if st['rodando'] or agora < st['proxima']:
+            return
+        st['rodando'] = True
+        st['proxima'] = agora + PREVIEW_SWEEP_INTERVAL
+        orfaos = agora >= st['proxima_orfaos']
+        if orfaos:
+            st['proxima_orfaos'] = agora + PREVIEW_ORPHAN_INTERVAL
+
+    def _run():
+        try:
+            sweep_preview_cache(orfaos=orfaos)
+        except Exception as e:
+            print(f'[PREVIEW] Falha na limpeza do cache: {e}')
+        finally:
+            with _preview_stats_lock:
+                _preview_sweep_state['rodando'] = False
+
+    threading.Thread(target=_run, name='preview-sweep', daemon=True).start()
+
+def preview_cache_stats() -> dict:
+    """Contadores do processo + ocupação atual da pasta de previews."""
+    import shutil
+    preview_dir = ensure_previews_dir()
+    arquivos = 0
+    usados = 0
+    for entry in os.scandir(preview_dir):
+        if entry.is_file() and PREVIEW_CACHE_NAME_RE.match(entry.name):
+            try:
+                usados += entry.stat().st_size
+                arquivos += 1
+            except OSError:
+                pass
+    with _preview_stats_lock:
+        out = dict(PREVIEW_STATS)
+    consultas = out['hits'] + out['misses']
+    out.update({
+        'taxa_acerto': round(out['hits'] / consultas, 4) if consultas else None,
+        'arquivos': arquivos,
+        'bytes_usados': usados,
+        'bytes_cota': PREVIEW_CACHE_MAX_BYTES,
+        'pid': os.getpid(),
+    })
+    try:
+        out['bytes_livres_disco'] = shutil.disk_usage(preview_dir).free
+    except OSError:
+        pass
+    return out
+
+def send_error_pdf(title: str, message: str, **send_kwargs):
+    """Gera em memória um PDF explicando o problema e o envia (nunca vai para o cache de previews)."""
+    buf = io.BytesIO()
+    try:
+        make_error_pdf(buf, title, message)
+    except Exception:
+        # Último recurso: PDF mínimo
+        from reportlab.platypus import SimpleDocTemplate, Paragraph
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        buf = io.BytesIO()
+        doc = SimpleDocTemplate(buf, pagesize=A4)
+        doc.build([Paragraph(message, getSampleStyleSheet()['Normal'])])
+    buf.seek(0)
+    return send_file(buf, mimetype='application/pdf', **send_kwargs)
+
+# Entrega de arquivos: `direct` (o próprio worker envia os bytes) ou delegada ao servidor web na frente
+# do gunicorn. O app autoriza, audita e devolve só o cabeçalho de redirecionamento interno; o nginx
+# (`x-accel`, X-Accel-Redirect) ou Apache/lighttpd (`x-sendfile`, X-Sendfile) envia o arquivo com
+# sendfile, sem ocupar o worker. Exemplo de configuração em deploy/nginx.conf.
+FILE_DELIVERY = os.getenv('FILE_DELIVERY', 'direct').lower()
+if FILE_DELIVERY not in ('direct', 'x-accel', 'x-sendfile'):
+    print(f'[DELIVERY] FILE_DELIVERY inválido ({FILE_DELIVERY}); usando direct.')
+    FILE_DELIVERY = 'direct'
+# Locations `internal` do nginx que apontam (alias) para as pastas de uploads e de previews
+FILE_DELIVERY_LOCATIONS = (
+    (app.config['UPLOAD_FOLDER'], os.getenv('FILE_DELIVERY_UPLOADS_URI', '/_protected/uploads/')),
+    (PREVIEW_FOLDER, os.getenv('FILE_DELIVERY_PREVIEWS_URI', '/_protected/previews/')),
+)
+
+def internal_redirect_uri(path: str):
+    """URI interna do nginx para o arquivo, ou None se estiver fora das pastas mapeadas."""
+    from urllib.parse import quote
+    path = os.path.abspath(path)
+    for pasta, uri in FILE_DELIVERY_LOCATIONS:
+        pasta = os.path.abspath(pasta)
+        if os.path.commonpath([path, pasta]) == pasta and path != pasta:
+            rel = os.path.relpath(path, pasta).replace(os.sep, '/')
+            return uri.rstrip('/') + '/' + quote(rel)
+    return None
+
+def _send_file_offload(path: str, etag: str, **send_kwargs):
+    """Resposta sem corpo com X-Accel-Redirect/X-Sendfile; None se o modo não se aplica ao arquivo."""
+    uri = None
+    if FILE_DELIVERY == 'x-accel':
+        uri = internal_redirect_uri(path)
+        if uri is None:
+            return None
+    from werkzeug.utils import send_file as wz_send_file
+    resp = wz_send_file(path, request.environ, use_x_sendfile=True, response_class=app.response_class,
+                        etag=etag, conditional=False, **send_kwargs)
+    # O 304 continua no app (ETag forte); Range/If-Range ficam com o servidor web, que tem os bytes.
+    resp.make_conditional(request.environ, accept_ranges=False)
+    destino = resp.headers.pop('X-Sendfile', None)
+    if resp.status_code == 200:
+        if FILE_DELIVERY == 'x-accel':
+            resp.headers['X-Accel-Redirect'] = uri
+        else:
+            resp.headers['X-Sendfile'] = destino
+        # O corpo vem do servidor web; o Content-Length do upstream seria o de uma resposta vazia
+        resp.content_length = 0
+    return resp
+
+def send_file_conditional(path: str, **send_kwargs):
+    """Envia um arquivo com ETag forte (sha256 do conteúdo) e Last-Modified.
+
+    O Werkzeug responde 304 a If-None-Match/If-Modified-Since e 206 a Range (um intervalo; If-Range
+    respeitado), com Accept-Ranges e Content-Length/Content-Range corretos: não sobrescrever à mão.
+    `private, no-cache`: o navegador guarda, mas revalida (rotas autenticadas).
+    Com FILE_DELIVERY=x-accel/x-sendfile o servidor web envia o arquivo (ver _send_file_offload).
+    """
+    etag = file_sha256(path)
+    resp = None
+    if FILE_DELIVERY != 'direct':
+        resp = _send_file_offload(path, etag, **send_kwargs)
+    if resp is None:
+        resp = send_file(path, etag=etag, conditional=True, **send_kwargs)
+    resp.headers['Accept-Ranges'] = 'bytes'
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    resp.cache_control.public = False
+    return resp
+
+def is_download_start(resp) -> bool:
+    """Resposta que inicia um download (200 ou 206 a partir do byte 0): retomadas, 304 e
+    leituras parciais de visualizadores não contam como novo download."""
+    offload = 'X-Accel-Redirect' in resp.headers or 'X-Sendfile' in resp.headers
+    if resp.status_code == 200 and not offload:
+        return True
+    if resp.status_code in (200, 206) and request.range and request.range.ranges:
+        # Delegado ao servidor web, o Range é atendido por ele: a resposta do app é sempre 200
+        return request.range.ranges[0][0] == 0
+    return resp.status_code == 200
+
+# Fila de conversão (CONVERSION_MODE=queue): as rotas enfileiram em conversao_job e respondem 202;
+# os processos de `python app.py --conversion-worker` convertem fora dos workers web.
+CONVERSION_MODE = os.getenv('CONVERSION_MODE', 'inline').lower()
+CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', '2'))
+CONVERSION_POLL_INTERVAL = float(os.getenv('CONVERSION_POLL_INTERVAL', '5'))
+CONVERSION_JOB_TIMEOUT = int(os.getenv('CONVERSION_JOB_TIMEOUT', '300'))
+# Falha transitória: o job volta à fila após CONVERSION_RETRY_BASE × 2^(tentativa-1) s (até CONVERSION_RETRY_MAX),
+# por no máximo CONVERSION_MAX_TENTATIVAS tentativas. Um erro definitivo só é reaproveitado por CONVERSION_ERRO_TTL s.
+CONVERSION_MAX_TENTATIVAS = int(os.getenv('CONVERSION_MAX_TENTATIVAS', '5'))
+CONVERSION_RETRY_BASE = int(os.getenv('CONVERSION_RETRY_BASE', '15'))
+CONVERSION_RETRY_MAX = int(os.getenv('CONVERSION_RETRY_MAX', '600'))
+CONVERSION_ERRO_TTL = int(os.getenv('CONVERSION_ERRO_TTL', '600'))
+
+def conversao_transitoria(e: Exception) -> bool:
+    """Falhas que passam sozinhas: repetir o job em vez de marcá-lo como erro."""
+    return isinstance(e, (ConversaoTransitoria, psycopg.OperationalError, ConnectionError, TimeoutError))
+
+def enqueue_conversao(id_publicacao: int, fila: str = 'preview', conn=None, usuario=None) -> dict:
+    """Enfileira a conversão da publicação (no máximo um job ativo por publicação).
+
+    A prioridade vem da fila (CONVERSION_PRIORIDADES). Se já existe job pendente/em andamento,
+    reaproveita-o e eleva a prioridade se preciso. Retorna {'id', 'status'} do job.
+    """
+    prioridade = CONVERSION_PRIORIDADES.get(fila, 0)
+    conn = conn or get_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    try:
+        cur = conn.cursor(row_factory=dict_row)
+        cur.execute("""
+            INSERT INTO conversao_job (id_publicacao, prioridade, id_usuario)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (id_publicacao) WHERE status IN ('pendente', 'processando')
+            DO UPDATE SET prioridade = GREATEST(conversao_job.prioridade, EXCLUDED.prioridade),
+                          id_usuario = COALESCE(conversao_job.id_usuario, EXCLUDED.id_usuario)
+            RETURNING id, status
+        """, (id_publicacao, prioridade, usuario))
+        job = cur.fetchone()
+        cur.execute("SELECT pg_notify('conversao_job', %s)", (str(job['id']),))
+        conn.commit()
+        cur.close()
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+
+def request_conversao(id_publicacao: int, full_path: str, fila: str = 'preview', usuario=None) -> dict:
+    """Job de conversão para a versão atual do arquivo: reaproveita um erro recente (sem reenfileirar
+    em loop) ou enfileira um novo job."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Falha ao conectar ao banco.')
+    cur = conn.cursor(row_factory=dict_row)
+    cur.execute("""
+        SELECT id, status, erro, concluido_em
+        FROM conversao_job
+        WHERE id_publicacao = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """, (id_publicacao,))
+    last = cur.fetchone()
+    cur.close()
+    if last and last['status'] == 'erro' and last['concluido_em']:
+        # Erro recente do mesmo arquivo: responde com ele (sem reenfileirar em loop) só por CONVERSION_ERRO_TTL
+        try:
+            concluido = last['concluido_em'].timestamp()
+            if concluido >= os.path.getmtime(full_path) and time.time() - concluido < CONVERSION_ERRO_TTL:
+                return last
+        except OSError:
+            pass
+    return enqueue_conversao(id_publicacao, fila, conn=conn, usuario=usuario)
+
+def conversao_aceita_response(job: dict):
+    """Resposta 202 para uma conversão em andamento: JSON para clientes de API; para navegação
+    (iframe/aba), uma página que consulta o status e recarrega quando o PDF fica pronto."""
+    status_url = url_for('api_conversao_status', job_id=job['id'])
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    if best == 'application/json':
+        resp = jsonify({'job_id': job['id'], 'status': job['status'], 'status_url': status_url})
+    else:
+        resp = make_response(f"""<!doctype html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>Gerando PDF...</title></head>
+<body style="font-family:sans-serif;color:#334155;padding:12px">
+<div id="msg">Gerando PDF, aguarde...</div>
+<script>
+(function poll(){{
+  fetch({json.dumps(status_url)}, {{headers: {{'Accept': 'application/json'}}}})
+    .then(r => r.json())
+    .then(j => {{
+      if (j.status === 'concluido' || j.status === 'erro') {{ location.reload(); return; }}
+      setTimeout(poll, 1000);
+    }})
+    .catch(() => setTimeout(poll, 3000));
+}})();
+</script>
+</body></html>""")
+    resp.status_code = 202
+    resp.headers['Location'] = status_url
+    resp.headers['Retry-After'] = '1'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+@app.route('/api/conversao/<int:job_id>', methods=['GET'])
+@login_required
+def api_conversao_status(job_id):
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Falha ao conectar ao banco.'}), 500
+    cur = conn.cursor(row_factory=dict_row)
+    cur.execute("SELECT id, id_publicacao, status, erro FROM conversao_job WHERE id = %s", (job_id,))
+    job = cur.fetchone()
+    cur.close()
+    if not job:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+    out = {'job_id': job['id'], 'status': job['status']}
+    if job['status'] == 'concluido':
+        out['preview_url'] = url_for('preview_pdf_publicacao', id_publicacao=job['id_publicacao'])
+        out['download_url'] = url_for('download_pdf_publicacao', id_publicacao=job['id_publicacao'])
+    elif job['status'] == 'erro':
+        out['erro'] = job['erro']
+    return jsonify(out)
+
+def fila_da_prioridade(prioridade: int) -> str:
+    for fila, p in CONVERSION_PRIORIDADES.items():  # em ordem decrescente de prioridade
+        if prioridade >= p:
+            return fila
+    return 'background'
+
+def process_conversao_job(conn, job_id: int, id_publicacao: int, fila: str = 'preview', usuario=None):
+    """Executa um job reivindicado: converte para o caminho de preview e registra o resultado."""
+    cur = conn.cursor(row_factory=dict_row)
+    try:
+        cur.execute("SELECT nome_arquivo, arquivo FROM publicacao WHERE id_publicacao = %s", (id_publicacao,))
+        row = cur.fetchone()
+        if not row:
+            raise RuntimeError('Publicação não encontrada.')
+        full_path = find_publicacao_file(row)
+        if not os.path.exists(full_path):
+            raise RuntimeError('Arquivo da publicação não encontrado.')
+        ensure_preview_pdf(full_path, fila, usuario)
+        # Reenvio durante a conversão: o job foi reaproveitado pelo novo upload, então converte de novo
+        cur.execute("SELECT nome_arquivo, arquivo FROM publicacao WHERE id_publicacao = %s", (id_publicacao,))
+        atual = cur.fetchone()
+        if atual and find_publicacao_file(atual) != full_path:
+            cur.execute("UPDATE conversao_job SET status = 'pendente' WHERE id = %s", (job_id,))
+            return
+        cur.execute("UPDATE conversao_job SET status = 'concluido', concluido_em = now(), erro = NULL WHERE id = %s", (job_id,))
+    except Exception as e:
+        if conversao_transitoria(e):
+            # Volta à fila com espera exponencial; esgotadas as tentativas, vira erro
+            cur.execute("""
+                UPDATE conversao_job SET
+                    status = CASE WHEN tentativas < %(max)s THEN 'pendente' ELSE 'erro' END,
+                    concluido_em = CASE WHEN tentativas < %(max)s THEN NULL ELSE now() END,
+                    tentar_apos = now() + make_interval(secs => LEAST(%(teto)s, %(base)s * 2 ^ GREATEST(tentativas - 1, 0))),
+                    erro = %(erro)s
+                WHERE id = %(id)s
+            """, {'max': CONVERSION_MAX_TENTATIVAS, 'teto': CONVERSION_RETRY_MAX, 'base': CONVERSION_RETRY_BASE,
+                  'erro': str(e)[:1000], 'id': job_id})
+        else:
+            cur.execute("UPDATE conversao_job SET status = 'erro', concluido_em = now(), erro = %s WHERE id = %s", (str(e)[:1000], job_id))
+    finally:
+        cur.close()
+
+def conversion_worker_loop(stop_event=None):
+    """Laço de um processo conversor: reivindica jobs com FOR UPDATE SKIP LOCKED e espera NOTIFY."""
+    conn = _connect_direct()
+    conn.autocommit = True
+    conn.execute("LISTEN conversao_job")
+    next_maintenance = 0.0
+    print(f'[CONVERSAO] Worker {os.getpid()} iniciado.')
+    try:
+        while not (stop_event and stop_event.is_set()):
+            now = time.time()
+            if now >= next_maintenance:
+                next_maintenance = now + 60
+                # Jobs presos (processo morto no meio da conversão) voltam para a fila, até o limite de
+                # tentativas (um arquivo que derruba o conversor não volta para sempre); concluídos antigos são descartados
+                conn.execute("""
+                    UPDATE conversao_job SET
+                        status = CASE WHEN tentativas < %(max)s THEN 'pendente' ELSE 'erro' END,
+                        concluido_em = CASE WHEN tentativas < %(max)s THEN NULL ELSE now() END,
+                        erro = CASE WHEN tentativas < %(max)s THEN erro ELSE 'A conversão foi interrompida repetidas vezes.' END
+                    WHERE status = 'processando' AND iniciado_em < now() - make_interval(secs => %(timeout)s)
+                """, {'max': CONVERSION_MAX_TENTATIVAS, 'timeout': CONVERSION_JOB_TIMEOUT})
+                conn.execute("DELETE FROM conversao_job WHERE status IN ('concluido', 'erro') AND concluido_em < now() - interval '1 day'")
+            job = conn.execute("""
+                UPDATE conversao_job
+                SET status = 'processando', iniciado_em = now(), tentativas = tentativas + 1
+                WHERE id = (
+                    -- rodízio por usuário dentro da prioridade: atende o usuário servido há mais
+                    -- tempo (ou nunca) e, dele, o job mais antigo
+                    SELECT j.id
+                    FROM conversao_job j
+                    LEFT JOIN LATERAL (
+                        SELECT max(a.iniciado_em) AS ultimo
+                        FROM conversao_job a
+                        WHERE a.id_usuario IS NOT DISTINCT FROM j.id_usuario AND a.iniciado_em IS NOT NULL
+                    ) u ON true
+                    WHERE j.status = 'pendente' AND (j.tentar_apos IS NULL OR j.tentar_apos <= now())
+                    ORDER BY j.prioridade DESC, u.ultimo NULLS FIRST, j.id
+                    LIMIT 1
+                    FOR UPDATE OF j SKIP LOCKED
+                )
+                RETURNING id, id_publicacao, prioridade, id_usuario
+            """).fetchone()
+            if job:
+                process_conversao_job(conn, job[0], job[1], fila_da_prioridade(job[2]), job[3])
+                continue
+            # Fila vazia: dorme até um NOTIFY (ou o intervalo de segurança)
+            for _ in conn.notifies(timeout=CONVERSION_POLL_INTERVAL, stop_after=1):
+                pass
+    finally:
+        conn.close()
+
+def run_conversion_workers(n: int = CONVERSION_WORKERS):
+    """Sobe `n` processos conversores e os reinicia se morrerem (Ctrl+C/SIGTERM encerra todos)."""
+    import multiprocessing, signal
+    stop = multiprocessing.Event()
+    sinais = []
+
+    def _child(stop_event):
+        # Os filhos só encerram pelo evento, depois de terminar o job atual
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        conversion_worker_loop(stop_event)
+
+    def _spawn():
+        p = multiprocessing.Process(target=_child, args=(stop,), daemon=True)
+        p.start()
+        return p
+
+    # O handler só anota o sinal; o Event é acionado fora dele
+    signal.signal(signal.SIGTERM, lambda *_: sinais.append(1))
+    signal.signal(signal.SIGINT, lambda *_: sinais.append(1))
+    procs = [_spawn() for _ in range(max(1, n))]
+    while not sinais:
+        time.sleep(1)
+        for i, p in enumerate(procs):
+            if not p.is_alive() and not sinais:
+                print(f'[CONVERSAO] Worker {p.pid} saiu (código {p.exitcode}); reiniciando.')
+                procs[i] = _spawn()
+    stop.set()
+    for p in procs:
+        p.join(CONVERSION_POLL_INTERVAL + 5)
+        if p.is_alive():
+            p.terminate()
+
+# Pré-geração do preview logo após o upload, para a primeira visualização já encontrar o cache.
+# queue: job na fila 'background' (os workers atendem antes os pedidos interativos);
+# inline: uma única thread de fundo por processo, convertendo um arquivo por vez.
+_preview_bg_queue = queue.Queue()
+_preview_bg_pendentes = {}  # id_publicacao -> (caminho mais recente, usuário)
+_preview_bg_lock = threading.Lock()
+_preview_bg_state = {'pid': None, 'thread': None}
+
+def _preview_bg_run():
+    while True:
+        id_publicacao = _preview_bg_queue.get()
+        with _preview_bg_lock:
+            pendente = _preview_bg_pendentes.pop(id_publicacao, None)
+        if not pendente:
+            continue
+        full_path, usuario = pendente
+        try:
+            if os.path.exists(full_path):
+                ensure_preview_pdf(full_path, 'background', usuario)
+        except Exception as e:
+            print(f'[PREVIEW] Falha ao pré-gerar publicação {id_publicacao}: {e}')
+
+def schedule_preview(id_publicacao: int, full_path: str, conn=None, usuario=None):
+    """Agenda em segundo plano a geração do PDF de preview de uma publicação recém-enviada."""
+    ext = os.path.splitext(full_path)[1].lower()
+    if ext not in PDF_CONVERTIBLE_EXTS:
+        return
+    try:
+        if CONVERSION_MODE == 'queue':
+            enqueue_conversao(id_publicacao, 'background', conn=conn, usuario=usuario)
+            return
+        with _preview_bg_lock:
+            pid = os.getpid()
+            t = _preview_bg_state['thread']
+            if _preview_bg_state['pid'] != pid or t is None or not t.is_alive():
+                _preview_bg_state['pid'] = pid
+                _preview_bg_state['thread'] = threading.Thread(target=_preview_bg_run, name='preview-bg', daemon=True)
+                _preview_bg_state['thread'].start()
+            # Reenvios seguidos: um item na fila basta, convertendo o caminho mais recente
+            ja_agendado = id_publicacao in _preview_bg_pendentes
+            _preview_bg_pendentes[id_publicacao] = (full_path, usuario)
+        if not ja_agendado:
+            _preview_bg_queue.put(id_publicacao)
+    except Exception as e:
+        print(f'[PREVIEW] Não foi possível agendar a publicação {id_publicacao}: {e}')
+
 # Rota de pré-visualização com PDF automático
 @app.route('/preview_pdf_publicacao/<int:id_publicacao>')
 @login_required
@@ -2030,95 +4482,31 @@ def preview_pdf_publicacao(id_publicacao):
         conn.close()
         if not row:
             return make_response('<div style="padding:12px;color:#dc2626;">Publicação não encontrada.</div>', 404)
-        upload_dir = app.config['UPLOAD_FOLDER']
-        stored_name = (row.get('nome_arquivo') or '').strip()
-        full_path = os.path.join(upload_dir, stored_name) if stored_name else ''
-        # Fallback: usa caminho completo armazenado em 'arquivo' ou procura pelo nome dentro de uploads
-        if not full_path or not os.path.exists(full_path):
-            alt = (row.get('arquivo') or '').strip()
-            if alt and os.path.exists(alt):
-                full_path = alt
-            elif stored_name:
-                # procura por arquivo com o mesmo nome em subpastas de uploads
-                try:
-                    for root, dirs, files in os.walk(upload_dir):
-                        if stored_name in files:
-                            full_path = os.path.join(root, stored_name)
-                            break
-                except Exception:
-                    pass
-        # Se ainda não encontrado, deixamos seguir para cache/erro
-
-        # Sempre tenta servir um PDF em cache se já existir
-        preview_dir = ensure_previews_dir()
-        preview_name = f'preview_pub_{id_publicacao}.pdf'
-        preview_path = os.path.join(preview_dir, preview_name)
-        if os.path.exists(preview_path):
-            # Usa cache se estiver mais novo que a fonte; se a fonte não existir, serve cache
-            try:
-                if (os.path.exists(full_path) and os.path.getmtime(preview_path) >= os.path.getmtime(full_path)):
-                    return send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
-            except Exception:
-                pass
-            # Se a fonte não existir, ainda assim entrega o cache
-            if not os.path.exists(full_path):
-                return send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
-            # Cache antigo: força regeneração removendo arquivo
-            try:
-                os.remove(preview_path)
-            except Exception:
-                pass
-
-        # Se não houver cache e a fonte não existir, gera PDF de erro
+        full_path = find_publicacao_file(row)
         if not os.path.exists(full_path):
-            try:
-                make_error_pdf(preview_path, 'Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.')
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
-                return resp
-            except Exception:
-                # PDF mínimo
-                from reportlab.platypus import SimpleDocTemplate, Paragraph
-                from reportlab.lib.pagesizes import A4
-                from reportlab.lib.styles import getSampleStyleSheet
-                doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                doc.build([Paragraph('Arquivo da publicação não encontrado.', getSampleStyleSheet()['Normal'])])
-                return send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
-        ext = os.path.splitext(stored_name)[1].lower()
-        if ext not in ('.doc', '.docx', '.xls', '.xlsx'):
+            return send_error_pdf('Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.', as_attachment=False)
+        ext = os.path.splitext(full_path)[1].lower()
+        if ext not in OFFICE_EXTS:
             return make_response('<div style="padding:12px;color:#6b7280;">Formato não suportado para conversão automática.</div>', 400)
 
-        # Cache simples: usa preview se for mais novo que a fonte
-        try:
-            if os.path.exists(preview_path):
-                src_m = os.path.getmtime(full_path)
-                dst_m = os.path.getmtime(preview_path)
-                if dst_m >= src_m:
-                    return send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
-        except Exception:
-            pass
+        # PDF em cache para este conteúdo (pré-gerado no upload ou por outra publicação idêntica)
+        _, _, preview_path = preview_cache_location(full_path)
+        if preview_cache_lookup(preview_path):
+            return send_file_conditional(preview_path, mimetype='application/pdf', as_attachment=False)
 
-        # Tenta LibreOffice
-        ok, lo_pdf = try_libreoffice_convert(full_path, preview_dir)
-        if ok and lo_pdf and os.path.exists(lo_pdf):
-            try:
-                import shutil
-                shutil.copyfile(lo_pdf, preview_path)
-            except Exception:
-                preview_path = lo_pdf
-            return send_from_directory(os.path.dirname(preview_path), os.path.basename(preview_path), mimetype='application/pdf', as_attachment=False)
+        # Falha na conversão (inclusive limite de memória/CPU do conversor): PDF explicativo no lugar do preview
+        from html import escape as esc
+        if CONVERSION_MODE == 'queue':
+            job = request_conversao(id_publicacao, full_path, 'preview', session.get('user_id'))
+            if job['status'] == 'erro':
+                return send_error_pdf('Conversão não disponível', f'Falha ao gerar PDF: {esc(job.get("erro") or "")}', as_attachment=False)
+            return conversao_aceita_response(job)
 
-        # Fallbacks
         try:
-            if ext in ('.docx',):
-                docx_to_pdf_reportlab(full_path, preview_path)
-            elif ext in ('.xlsx', '.xls'):
-                excel_to_pdf_reportlab(full_path, preview_path)
-            else:
-                return make_response('<div style="padding:12px;color:#6b7280;">Converter este formato requer LibreOffice no servidor.</div>', 400)
-            return send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=False)
+            ensure_preview_pdf(full_path, 'preview', session.get('user_id'))
+            return send_file_conditional(preview_path, mimetype='application/pdf', as_attachment=False)
         except Exception as e:
-            from html import escape as esc
-            return make_response(f'<div style="padding:12px;color:#dc2626;">Falha ao gerar PDF: {esc(str(e))}</div>', 500)
+            return send_error_pdf('Conversão não disponível', f'Falha ao gerar PDF: {esc(str(e))}', as_attachment=False)
     except Exception as e:
         from html import escape as esc
         return make_response(f'<div style="padding:12px;color:#dc2626;">Erro ao preparar pré-visualização: {esc(str(e))}</div>', 500)
@@ -2128,6 +4516,7 @@ def preview_pdf_publicacao(id_publicacao):
 @login_required
 @roles_required(['Administrador','Docente','Aluno'])
 def download_pdf_publicacao(id_publicacao):
+    download_name = 'publicacao.pdf'
     try:
         conn = get_db_connection()
         cur = conn.cursor(row_factory=dict_row)
@@ -2141,276 +4530,55 @@ def download_pdf_publicacao(id_publicacao):
         cur.close(); conn.close()
         if not row:
             # gera PDF mínimo informando que não encontrou a publicação
-            pdf_bytes = generate_error_pdf(f'Publicação {id_publicacao} não encontrada.')
-            return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True, download_name=f'publicacao_{id_publicacao}.pdf')
+            return send_error_pdf('Publicação não encontrada', f'Publicação {id_publicacao} não encontrada.',
+                                  as_attachment=True, download_name=f'publicacao_{id_publicacao}.pdf')
         titulo = (row.get('titulo') or 'publicacao').strip()
-        stored_name = (row.get('nome_arquivo') or '').strip()
-        upload_dir = app.config['UPLOAD_FOLDER']
-        full_path = os.path.join(upload_dir, stored_name) if stored_name else ''
-        # Fallback: tenta usar caminho completo em 'arquivo' ou localizar em subpastas
-        if not full_path or not os.path.exists(full_path):
-            alt = (row.get('arquivo') or '').strip()
-            if alt and os.path.exists(alt):
-                full_path = alt
-            elif stored_name:
-                try:
-                    for root, dirs, files in os.walk(upload_dir):
-                        if stored_name in files:
-                            full_path = os.path.join(root, stored_name)
-                            break
-                except Exception:
-                    pass
-        if not os.path.exists(full_path):
-            # Arquivo ausente: usa cache de preview se existir; caso contrário, gera PDF de erro
-            preview_dir = ensure_previews_dir()
-            preview_name = f'preview_pub_{id_publicacao}.pdf'
-            preview_path = os.path.join(preview_dir, preview_name)
-            safe_title = secure_filename(titulo) or 'publicacao'
-            download_name = f"{safe_title}.pdf"
-            if os.path.exists(preview_path):
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            try:
-                make_error_pdf(preview_path, 'Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.')
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception:
-                from reportlab.platypus import SimpleDocTemplate, Paragraph
-                from reportlab.lib.pagesizes import A4
-                from reportlab.lib.styles import getSampleStyleSheet
-                doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                doc.build([Paragraph('Arquivo da publicação não encontrado.', getSampleStyleSheet()['Normal'])])
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                return resp
-
-        preview_dir = ensure_previews_dir()
-        preview_name = f'preview_pub_{id_publicacao}.pdf'
-        preview_path = os.path.join(preview_dir, preview_name)
         safe_title = secure_filename(titulo) or 'publicacao'
         download_name = f"{safe_title}.pdf"
+        full_path = find_publicacao_file(row)
+        if not os.path.exists(full_path):
+            return send_error_pdf('Arquivo não encontrado', f'O arquivo da publicação (id {id_publicacao}) não está disponível no servidor.',
+                                  as_attachment=True, download_name=download_name)
 
-        # Se já existe PDF em cache e está mais novo que a fonte, usa-o
-        if os.path.exists(preview_path):
-            try:
-                if os.path.getmtime(preview_path) >= os.path.getmtime(full_path):
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    try:
-                        size_bytes = os.path.getsize(preview_path)
-                        resp.headers['Content-Length'] = size_bytes
-                    except Exception:
-                        pass
-                    return resp
-            except Exception:
-                pass
-            # Cache desatualizado: remove para forçar regeneração
-            try:
-                os.remove(preview_path)
-            except Exception:
-                pass
-
-        # Caso contrário, tenta gerar (mesma lógica do preview)
-        ext = os.path.splitext(stored_name)[1].lower()
+        ext = os.path.splitext(full_path)[1].lower()
 
         # Se já é PDF, apenas força o nome baseado no título
         if ext == '.pdf':
-            resp = send_file(full_path, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-            try:
-                resp.headers['Content-Length'] = os.path.getsize(full_path)
-            except Exception:
-                pass
-            return resp
-
-        # Office: tenta LibreOffice e depois fallbacks internos
-        if ext in ('.doc', '.docx', '.xls', '.xlsx'):
-            ok, lo_pdf = try_libreoffice_convert(full_path, preview_dir)
-            if ok and lo_pdf and os.path.exists(lo_pdf):
-                try:
-                    import shutil
-                    shutil.copyfile(lo_pdf, preview_path)
-                except Exception:
-                    preview_path = lo_pdf
-                resp = send_from_directory(os.path.dirname(preview_path), os.path.basename(preview_path), mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            # Fallbacks internos
-            try:
-                if ext == '.docx':
-                    docx_to_pdf_reportlab(full_path, preview_path)
-                else:
-                    excel_to_pdf_reportlab(full_path, preview_path)
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception as e:
-                # Falhou a conversão: gera PDF simplificado para garantir formato .pdf
-                try:
-                    make_error_pdf(preview_path, 'Conversão não disponível', f'Falha ao converter {stored_name}. PDF simplificado gerado.')
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    try:
-                        resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                    except Exception:
-                        pass
-                    return resp
-                except Exception:
-                    # Último recurso: gera um PDF mínimo
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                    doc.build([Paragraph('Conversão indisponível neste servidor.', getSampleStyleSheet()['Normal'])])
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    return resp
-
-        # Imagens → PDF
-        if ext in ('.png', '.jpg', '.jpeg', '.webp', '.gif'):
-            try:
-                image_to_pdf_reportlab(full_path, preview_path)
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception:
-                # Fallback: sempre retorna PDF (erro/minimal) em vez do arquivo original
-                try:
-                    make_error_pdf(preview_path, 'Conversão não disponível', f'Falha ao converter imagem {stored_name} para PDF.')
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    try:
-                        resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                    except Exception:
-                        pass
-                    return resp
-                except Exception:
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                    doc.build([Paragraph('Conversão de imagem indisponível neste servidor.', getSampleStyleSheet()['Normal'])])
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    return resp
-
-        # Texto → PDF
-        if ext == '.txt':
-            try:
-                text_to_pdf_reportlab(full_path, preview_path)
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception:
-                # Fallback: sempre retorna PDF (erro/minimal)
-                try:
-                    make_error_pdf(preview_path, 'Conversão não disponível', f'Falha ao converter texto {stored_name} para PDF.')
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    try:
-                        resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                    except Exception:
-                        pass
-                    return resp
-                except Exception:
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                    doc.build([Paragraph('Conversão de texto indisponível neste servidor.', getSampleStyleSheet()['Normal'])])
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    return resp
-
-        # CSV → PDF
-        if ext == '.csv':
-            try:
-                csv_to_pdf_reportlab(full_path, preview_path)
-                resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                try:
-                    resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                except Exception:
-                    pass
-                return resp
-            except Exception:
-                # Fallback: sempre retorna PDF (erro/minimal)
-                try:
-                    make_error_pdf(preview_path, 'Conversão não disponível', f'Falha ao converter CSV {stored_name} para PDF.')
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    try:
-                        resp.headers['Content-Length'] = os.path.getsize(preview_path)
-                    except Exception:
-                        pass
-                    return resp
-                except Exception:
-                    from reportlab.platypus import SimpleDocTemplate, Paragraph
-                    from reportlab.lib.pagesizes import A4
-                    from reportlab.lib.styles import getSampleStyleSheet
-                    doc = SimpleDocTemplate(preview_path, pagesize=A4)
-                    doc.build([Paragraph('Conversão de CSV indisponível neste servidor.', getSampleStyleSheet()['Normal'])])
-                    resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-                    return resp
+            return send_file_conditional(full_path, mimetype='application/pdf', as_attachment=True, download_name=download_name)
 
         # Demais formatos: gera PDF de erro em vez de enviar original
+        if ext not in PDF_CONVERTIBLE_EXTS:
+            return send_error_pdf('Formato não suportado', f'O formato {ext} não é convertido automaticamente. PDF simplificado gerado.',
+                                  as_attachment=True, download_name=download_name)
+
+        _, _, preview_path = preview_cache_location(full_path)
+
+        def send_preview():
+            return send_file_conditional(preview_path, mimetype='application/pdf', as_attachment=True, download_name=download_name)
+
+        # PDF em cache para este conteúdo
+        if preview_cache_lookup(preview_path):
+            return send_preview()
+
+        stored_name = os.path.basename(full_path)
+        if CONVERSION_MODE == 'queue':
+            job = request_conversao(id_publicacao, full_path, 'download', session.get('user_id'))
+            if job['status'] == 'erro':
+                return send_error_pdf('Conversão não disponível', f'Falha ao converter {stored_name}: {job.get("erro") or ""}',
+                                      as_attachment=True, download_name=download_name)
+            return conversao_aceita_response(job)
+
         try:
-            make_error_pdf(preview_path, 'Formato não suportado', f'O formato {ext} não é convertido automaticamente. PDF simplificado gerado.')
-            resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-            try:
-                resp.headers['Content-Length'] = os.path.getsize(preview_path)
-            except Exception:
-                pass
-            return resp
+            ensure_preview_pdf(full_path, 'download', session.get('user_id'))
+            return send_preview()
         except Exception:
-            from reportlab.platypus import SimpleDocTemplate, Paragraph
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet
-            doc = SimpleDocTemplate(preview_path, pagesize=A4)
-            doc.build([Paragraph('Formato não suportado para conversão.', getSampleStyleSheet()['Normal'])])
-            resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-            return resp
+            # Falhou a conversão: gera PDF simplificado para garantir formato .pdf
+            return send_error_pdf('Conversão não disponível', f'Falha ao converter {stored_name}. PDF simplificado gerado.',
+                                  as_attachment=True, download_name=download_name)
     except Exception as e:
         # Nunca redireciona para HTML: retorna sempre um PDF de erro
-        try:
-            # Usa o mesmo caminho de preview para gerar o PDF
-            preview_dir = ensure_previews_dir()
-            preview_name = f'preview_pub_{id_publicacao}.pdf'
-            preview_path = os.path.join(preview_dir, preview_name)
-            # Nome de download baseado no título
-            try:
-                safe_title = secure_filename((row.get('titulo') if isinstance(row, dict) else titulo) or 'publicacao')
-            except Exception:
-                safe_title = 'publicacao'
-            download_name = f"{safe_title}.pdf"
-            make_error_pdf(preview_path, 'Erro ao preparar download', f'Ocorreu um erro ao gerar o PDF: {e}')
-            resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name=download_name)
-            try:
-                resp.headers['Content-Length'] = os.path.getsize(preview_path)
-            except Exception:
-                pass
-            return resp
-        except Exception:
-            # Último recurso: PDF mínimo
-            from reportlab.platypus import SimpleDocTemplate, Paragraph
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet
-            preview_dir = ensure_previews_dir()
-            preview_name = f'preview_pub_{id_publicacao}.pdf'
-            preview_path = os.path.join(preview_dir, preview_name)
-            doc = SimpleDocTemplate(preview_path, pagesize=A4)
-            doc.build([Paragraph('Falha ao preparar download em PDF.', getSampleStyleSheet()['Normal'])])
-            resp = send_from_directory(preview_dir, preview_name, mimetype='application/pdf', as_attachment=True, download_name='publicacao.pdf')
-            return resp
+        return send_error_pdf('Erro ao preparar download', f'Ocorreu um erro ao gerar o PDF: {e}',
+                              as_attachment=True, download_name=download_name)
 
 # Rota para reanexar conteúdo de publicação
 @app.route('/reupload_publicacao/<int:id_publicacao>', methods=['POST'])
@@ -2438,16 +4606,11 @@ def reupload_publicacao(id_publicacao):
         cur = conn.cursor()
         cur.execute("UPDATE publicacao SET arquivo=%s, nome_arquivo=%s WHERE id_publicacao=%s", (full, new_name, id_publicacao))
         conn.commit()
-        cur.close(); conn.close()
-        # limpa cache de preview
-        preview_dir = ensure_previews_dir()
-        preview_name = f'preview_pub_{id_publicacao}.pdf'
-        preview_path = os.path.join(preview_dir, preview_name)
-        try:
-            if os.path.exists(preview_path):
-                os.remove(preview_path)
-        except Exception:
-            pass
+        cur.close()
+        index_upload(full, conn=conn)
+        # O cache é por conteúdo: o PDF do arquivo anterior deixa de ser usado; já agenda o novo
+        schedule_preview(id_publicacao, full, conn=conn, usuario=session.get('user_id'))
+        conn.close()
         return jsonify({'ok': True, 'filename': new_name})
     except Exception as e:
         return jsonify({'ok': False, 'error': str(e)}), 500
@@ -2576,19 +4739,6 @@ def relatorio():
             # Cursos: todos os cursos
             cur.execute("SELECT id_curso, nome_curso FROM curso ORDER BY nome_curso")
             cursos = cur.fetchall()
-            # Padroniza tipo 'Artigo Científico'
-            try:
-                cur_ins = conn.cursor()
-                # garante 'Artigo Científico'
-                cur_ins.execute("INSERT INTO tipos_de_publicacao (nome_tipo) SELECT %s WHERE NOT EXISTS (SELECT 1 FROM tipos_de_publicacao WHERE nome_tipo = %s)", ('Artigo Científico','Artigo Científico'))
-                # atualiza publicações antigas
-                cur_ins.execute("UPDATE publicacao SET tipo = %s WHERE tipo = %s", ('Artigo Científico','Artigo'))
-                # remove 'Artigo' da lista se já existir 'Artigo Científico'
-                cur_ins.execute("DELETE FROM tipos_de_publicacao WHERE nome_tipo = %s AND EXISTS (SELECT 1 FROM tipos_de_publicacao WHERE nome_tipo = %s)", ('Artigo','Artigo Científico'))
-                conn.commit()
-                cur_ins.close()
-            except Exception:
-                pass
             # Tipos de publicação aceitos
             cur.execute("SELECT nome_tipo FROM tipos_de_publicacao ORDER BY nome_tipo")
             tipos = cur.fetchall()
@@ -2602,49 +4752,69 @@ def relatorio():
             flash(f'Erro ao carregar filtros de relatório: {e}', 'error')
     return render_template('relatorio.html', autores=autores, cursos=cursos, tipos=tipos)
 
+# Exportação em ZIP: o arquivo é montado enquanto é enviado (zipfile sobre um destino não posicionável,
+# com data descriptors), em blocos de ZIP_CHUNK_BYTES: memória constante para qualquer tamanho de pacote.
+ZIP_CHUNK_BYTES = 256 * 1024
+# Formatos já comprimidos entram sem recompressão (ZIP_STORED)
+ZIP_STORED_EXTS = {
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4',
+}
+
+class _ZipSaida:
+    """Destino do zipfile: só acumula o que foi escrito até o gerador recolher."""
+    def __init__(self):
+        self._partes = []
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def recolher(self) -> bytes:
+        data = b''.join(self._partes)
+        self._partes.clear()
+        return data
+
+def iter_zip_stream(entradas):
+    """Gera os bytes de um ZIP a partir de pares (nome no ZIP, origem), origem sendo um caminho ou bytes."""
+    import zipfile
+    saida = _ZipSaida()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for nome, origem in entradas:
+            if isinstance(origem, bytes):
+                zf.writestr(nome, origem)
+            else:
+                zinfo = zipfile.ZipInfo.from_file(origem, nome)
+                ext = os.path.splitext(nome)[1].lower()
+                zinfo.compress_type = zipfile.ZIP_STORED if ext in ZIP_STORED_EXTS else zipfile.ZIP_DEFLATED
+                with open(origem, 'rb') as src, zf.open(zinfo, 'w') as dst:
+                    yield saida.recolher()  # cabeçalho local: o primeiro byte sai antes de ler o arquivo
+                    while True:
+                        bloco = src.read(ZIP_CHUNK_BYTES)
+                        if not bloco:
+                            break
+                        dst.write(bloco)
+                        dados = saida.recolher()
+                        if dados:
+                            yield dados
+            dados = saida.recolher()
+            if dados:
+                yield dados
+    # Diretório central, escrito no fechamento
+    yield saida.recolher()
+
 # Exportação de Relatório em Excel
 @app.route('/relatorio/exportar', methods=['GET'])
 @login_required
 @roles_required(['Administrador','Docente','Aluno'])
 def exportar_relatorio():
-    # Coleta de filtros
-    autor = (request.args.get('autor') or '').strip()
-    orientador = (request.args.get('orientador') or '').strip()
-    curso = (request.args.get('curso') or '').strip()
-    tipo = (request.args.get('tipo') or '').strip()
-    data_inicial = (request.args.get('data_inicial') or '').strip()
-    data_final = (request.args.get('data_final') or '').strip()
-
-    # Construção dinâmica do WHERE
-    where = ["1=1"]
-    params = []
-
-    if autor:
-        where.append("u.nome ILIKE %s")
-        params.append(f"%{autor}%")
-    if orientador:
-        where.append("p.id_orientador = %s")
-        params.append(orientador)
-    if curso:
-        where.append("p.id_curso = %s")
-        params.append(curso)
-    if tipo:
-        where.append("p.tipo = %s")
-        params.append(tipo)
-    # Datas (YYYY-MM-DD)
-    try:
-        if data_inicial:
-            from datetime import datetime
-            di = datetime.strptime(data_inicial, '%Y-%m-%d').date()
-            where.append("p.data_publicacao >= %s")
-            params.append(di)
-        if data_final:
-            from datetime import datetime
-            df = datetime.strptime(data_final, '%Y-%m-%d').date()
-            where.append("p.data_publicacao <= %s")
-            params.append(df)
-    except Exception:
-        pass
+    # Filtros (mesmo construtor da pré-visualização)
+    conds, params, filtros = build_publicacao_filtros(request.args)
+    where = ["1=1"] + conds
 
     sql = f"""
         SELECT 
@@ -2655,7 +4825,9 @@ def exportar_relatorio():
           p.status,
           COALESCE(u_orient.nome, u_autor.nome, '') AS autor,
           COALESCE(c.nome_curso, '') AS curso,
-          COALESCE(p.assuntos_relacionados, '') AS assuntos
+          COALESCE(p.assuntos_relacionados, '') AS assuntos,
+          p.nome_arquivo,
+          p.arquivo
         FROM publicacao p
         LEFT JOIN usuario u_autor ON u_autor.id_usuario = p.id_autor
         LEFT JOIN usuario u_orient ON u_orient.id_usuario = p.id_orientador
@@ -2665,6 +4837,11 @@ def exportar_relatorio():
     """
 
     try:
+        # Limite de taxa simples por usuário (10/min), antes de consultar o banco
+        key = f"relatorio_export::{session.get('user_id') or 'anon'}"
+        if not check_rate_limit(key, limit=10, window=60):
+            return make_response('Muitas exportações. Tente novamente em instantes.', 429)
+
         conn = get_db_connection()
         if not conn:
             flash('Falha ao conectar para exportação.', 'error')
@@ -2674,11 +4851,6 @@ def exportar_relatorio():
         rows = cur.fetchall() or []
         cur.close(); conn.close()
 
-        # Limite de taxa simples por usuário (10/min)
-        key = f"relatorio_export::{session.get('user_id') or 'anon'}"
-        if not check_rate_limit(key, limit=10, window=60):
-            return make_response('Muitas exportações. Tente novamente em instantes.', 429)
-
         # Colunas configuráveis
         import re, io
         fmt = (request.args.get('format') or 'xlsx').lower()
@@ -2711,7 +4883,37 @@ def exportar_relatorio():
                     return str(v)
             return v if (v is not None) else ''
 
-        if fmt == 'csv':
+        buf = None
+        if fmt == 'zip':
+            # Arquivos das publicações filtradas, com os nomes do download individual, e um manifesto CSV
+            import csv
+            entradas, manifesto, usados = [], [], set()
+            for r in rows:
+                situacao, nome_zip = 'sem arquivo', ''
+                if r.get('nome_arquivo'):
+                    full_path = find_publicacao_file(r)
+                    if full_path and os.path.isfile(full_path):
+                        safe_title = secure_filename((r.get('titulo') or 'publicacao').strip()) or 'publicacao'
+                        ext = os.path.splitext(r['nome_arquivo'])[1]
+                        nome_zip = f"{safe_title}{ext}"
+                        if nome_zip.lower() in usados:
+                            nome_zip = f"{safe_title}_{r['id_publicacao']}{ext}"
+                        usados.add(nome_zip.lower())
+                        entradas.append((nome_zip, full_path))
+                        situacao = 'incluído'
+                    else:
+                        situacao = 'arquivo não encontrado'
+                manifesto.append([val_for(c, r) for c in selected_cols] + [nome_zip, situacao])
+            text_buf = io.StringIO()
+            writer = csv.writer(text_buf, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow([col_map[c] for c in selected_cols] + ['Arquivo', 'Situação'])
+            writer.writerows(manifesto)
+            entradas.append(('manifesto.csv', text_buf.getvalue().encode('utf-8-sig')))
+            resp = app.response_class(iter_zip_stream(entradas), mimetype='application/zip')
+            resp.headers['Content-Disposition'] = f'attachment; filename="{fname_base}.zip"'
+            # Sem buffer no nginx: o pacote começa a sair assim que o primeiro bloco fica pronto
+            resp.headers['X-Accel-Buffering'] = 'no'
+        elif fmt == 'csv':
             import csv
             headers = [col_map[c] for c in selected_cols]
             text_buf = io.StringIO()
@@ -2868,10 +5070,12 @@ def exportar_relatorio():
             )
 
         # Define Content-Length explícito para permitir barra de progresso no frontend
-        try:
-            resp.headers['Content-Length'] = buf.getbuffer().nbytes
-        except Exception:
-            pass
+        # (o ZIP é gerado em fluxo: tamanho desconhecido, vai em chunked)
+        if buf is not None:
+            try:
+                resp.headers['Content-Length'] = buf.getbuffer().nbytes
+            except Exception:
+                pass
         resp.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         resp.headers['Pragma'] = 'no-cache'
         resp.headers['Expires'] = '0'
@@ -2881,14 +5085,7 @@ def exportar_relatorio():
                 'format': fmt,
                 'cols': selected_cols,
                 'rows': len(rows),
-                'filters': {
-                    'autor': autor,
-                    'orientador': orientador,
-                    'curso': curso,
-                    'tipo': tipo,
-                    'data_inicial': data_inicial,
-                    'data_final': data_final
-                }
+                'filters': dict(filtros)
             })
         except Exception:
             pass
@@ -2905,43 +5102,10 @@ def exportar_relatorio():
 @app.route('/relatorio/preview', methods=['GET'])
 @login_required
 @roles_required(['Administrador','Docente','Aluno'])
+@compress_level(br=5)
 def preview_relatorio():
-    autor = (request.args.get('autor') or '').strip()
-    orientador = (request.args.get('orientador') or '').strip()
-    curso = (request.args.get('curso') or '').strip()
-    tipo = (request.args.get('tipo') or '').strip()
-    data_inicial = (request.args.get('data_inicial') or '').strip()
-    data_final = (request.args.get('data_final') or '').strip()
-
-    where = ["1=1"]
-    params = []
-    if autor:
-        where.append("u.nome ILIKE %s")
-        params.append(f"%{autor}%")
-    if orientador:
-        where.append("p.id_orientador = %s")
-        params.append(orientador)
-    if curso:
-        where.append("p.id_curso = %s")
-        params.append(curso)
-    if tipo:
-        where.append("p.tipo = %s")
-        params.append(tipo)
-    try:
-        if data_inicial:
-            from datetime import datetime
-            di = datetime.strptime(data_inicial, '%Y-%m-%d').date()
-            where.append("p.data_publicacao >= %s")
-            params.append(di)
-        if data_final:
-            from datetime import datetime
-            df = datetime.strptime(data_final, '%Y-%m-%d').date()
-            where.append("p.data_publicacao <= %s")
-            params.append(df)
-    except Exception:
-        pass
-
-    where_clause = " AND ".join(where)
+    conds, params, filtro_chave = build_publicacao_filtros(request.args)
+    where_clause = " AND ".join(["1=1"] + conds)
     sql = f"""
         SELECT 
           p.id_publicacao, p.titulo, p.tipo, p.status, p.assuntos_relacionados as assuntos,
@@ -2961,6 +5125,12 @@ def preview_relatorio():
         cur = conn.cursor(row_factory=dict_row)
         cur.execute(sql, params)
         rows = cur.fetchall() or []
+        facetas = compute_facetas(
+            cur,
+            f"FROM publicacao p LEFT JOIN curso c ON c.id_curso = p.id_curso WHERE {where_clause}",
+            params, ['curso', 'tipo', 'ano', 'status'],
+            cache_key=('relatorio', filtro_chave),
+        )
         cur.close(); conn.close()
         # Normaliza datas para string
         out = []
@@ -2975,7 +5145,7 @@ def preview_relatorio():
                 'status': r.get('status'),
                 'assuntos': r.get('assuntos')
             })
-        return jsonify({'rows': out})
+        return jsonify({'rows': out, 'facetas': facetas})
     except Exception as e:
         return make_response(jsonify({'error': str(e)}), 500)
 
@@ -3019,6 +5189,45 @@ def suporte():
         return redirect(url_for('suporte'))
     return render_template('suporte.html')
 
+# Métricas do cache de previews (contadores do processo que atende)
+@app.route('/api/admin/preview_cache', methods=['GET'])
+@login_required
+@roles_required(['Administrador'])
+def api_admin_preview_cache():
+    return jsonify(preview_cache_stats())
+
+# Métricas de admissão de conversões: filas do processo e, no modo queue, a fila conversao_job
+@app.route('/api/admin/conversoes', methods=['GET'])
+@login_required
+@roles_required(['Administrador'])
+def api_admin_conversoes():
+    out = CONVERSION_ADMISSION.metrics()
+    out['pid'] = os.getpid()
+    out['modo'] = CONVERSION_MODE
+    if CONVERSION_MODE == 'queue':
+        conn = get_db()
+        cur = conn.cursor(row_factory=dict_row)
+        cur.execute("""
+            SELECT prioridade,
+                   count(*) FILTER (WHERE status = 'pendente') AS profundidade,
+                   count(DISTINCT id_usuario) FILTER (WHERE status = 'pendente') AS usuarios_esperando,
+                   count(*) FILTER (WHERE status = 'processando') AS processando,
+                   extract(epoch FROM max(now() - criado_em) FILTER (WHERE status = 'pendente')) * 1000 AS espera_atual_max_ms,
+                   extract(epoch FROM avg(iniciado_em - criado_em)
+                       FILTER (WHERE iniciado_em >= now() - interval '1 hour')) * 1000 AS espera_media_1h_ms
+            FROM conversao_job
+            WHERE status IN ('pendente', 'processando') OR iniciado_em >= now() - interval '1 hour'
+            GROUP BY prioridade
+        """)
+        fila_db = {}
+        for r in cur.fetchall():
+            for k in ('espera_atual_max_ms', 'espera_media_1h_ms'):
+                r[k] = round(float(r[k]), 1) if r[k] is not None else None
+            fila_db[fila_da_prioridade(r.pop('prioridade'))] = r
+        cur.close()
+        out['fila_db'] = fila_db
+    return jsonify(out)
+
 # Rota para a página de configuração
 @app.route('/configuracao')
 @login_required
@@ -3065,54 +5274,254 @@ def api_cep(cep):
         return make_response(jsonify({'erro': 'Falha ao consultar CEP'}), 502)
 
 # API para buscar publicações
+# Busca textual (coluna publicacao.busca, migração 0009): cada filtro corresponde a um peso do tsvector
+BUSCA_PESOS = {'titulo': 'A', 'assunto': 'B', 'autor': 'C', 'curso': 'D'}
+BUSCA_MAX_TERMOS = 8
+
+def build_tsquery(texto: str, filtros) -> str | None:
+    """Monta a expressão para to_tsquery: termos com prefixo (:*) restritos aos pesos dos filtros.
+
+    Apenas letras/dígitos são aproveitados, então a entrada do usuário nunca gera sintaxe inválida.
+    Retorna None quando não há termos (consulta vazia).
+    """
+    termos = re.findall(r'[^\W_]+', (texto or '').lower())[:BUSCA_MAX_TERMOS]
+    if not termos:
+        return None
+    pesos = ''.join(sorted({BUSCA_PESOS[f] for f in filtros if f in BUSCA_PESOS})) or 'ABCD'
+    return ' & '.join(f'{t}:*{pesos}' for t in termos)
+
+PUBLICACOES_LIMIT_PADRAO = 20
+PUBLICACOES_LIMIT_MAX = 100
+
+def encode_cursor(chave) -> str:
+    """Serializa a chave de ordenação da última linha (keyset) em um token opaco para a URL."""
+    return base64.urlsafe_b64encode(json.dumps(chave, default=str).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token: str):
+    """Inverso de encode_cursor. Levanta ValueError para cursores inválidos."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        chave = json.loads(raw)
+    except Exception:
+        raise ValueError('cursor inválido')
+    if not isinstance(chave, list):
+        raise ValueError('cursor inválido')
+    return chave
+
+def estimate_count(cur, sql: str, params=()) -> int | None:
+    """Estimativa de linhas do planejador (EXPLAIN), sem executar a consulta nem contar tudo."""
+    try:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        row = cur.fetchone()
+        plano = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return int(plano[0]['Plan']['Plan Rows'])
+    except Exception:
+        return None
+
+def build_publicacao_filtros(args):
+    """Filtros comuns da busca e dos relatórios sobre `publicacao p`.
+
+    Retorna (condições, parâmetros, chave), onde a chave é uma tupla normalizada dos filtros
+    válidos (usada em caches). As condições não dependem de aliases de JOIN; valores inválidos
+    são ignorados.
+    """
+    conds, params, chave = [], [], []
+
+    def _int(nome):
+        try:
+            return int((args.get(nome) or '').strip())
+        except ValueError:
+            return None
+
+    autor = ' '.join((args.get('autor') or '').split())
+    if autor:
+        conds.append("p.id_autor IN (SELECT id_usuario FROM usuario WHERE nome ILIKE %s)")
+        params.append(f"%{autor}%")
+        chave.append(('autor', autor.lower()))
+    orientador = _int('orientador')
+    if orientador is not None:
+        conds.append("p.id_orientador = %s")
+        params.append(orientador)
+        chave.append(('orientador', orientador))
+    curso = _int('curso')
+    if curso is not None:
+        conds.append("p.id_curso = %s")
+        params.append(curso)
+        chave.append(('curso', curso))
+    tipo = (args.get('tipo') or '').strip()
+    if tipo:
+        conds.append("p.tipo = %s")
+        params.append(tipo)
+        chave.append(('tipo', tipo))
+    ano = _int('ano')
+    if ano is not None and 1900 <= ano <= 2200:
+        # Intervalo de datas (e não EXTRACT) para continuar usando índices em data_publicacao
+        conds.append("p.data_publicacao >= make_date(%s, 1, 1) AND p.data_publicacao < make_date(%s, 1, 1)")
+        params.extend([ano, ano + 1])
+        chave.append(('ano', ano))
+    # Datas (YYYY-MM-DD)
+    for nome, op in (('data_inicial', '>='), ('data_final', '<=')):
+        valor = (args.get(nome) or '').strip()
+        if not valor:
+            continue
+        try:
+            dia = datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        conds.append(f"p.data_publicacao {op} %s")
+        params.append(dia)
+        chave.append((nome, dia.isoformat()))
+    return conds, params, tuple(chave)
+
+# Facetas: contagens por dimensão calculadas numa única consulta (GROUPING SETS)
+FACETAS_DIMENSOES = {
+    'curso': [('c.id_curso', 'curso_id'), ('c.nome_curso', 'curso_nome')],
+    'tipo': [('p.tipo', 'tipo')],
+    'ano': [('EXTRACT(YEAR FROM p.data_publicacao)::int', 'ano')],
+    'status': [('p.status::text', 'status')],
+}
+FACETAS_CACHE = TTLCache(
+    max_items=int(os.getenv('FACETAS_CACHE_SIZE', '500')),
+    ttl=float(os.getenv('FACETAS_CACHE_TTL', '30')),
+)
+
+def compute_facetas(cur, from_where: str, params, dimensoes, cache_key=None) -> dict:
+    """Conta o conjunto filtrado (`from_where`: FROM ... WHERE ...) por cada dimensão de uma vez.
+
+    `from_where` precisa expor os aliases `p` (publicacao) e `c` (curso). O resultado fica em
+    FACETAS_CACHE por alguns segundos quando `cache_key` é informado.
+    """
+    if cache_key is not None:
+        cached = FACETAS_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+    colunas, conjuntos, flags = [], [], []
+    for dim in dimensoes:
+        exprs = FACETAS_DIMENSOES[dim]
+        colunas.extend(f"{expr} AS {alias}" for expr, alias in exprs)
+        conjuntos.append('(' + ', '.join(expr for expr, _ in exprs) + ')')
+        flags.append(f"GROUPING({exprs[0][0]}) AS g_{dim}")
+    cur.execute(f"""
+        SELECT {', '.join(colunas)}, COUNT(*) AS total, {', '.join(flags)}
+        {from_where}
+        GROUP BY GROUPING SETS ({', '.join(conjuntos)})
+        ORDER BY total DESC
+    """, params)
+    facetas = {dim: [] for dim in dimensoes}
+    for r in cur.fetchall():
+        r = r if isinstance(r, dict) else dict(zip([d.name for d in cur.description], r))
+        for dim in dimensoes:
+            # GROUPING(...) = 0 indica que a linha pertence ao conjunto desta dimensão
+            if r[f'g_{dim}'] == 0:
+                if dim == 'curso':
+                    facetas[dim].append({'id': r['curso_id'], 'nome': r['curso_nome'], 'total': r['total']})
+                else:
+                    facetas[dim].append({'valor': r[dim], 'total': r['total']})
+                break
+    if cache_key is not None:
+        FACETAS_CACHE.set(cache_key, facetas)
+    return facetas
+
 @app.route('/api/publicacoes', methods=['GET'])
 def api_publicacoes():
+    """Busca paginada por keyset.
+
+    Parâmetros: q, filtro (repetível), curso, tipo, ano, limit (até PUBLICACOES_LIMIT_MAX), cursor
+    (next_cursor da página anterior) e total=1 para incluir uma estimativa do total. A ordem é
+    (data_publicacao, id_publicacao) desc, precedida pela relevância quando há termos de busca.
+    A primeira página inclui `facetas` (curso, tipo, ano) do conjunto filtrado; facetas=0 omite.
+    """
     query = request.args.get('q', '')
     filtros = request.args.getlist('filtro')
     
     if not filtros:
         filtros = ['autor', 'assunto', 'curso', 'titulo']
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', PUBLICACOES_LIMIT_PADRAO)), PUBLICACOES_LIMIT_MAX))
+    except ValueError:
+        limit = PUBLICACOES_LIMIT_PADRAO
+
+    tsquery = build_tsquery(query, filtros)
+    cursor = request.args.get('cursor')
+    chave = None
+    if cursor:
+        try:
+            chave = decode_cursor(cursor)
+            if len(chave) != (3 if tsquery else 2):
+                raise ValueError('cursor inválido')
+            chave[-2] = datetime.strptime(chave[-2], '%Y-%m-%d').date()
+            chave[-1] = int(chave[-1])
+            if tsquery:
+                chave[0] = float(chave[0])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Cursor inválido.'}), 400
     
     conn = get_db_connection()
-    resultados = []
     
     if conn:
         try:
             cur = conn.cursor(row_factory=dict_row)
             
-            # Construir a consulta SQL com base nos filtros
-            sql_parts = []
-            params = []
-            
-            if 'autor' in filtros:
-                sql_parts.append("u.nome ILIKE %s")
-                params.append(f'%{query}%')
-            
-            if 'assunto' in filtros:
-                sql_parts.append("p.assuntos_relacionados ILIKE %s")
-                params.append(f'%{query}%')
-            
-            if 'curso' in filtros:
-                sql_parts.append("c.nome_curso ILIKE %s")
-                params.append(f'%{query}%')
-            
-            if 'titulo' in filtros:
-                sql_parts.append("p.titulo ILIKE %s")
-                params.append(f'%{query}%')
-            
-            where_clause = " OR ".join(sql_parts)
-            
-            # Executar a consulta
+            if tsquery:
+                # Índice GIN em p.busca; acentos removidos dos dois lados (f_unaccent)
+                base_sql = """
+                    FROM publicacao p
+                    CROSS JOIN to_tsquery('portuguese', f_unaccent(%s)) q
+                    JOIN usuario u ON p.id_autor = u.id_usuario
+                    JOIN curso c ON p.id_curso = c.id_curso
+                    WHERE p.status = 'Publicado' AND p.busca @@ q
+                """
+                base_params = [tsquery]
+                rank_sql = "ts_rank(p.busca, q)"
+                ordem = f"{rank_sql} DESC, p.data_publicacao DESC, p.id_publicacao DESC"
+                apos = f"({rank_sql}, p.data_publicacao, p.id_publicacao) < (%s::real, %s, %s)"
+            else:
+                # Índice parcial idx_publicacao_publicado_data (migração 0010)
+                base_sql = """
+                    FROM publicacao p
+                    JOIN usuario u ON p.id_autor = u.id_usuario
+                    JOIN curso c ON p.id_curso = c.id_curso
+                    WHERE p.status = 'Publicado'
+                """
+                base_params = []
+                rank_sql = "NULL::real"
+                ordem = "p.data_publicacao DESC, p.id_publicacao DESC"
+                apos = "(p.data_publicacao, p.id_publicacao) < (%s, %s)"
+
+            conds, filtro_params, filtro_chave = build_publicacao_filtros(request.args)
+            if conds:
+                base_sql += " AND " + " AND ".join(conds)
+                base_params.extend(filtro_params)
+
+            total_estimado = None
+            if request.args.get('total') in ('1', 'true') and not chave:
+                total_estimado = estimate_count(cur, "SELECT 1 " + base_sql, base_params)
+
+            facetas = None
+            if not chave and request.args.get('facetas') not in ('0', 'false'):
+                facetas = compute_facetas(cur, base_sql, base_params, ['curso', 'tipo', 'ano'],
+                                          cache_key=('api_publicacoes', tsquery, filtro_chave))
+
+            sql = base_sql
+            params = list(base_params)
+            if chave:
+                sql += " AND " + apos
+                params.extend(chave)
             cur.execute(f"""
-                SELECT p.*, u.nome as autor_nome, c.nome_curso 
-                FROM publicacao p
-                JOIN usuario u ON p.id_autor = u.id_usuario
-                JOIN curso c ON p.id_curso = c.id_curso
-                WHERE p.status = 'Publicado' AND ({where_clause})
-                ORDER BY p.data_publicacao DESC
-            """, params)
+                SELECT p.id_publicacao, p.titulo, p.tipo, p.data_publicacao, p.assuntos_relacionados,
+                       u.nome as autor_nome, c.nome_curso, {rank_sql} AS rank
+                {sql}
+                ORDER BY {ordem}
+                LIMIT %s
+            """, params + [limit + 1])
             
-            resultados = cur.fetchall()
+            # Uma linha a mais indica se existe próxima página
+            resultados = cur.fetchmany(limit + 1)
+            ha_mais = len(resultados) > limit
+            resultados = resultados[:limit]
             
             # Converter para formato JSON
             resultados_json = []
@@ -3126,14 +5535,174 @@ def api_publicacoes():
                     'tipo': r['tipo'],
                     'assuntos': r['assuntos_relacionados']
                 })
+
+            next_cursor = None
+            if ha_mais:
+                ultimo = resultados[-1]
+                chave_ultimo = [ultimo['data_publicacao'].isoformat(), ultimo['id_publicacao']]
+                if tsquery:
+                    chave_ultimo.insert(0, ultimo['rank'])
+                next_cursor = encode_cursor(chave_ultimo)
             
             cur.close()
             conn.close()
-            return jsonify(resultados_json)
+            resposta = {'resultados': resultados_json, 'next_cursor': next_cursor}
+            if facetas is not None:
+                resposta['facetas'] = facetas
+            if total_estimado is not None:
+                resposta['total_estimado'] = total_estimado
+            return jsonify(resposta)
         except Exception as e:
+            conn.rollback()
             return jsonify({'error': str(e)}), 500
     
-    return jsonify([])
+    return jsonify({'resultados': [], 'next_cursor': None})
+
+# Autocomplete da busca: sugestões leves por categoria (índices pg_trgm, migração 0011)
+AUTOCOMPLETE_LIMIT = 5
+AUTOCOMPLETE_MIN_CHARS = 2
+AUTOCOMPLETE_CACHE = TTLCache(
+    max_items=int(os.getenv('AUTOCOMPLETE_CACHE_SIZE', '2000')),
+    ttl=float(os.getenv('AUTOCOMPLETE_CACHE_TTL', '60')),
+)
+_PG_TRGM = None  # detectado na primeira chamada (por processo)
+
+def _pg_trgm_available(cur) -> bool:
+    global _PG_TRGM
+    if _PG_TRGM is None:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _PG_TRGM = cur.fetchone() is not None
+    return _PG_TRGM
+
+@app.route('/api/autocomplete', methods=['GET'])
+@login_required
+def api_autocomplete():
+    termo = ' '.join((request.args.get('q') or '').lower().split())[:100]
+    vazio = {'titulos': [], 'autores': [], 'cursos': []}
+    if len(termo) < AUTOCOMPLETE_MIN_CHARS:
+        return jsonify(vazio)
+    try:
+        k = max(1, min(int(request.args.get('limit', AUTOCOMPLETE_LIMIT)), 10))
+    except ValueError:
+        k = AUTOCOMPLETE_LIMIT
+
+    cache_key = (termo, k)
+    cached = AUTOCOMPLETE_CACHE.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(vazio)
+    try:
+        cur = conn.cursor()
+        escapado = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        if _pg_trgm_available(cur):
+            # Trecho em qualquer posição (GIN gin_trgm_ops), mais parecidos primeiro
+            padrao = f'%{escapado}%'
+            ordem = "word_similarity(f_unaccent(%s), {col}) DESC, {col}"
+            ordem_params = [termo]
+        else:
+            # Sem pg_trgm: apenas prefixo (btree text_pattern_ops)
+            padrao = f'{escapado}%'
+            ordem = "{col}"
+            ordem_params = []
+
+        def sugestoes(sql, col):
+            cur.execute(
+                sql.format(cond=f"{col} LIKE f_unaccent(%s)", ordem=ordem.format(col=col)),
+                [padrao] + ordem_params + [k],
+            )
+            return [{'id': r[0], 'texto': r[1]} for r in cur.fetchall()]
+
+        resultado = {
+            'titulos': sugestoes("""
+                SELECT p.id_publicacao, p.titulo FROM publicacao p
+                WHERE p.status = 'Publicado' AND {cond}
+                ORDER BY {ordem} LIMIT %s
+            """, "f_unaccent(lower(p.titulo))"),
+            # Apenas autores com trabalhos publicados
+            'autores': sugestoes("""
+                SELECT u.id_usuario, u.nome FROM usuario u
+                WHERE {cond} AND EXISTS (
+                    SELECT 1 FROM publicacao p WHERE p.id_autor = u.id_usuario AND p.status = 'Publicado'
+                )
+                ORDER BY {ordem} LIMIT %s
+            """, "f_unaccent(lower(u.nome))"),
+            'cursos': sugestoes("""
+                SELECT c.id_curso, c.nome_curso FROM curso c
+                WHERE c.ativo AND {cond}
+                ORDER BY {ordem} LIMIT %s
+            """, "f_unaccent(lower(c.nome_curso))"),
+        }
+        cur.close()
+        conn.close()
+        AUTOCOMPLETE_CACHE.set(cache_key, resultado)
+        return jsonify(resultado)
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# Publicações mais baixadas (lidas apenas das tabelas de rollup, nunca do audit_event)
+POPULARES_PERIODOS = {
+    '24h': ('download_hora', 'hora', "now() - interval '24 hours'"),
+    '7d': ('download_dia', 'dia', "current_date - 6"),
+    '30d': ('download_dia', 'dia', "current_date - 29"),
+    'total': None,
+}
+
+@app.route('/api/publicacoes/populares', methods=['GET'])
+def api_publicacoes_populares():
+    periodo = request.args.get('periodo', '30d')
+    if periodo not in POPULARES_PERIODOS:
+        return jsonify({'error': 'Período inválido. Use: ' + ', '.join(POPULARES_PERIODOS)}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify([])
+    try:
+        cur = conn.cursor(row_factory=dict_row)
+        fonte = POPULARES_PERIODOS[periodo]
+        if fonte is None:
+            # Percorre idx_download_total_total (total DESC, id_publicacao) em ordem e para nos N primeiros
+            # publicados: o ORDER BY abaixo segue exatamente o índice, sem passo de ordenação
+            ranking = "SELECT id_publicacao, total FROM download_total"
+        else:
+            tabela, coluna, inicio = fonte
+            # Custo limitado às publicações baixadas no período, independente do volume de downloads
+            ranking = (f"SELECT id_publicacao, SUM(total) AS total FROM {tabela} "
+                       f"WHERE {coluna} >= {inicio} GROUP BY id_publicacao")
+        cur.execute(f"""
+            SELECT p.id_publicacao, p.titulo, p.tipo, p.nome_arquivo, p.data_publicacao,
+                   u.nome AS autor_nome, c.nome_curso, r.total
+            FROM ({ranking}) r
+            JOIN publicacao p ON p.id_publicacao = r.id_publicacao
+            JOIN usuario u ON p.id_autor = u.id_usuario
+            LEFT JOIN curso c ON p.id_curso = c.id_curso
+            WHERE p.status = 'Publicado'
+            ORDER BY r.total DESC, r.id_publicacao
+            LIMIT %s
+        """, (limit,))
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        return jsonify([{
+            'id': r['id_publicacao'],
+            'titulo': r['titulo'],
+            'autor': r['autor_nome'],
+            'curso': r['nome_curso'],
+            'data': r['data_publicacao'].strftime('%d/%m/%Y') if r['data_publicacao'] else None,
+            'tipo': r['tipo'],
+            'nome_arquivo': r['nome_arquivo'],
+            'downloads': int(r['total']),
+        } for r in rows])
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
 
 def run_validacao():
     # Rotina de validação: cria curso, publica arquivo com CAPTCHA e vincula usuário a curso.
@@ -3332,11 +5901,43 @@ def run_seed_admins():
 
 
 if __name__ == '__main__':
-    # Executa a validação quando chamado com --validate; migração com --hash-migrate; caso contrário, sobe o servidor.
+    # Executa a validação quando chamado com --validate; migração com --hash-migrate; schema com --migrate; caso contrário, sobe o servidor.
+    # `python app.py` é desenvolvimento: assets-fonte sem cache, salvo ASSETS_DEV explícito
+    if os.getenv('ASSETS_DEV') is None:
+        ASSETS_DEV = True
     if len(sys.argv) > 1:
         arg = sys.argv[1]
         if arg in ('--validate', 'validate'):
             run_validacao()
+        elif arg in ('--audit-detach', 'audit-detach'):
+            # Uso: python app.py --audit-detach [meses_mantidos]
+            meses = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+            for nome in detach_audit_partitions(meses):
+                print(f'Partição desanexada: {nome}')
+        elif arg in ('--conversion-worker', 'conversion-worker'):
+            # Uso: python app.py --conversion-worker [processos]
+            run_conversion_workers(int(sys.argv[2]) if len(sys.argv) > 2 else CONVERSION_WORKERS)
+        elif arg in ('--reindex-uploads', 'reindex-uploads'):
+            resumo = reindex_uploads()
+            print(f"Arquivos indexados: {resumo['arquivos']} ({resumo['hashes_calculados']} hashes calculados, "
+                  f"{resumo['removidos']} entradas removidas).")
+            for id_pub, nome in resumo['ausentes']:
+                print(f'Publicação {id_pub}: arquivo ausente ({nome})')
+        elif arg in ('--build-assets', 'build-assets'):
+            print(f'Assets gerados: {len(build_assets())} (manifest em {ASSETS_MANIFEST}).')
+        elif arg in ('--sweep-previews', 'sweep-previews'):
+            resumo = sweep_preview_cache(orfaos=True)
+            print(f"Previews removidos: {resumo['removidos']} por cota, {resumo['orfaos']} órfãos ({resumo['bytes']} bytes).")
+        elif arg in ('--rollup-downloads', 'rollup-downloads'):
+            total = rollup_downloads(max_batches=1000)
+            print(f'Downloads agregados: {total}')
+        elif arg in ('--migrate', 'migrate'):
+            try:
+                versao = run_migrations()
+                print(f'Schema na versão {versao}.')
+            except Exception as e:
+                print('Erro ao aplicar migrações:', e)
+                sys.exit(1)
         elif arg in ('--hash-migrate', 'hash-migrate'):
             run_migracao_hash()
         elif arg in ('--seed-admins', 'seed-admins'):
@@ -9,6 +9,8 @@ DROP TABLE IF EXISTS "public"."curso" CASCADE;
 DROP TABLE IF EXISTS "public"."usuario" CASCADE;
 DROP TABLE IF EXISTS "public"."tipos_de_publicacao" CASCADE;
 DROP TABLE IF EXISTS "public"."esqueci_senha" CASCADE;
+-- Versão do schema (migrações em migrations/ são reaplicadas após recriar o banco)
+DROP TABLE IF EXISTS "public"."schema_version" CASCADE;
 
 -- ENUMs para tipos e status
 CREATE TYPE "public"."tipo_usuario" AS ENUM ('Aluno', 'Professor', 'Funcionário');
@@ -0,0 +1,2 @@
+-- Coluna 'ativo' em usuario (antes garantida por ensure_usuario_ativo_column)
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS ativo BOOLEAN NOT NULL DEFAULT TRUE;
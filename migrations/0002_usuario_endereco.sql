@@ -0,0 +1,7 @@
+-- Colunas de endereço em usuario (antes garantidas por ensure_usuario_endereco_columns)
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS cep VARCHAR(9);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS logradouro VARCHAR(255);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS complemento VARCHAR(255);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS bairro VARCHAR(255);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS cidade VARCHAR(255);
+ALTER TABLE usuario ADD COLUMN IF NOT EXISTS estado VARCHAR(2);
@@ -0,0 +1,11 @@
+-- Orientador da publicação (antes garantido por ensure_publicacao_orientador_column)
+ALTER TABLE publicacao ADD COLUMN IF NOT EXISTS id_orientador INTEGER NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_publicacao_orientador') THEN
+        ALTER TABLE publicacao
+            ADD CONSTRAINT fk_publicacao_orientador FOREIGN KEY (id_orientador)
+            REFERENCES usuario(id_usuario) ON DELETE SET NULL;
+    END IF;
+END $$;
@@ -0,0 +1,2 @@
+-- Coluna 'ativo' em curso (antes garantida por ensure_curso_ativo_column)
+ALTER TABLE curso ADD COLUMN IF NOT EXISTS ativo BOOLEAN NOT NULL DEFAULT TRUE;
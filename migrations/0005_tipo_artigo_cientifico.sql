@@ -0,0 +1,8 @@
+-- Padroniza o tipo 'Artigo' como 'Artigo Científico' (antes executado a cada GET de /publicacao e /relatorio)
+INSERT INTO tipos_de_publicacao (nome_tipo)
+SELECT 'Artigo Científico'
+WHERE NOT EXISTS (SELECT 1 FROM tipos_de_publicacao WHERE nome_tipo = 'Artigo Científico');
+
+UPDATE publicacao SET tipo = 'Artigo Científico' WHERE tipo = 'Artigo';
+
+DELETE FROM tipos_de_publicacao WHERE nome_tipo = 'Artigo';
@@ -0,0 +1,9 @@
+-- Contadores de rate limiting compartilhados entre workers (RATE_LIMIT_BACKEND=postgres).
+-- UNLOGGED: sem WAL (escrita barata); o conteúdo é descartável e some após um crash.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit (
+    chave VARCHAR(255) PRIMARY KEY,
+    contador INTEGER NOT NULL,
+    expira_em TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_expira_em ON rate_limit (expira_em);
@@ -0,0 +1,19 @@
+-- Eventos de auditoria estruturados (JSONB), particionados por mês.
+-- As partições mensais (audit_event_AAAA_MM) são criadas sob demanda pelo AuditWriter
+-- e podem ser desanexadas com: python app.py --audit-detach [meses_mantidos]
+CREATE TABLE IF NOT EXISTS audit_event (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+    criado_em TIMESTAMP WITH TIME ZONE NOT NULL,
+    evento VARCHAR(100) NOT NULL,
+    id_usuario INTEGER,
+    ip VARCHAR(45),
+    detalhes JSONB NOT NULL DEFAULT '{}'::jsonb,
+    PRIMARY KEY (id, criado_em)
+) PARTITION BY RANGE (criado_em);
+
+CREATE INDEX IF NOT EXISTS idx_audit_event_evento_criado_em ON audit_event (evento, criado_em);
+
+-- Ex.: downloads por publicação no último mês
+CREATE INDEX IF NOT EXISTS idx_audit_event_download_publicacao
+    ON audit_event ((detalhes->>'id_publicacao'), criado_em)
+    WHERE evento = 'download_publicacao';
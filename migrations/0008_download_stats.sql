@@ -0,0 +1,39 @@
+-- Estatísticas de downloads agregadas de forma incremental.
+-- O AuditWriter copia cada evento download_publicacao para download_pendente (no mesmo
+-- COPY em lote do audit_event); o job de rollup consome a fila e soma nas tabelas abaixo,
+-- sem UPDATE por download. Execução manual: python app.py --rollup-downloads
+CREATE TABLE IF NOT EXISTS download_pendente (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    id_publicacao INTEGER NOT NULL,
+    baixado_em TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS download_hora (
+    hora TIMESTAMP WITH TIME ZONE NOT NULL,
+    id_publicacao INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (hora, id_publicacao)
+);
+
+CREATE TABLE IF NOT EXISTS download_dia (
+    dia DATE NOT NULL,
+    id_publicacao INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, id_publicacao)
+);
+
+CREATE TABLE IF NOT EXISTS download_total (
+    id_publicacao INTEGER PRIMARY KEY,
+    total BIGINT NOT NULL,
+    ultimo_download TIMESTAMP WITH TIME ZONE
+);
+
+-- Ranking geral: varredura do índice em ordem, parando nos N primeiros
+CREATE INDEX IF NOT EXISTS idx_download_total_total ON download_total (total DESC, id_publicacao);
+
+-- Reaproveita os downloads já registrados em audit_event
+INSERT INTO download_pendente (id_publicacao, baixado_em)
+SELECT (detalhes->>'id_publicacao')::int, criado_em
+FROM audit_event
+WHERE evento = 'download_publicacao'
+  AND detalhes->>'id_publicacao' ~ '^\d{1,9}$';
@@ -0,0 +1,91 @@
+-- Busca textual em publicações: coluna tsvector mantida por triggers + índice GIN.
+-- Pesos: A = título, B = assuntos, C = nome do autor, D = nome do curso.
+
+-- Remoção de acentos imutável (utilizável em índices/colunas). Usa a extensão unaccent
+-- quando disponível; caso contrário, um translate() equivalente para o português.
+DO $$
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS unaccent;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'Extensão unaccent indisponível (%); usando translate().', SQLERRM;
+    END;
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'unaccent') THEN
+        EXECUTE $f$
+            CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $b$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $b$
+        $f$;
+    ELSE
+        EXECUTE $f$
+            CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+            AS $b$ SELECT translate($1,
+                'áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ',
+                'aaaaaeeeeiiiiooooouuuucnAAAAAEEEEIIIIOOOOOUUUUCN') $b$
+        $f$;
+    END IF;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION publicacao_busca_vetor(p_titulo text, p_assuntos text, p_id_autor integer, p_id_curso integer)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT setweight(to_tsvector('portuguese', f_unaccent(coalesce(p_titulo, ''))), 'A')
+        || setweight(to_tsvector('portuguese', f_unaccent(coalesce(p_assuntos, ''))), 'B')
+        || setweight(to_tsvector('portuguese', f_unaccent(coalesce(
+               (SELECT nome FROM usuario WHERE id_usuario = p_id_autor), ''))), 'C')
+        || setweight(to_tsvector('portuguese', f_unaccent(coalesce(
+               (SELECT nome_curso FROM curso WHERE id_curso = p_id_curso), ''))), 'D')
+$$;
+
+ALTER TABLE publicacao ADD COLUMN IF NOT EXISTS busca tsvector;
+
+-- Publicação: recalcula ao inserir ou quando muda algum campo indexado
+CREATE OR REPLACE FUNCTION publicacao_busca_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.busca := publicacao_busca_vetor(NEW.titulo, NEW.assuntos_relacionados, NEW.id_autor, NEW.id_curso);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_publicacao_busca ON publicacao;
+CREATE TRIGGER trg_publicacao_busca
+    BEFORE INSERT OR UPDATE OF titulo, assuntos_relacionados, id_autor, id_curso ON publicacao
+    FOR EACH ROW EXECUTE FUNCTION publicacao_busca_trigger();
+
+-- Autor/curso renomeado: atualiza apenas as publicações ligadas a ele
+CREATE OR REPLACE FUNCTION usuario_nome_busca_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE publicacao
+    SET busca = publicacao_busca_vetor(titulo, assuntos_relacionados, id_autor, id_curso)
+    WHERE id_autor = NEW.id_usuario;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_usuario_nome_busca ON usuario;
+CREATE TRIGGER trg_usuario_nome_busca
+    AFTER UPDATE OF nome ON usuario
+    FOR EACH ROW WHEN (OLD.nome IS DISTINCT FROM NEW.nome)
+    EXECUTE FUNCTION usuario_nome_busca_trigger();
+
+CREATE OR REPLACE FUNCTION curso_nome_busca_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE publicacao
+    SET busca = publicacao_busca_vetor(titulo, assuntos_relacionados, id_autor, id_curso)
+    WHERE id_curso = NEW.id_curso;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_curso_nome_busca ON curso;
+CREATE TRIGGER trg_curso_nome_busca
+    AFTER UPDATE OF nome_curso ON curso
+    FOR EACH ROW WHEN (OLD.nome_curso IS DISTINCT FROM NEW.nome_curso)
+    EXECUTE FUNCTION curso_nome_busca_trigger();
+
+-- Preenche as publicações existentes
+UPDATE publicacao
+SET busca = publicacao_busca_vetor(titulo, assuntos_relacionados, id_autor, id_curso);
+
+CREATE INDEX IF NOT EXISTS idx_publicacao_busca ON publicacao USING GIN (busca);
@@ -0,0 +1,5 @@
+-- Paginação por keyset de /api/publicacoes (e listagem da Home): publicações publicadas
+-- percorridas em (data_publicacao, id_publicacao) decrescente direto pelo índice.
+CREATE INDEX IF NOT EXISTS idx_publicacao_publicado_data
+    ON publicacao (data_publicacao DESC, id_publicacao DESC)
+    WHERE status = 'Publicado';
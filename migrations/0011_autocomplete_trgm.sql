@@ -0,0 +1,29 @@
+-- Índices do autocomplete (/api/autocomplete) sobre o texto sem acentos e em minúsculas.
+-- Com pg_trgm: GIN gin_trgm_ops (LIKE '%trecho%' indexado). Sem a extensão: btree
+-- text_pattern_ops, que atende apenas buscas por prefixo (LIKE 'prefixo%').
+DO $$
+BEGIN
+    BEGIN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    EXCEPTION WHEN OTHERS THEN
+        RAISE NOTICE 'Extensão pg_trgm indisponível (%); usando índices de prefixo.', SQLERRM;
+    END;
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_publicacao_titulo_trgm
+            ON publicacao USING GIN (f_unaccent(lower(titulo)) gin_trgm_ops)
+            WHERE status = 'Publicado';
+        CREATE INDEX IF NOT EXISTS idx_usuario_nome_trgm
+            ON usuario USING GIN (f_unaccent(lower(nome)) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_curso_nome_trgm
+            ON curso USING GIN (f_unaccent(lower(nome_curso)) gin_trgm_ops);
+    ELSE
+        CREATE INDEX IF NOT EXISTS idx_publicacao_titulo_prefixo
+            ON publicacao (f_unaccent(lower(titulo)) text_pattern_ops)
+            WHERE status = 'Publicado';
+        CREATE INDEX IF NOT EXISTS idx_usuario_nome_prefixo
+            ON usuario (f_unaccent(lower(nome)) text_pattern_ops);
+        CREATE INDEX IF NOT EXISTS idx_curso_nome_prefixo
+            ON curso (f_unaccent(lower(nome_curso)) text_pattern_ops);
+    END IF;
+END
+$$;
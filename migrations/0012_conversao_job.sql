@@ -0,0 +1,24 @@
+-- Fila de conversões para PDF (CONVERSION_MODE=queue), consumida por
+-- `python app.py --conversion-worker` com FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS conversao_job (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    id_publicacao INTEGER NOT NULL REFERENCES publicacao(id_publicacao) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pendente'
+        CHECK (status IN ('pendente', 'processando', 'concluido', 'erro')),
+    prioridade SMALLINT NOT NULL DEFAULT 0,
+    tentativas SMALLINT NOT NULL DEFAULT 0,
+    erro TEXT,
+    criado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    iniciado_em TIMESTAMP WITH TIME ZONE,
+    concluido_em TIMESTAMP WITH TIME ZONE
+);
+
+-- No máximo um job ativo por publicação (alvo do ON CONFLICT ao enfileirar)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_conversao_job_ativo
+    ON conversao_job (id_publicacao) WHERE status IN ('pendente', 'processando');
+
+-- Próximo job a reivindicar
+CREATE INDEX IF NOT EXISTS idx_conversao_job_fila
+    ON conversao_job (prioridade DESC, id) WHERE status = 'pendente';
+
+CREATE INDEX IF NOT EXISTS idx_conversao_job_publicacao ON conversao_job (id_publicacao, id DESC);
@@ -0,0 +1,13 @@
+-- Índice dos arquivos em UPLOAD_FOLDER (exceto avatars): nome gravado -> caminho, tamanho, hash e mtime.
+-- Mantido no upload/reenvio e reconstruído por `python app.py --reindex-uploads`;
+-- substitui a varredura de static/uploads quando o arquivo não está no caminho esperado.
+CREATE TABLE IF NOT EXISTS arquivo_upload (
+    caminho TEXT PRIMARY KEY,              -- relativo a UPLOAD_FOLDER
+    nome_arquivo VARCHAR(255) NOT NULL,    -- mesmo valor de publicacao.nome_arquivo
+    tamanho BIGINT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    mtime TIMESTAMP WITH TIME ZONE NOT NULL,
+    indexado_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_arquivo_upload_nome ON arquivo_upload (nome_arquivo);
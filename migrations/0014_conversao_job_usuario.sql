@@ -0,0 +1,8 @@
+-- Usuário que pediu a conversão: dentro de cada prioridade (preview 10 > download 5 > pré-geração 0)
+-- os workers atendem primeiro o usuário servido há mais tempo, para ninguém monopolizar a fila.
+ALTER TABLE conversao_job
+    ADD COLUMN IF NOT EXISTS id_usuario INTEGER REFERENCES usuario(id_usuario) ON DELETE SET NULL;
+
+-- Último atendimento de cada usuário (ordem do rodízio)
+CREATE INDEX IF NOT EXISTS idx_conversao_job_usuario_inicio
+    ON conversao_job (id_usuario, iniciado_em DESC);
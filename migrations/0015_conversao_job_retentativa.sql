@@ -0,0 +1,4 @@
+-- Falhas transitórias (vagas ou conversores ocupados, LibreOffice reiniciando, banco) não encerram o job:
+-- ele volta a 'pendente' e só pode ser reivindicado de novo a partir de tentar_apos (espera exponencial).
+ALTER TABLE conversao_job
+    ADD COLUMN IF NOT EXISTS tentar_apos TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,19 @@
+-- Fila de admissão compartilhada por todos os processos (CONVERSION_MAX_CONCURRENT): cada conversão que
+-- espera uma vaga registra um bilhete e renova visto_em enquanto espera; só o primeiro da ordem
+-- (prioridade, usuário servido há mais tempo, chegada) disputa as vagas. Bilhetes sem renovação
+-- (processo morto) deixam de contar. Estado efêmero: UNLOGGED.
+CREATE UNLOGGED TABLE IF NOT EXISTS conversao_espera (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    prioridade SMALLINT NOT NULL DEFAULT 0,
+    id_usuario INTEGER,
+    visto_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversao_espera_ordem
+    ON conversao_espera (prioridade DESC, id);
+
+-- Último atendimento de cada usuário (0 = anônimo), para o rodízio entre processos
+CREATE UNLOGGED TABLE IF NOT EXISTS conversao_servido (
+    usuario INTEGER PRIMARY KEY,
+    servido_em TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
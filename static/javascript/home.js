@@ -775,8 +775,40 @@ const AVATAR_KEY = USER_ID ? `avatar_${USER_ID}` : 'avatar_default';
     populateCarousel(filtered);
   }
 
+  // sugestões (type-ahead): consulta leve em /api/autocomplete, com debounce
+  const suggestionsList = document.getElementById('searchSuggestions');
+  let suggestTimer = null;
+  let lastSuggestQuery = '';
+  function loadSuggestions(){
+    if(!suggestionsList || !searchInput) return;
+    const q = searchInput.value.trim();
+    if(q.length < 2 || q === lastSuggestQuery) return;
+    lastSuggestQuery = q;
+    fetch(`/api/autocomplete?q=${encodeURIComponent(q)}`)
+      .then(r => r.ok ? r.json() : null)
+      .then(data => {
+        if(!data || q !== searchInput.value.trim()) return; // resposta atrasada: ignora
+        suggestionsList.innerHTML = '';
+        const seen = new Set();
+        ['titulos','autores','cursos'].forEach(cat => {
+          (data[cat] || []).forEach(s => {
+            if(!s || !s.texto || seen.has(s.texto)) return;
+            seen.add(s.texto);
+            const opt = document.createElement('option');
+            opt.value = s.texto;
+            suggestionsList.appendChild(opt);
+          });
+        });
+      })
+      .catch(() => {});
+  }
+
   // busca: Enter e digitação imediata
   if (searchInput){
+    searchInput.addEventListener('input', () => {
+      clearTimeout(suggestTimer);
+      suggestTimer = setTimeout(loadSuggestions, 150);
+    });
     searchInput.addEventListener('keydown', (e) => { if (e.key === 'Enter') doSearch(); });
     searchInput.addEventListener('input', () => { doSearch(); });
   }
@@ -841,6 +873,61 @@ const AVATAR_KEY = USER_ID ? `avatar_${USER_ID}` : 'avatar_default';
   // inicializa com dados reais
   populateCarousel(DOCS);
 
+  // ranking "Mais baixadas": vem de /api/publicacoes/populares (tabelas agregadas)
+  const popularList = document.getElementById('popularList');
+  const popularPeriod = document.getElementById('popularPeriod');
+
+  function renderPopular(items){
+    if(!popularList) return;
+    popularList.innerHTML = '';
+    if(!items.length){
+      const li = document.createElement('li');
+      li.className = 'empty';
+      li.textContent = 'Nenhum download registrado no período.';
+      popularList.appendChild(li);
+      return;
+    }
+    items.forEach(p => {
+      const doc = {
+        id: p.id,
+        title: p.titulo || 'Sem título',
+        author: p.autor || '',
+        tipo: p.tipo || '',
+        course: p.curso || '',
+        date: p.data || '',
+        url: (p.nome_arquivo ? `/static/uploads/${p.nome_arquivo}` : '')
+      };
+      const li = document.createElement('li');
+      li.tabIndex = 0;
+      const title = document.createElement('div');
+      title.className = 'title';
+      title.textContent = doc.title;
+      const meta = document.createElement('div');
+      meta.className = 'meta-line';
+      const n = Number(p.downloads) || 0;
+      meta.textContent = `${doc.author || '—'} • ${n} download${n === 1 ? '' : 's'}`;
+      li.appendChild(title);
+      li.appendChild(meta);
+      li.addEventListener('click', () => openCardModal(doc));
+      li.addEventListener('keydown', (e) => {
+        if(e.key === 'Enter' || e.key === ' '){ e.preventDefault(); openCardModal(doc); }
+      });
+      popularList.appendChild(li);
+    });
+  }
+
+  function loadPopular(){
+    if(!popularList) return;
+    const periodo = (popularPeriod && popularPeriod.value) || '30d';
+    fetch(`/api/publicacoes/populares?periodo=${encodeURIComponent(periodo)}&limit=10`)
+      .then(r => r.ok ? r.json() : [])
+      .then(data => renderPopular(Array.isArray(data) ? data : []))
+      .catch(() => renderPopular([]));
+  }
+
+  if (popularPeriod) popularPeriod.addEventListener('change', loadPopular);
+  loadPopular();
+
 })();
 
 /* =====================
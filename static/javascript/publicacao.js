@@ -149,17 +149,38 @@
           show(){ wrap.style.display='flex'; bar.value=0; label.textContent='Baixando... 0%'; },
           update(p){ bar.value=p; label.textContent = `Baixando... ${Math.max(0, Math.min(100, Math.round(p)))}%`; },
           done(name){ bar.value=100; label.textContent = name ? `Download concluído: ${name}` : 'Download concluído com sucesso'; /* mantém visível para o usuário */ wrap.style.display='flex'; },
+          wait(){ wrap.style.display='flex'; bar.removeAttribute('value'); label.textContent='Gerando PDF...'; },
           fail(){ label.textContent='Falha no download'; wrap.style.display='flex'; }
         };
       };
 
+      // Conversão em fila (resposta 202): consulta o status até o PDF ficar pronto
+      const sleep = (ms)=> new Promise(r => setTimeout(r, ms));
+      const waitForConversion = async (statusUrl)=>{
+        for(let i = 0; i < 600; i++){
+          await sleep(i < 10 ? 1000 : 2000);
+          const r = await fetch(statusUrl, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } });
+          if(!r.ok) continue;
+          const job = await r.json();
+          if(job.status === 'concluido' || job.status === 'erro') return;
+        }
+        throw new Error('Tempo esgotado aguardando a conversão');
+      };
+
       link.addEventListener('click', async (ev)=>{
         ev.preventDefault();
         const url = link.href;
         let suggested = (link.getAttribute('download') || 'arquivo');
         const progress = ensureProgressUI();
         try {
-          const resp = await fetch(url, { credentials: 'same-origin' });
+          const fetchOpts = { credentials: 'same-origin', headers: { 'Accept': 'application/pdf, application/json' } };
+          let resp = await fetch(url, fetchOpts);
+          while(resp.status === 202){
+            progress.wait();
+            const job = await resp.json();
+            await waitForConversion(job.status_url);
+            resp = await fetch(url, fetchOpts);
+          }
           if(!resp.ok) throw new Error('Falha ao iniciar download');
 
           // Tenta obter nome sugerido do servidor (Content-Disposition)